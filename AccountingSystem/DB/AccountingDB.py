@@ -5,9 +5,10 @@ import datetime, time
 import types
 import threading
 import random
+import atexit
 from DIRAC.Core.Base.DB import DB
 from DIRAC import S_OK, S_ERROR, gMonitor, gConfig
-from DIRAC.Core.Utilities import List, ThreadSafe, Time, DEncode
+from DIRAC.Core.Utilities import List, ThreadSafe, Time, DEncode, ExitCallback
 from DIRAC.AccountingSystem.private.ObjectLoader import loadObjects
 from DIRAC.AccountingSystem.Client.Types.BaseAccountingType import BaseAccountingType
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
@@ -27,6 +28,8 @@ class AccountingDB( DB ):
     self.__deadLockRetries = 2
     self.__queuedRecordsLock = ThreadSafe.Synchronizer()
     self.__queuedRecordsToInsert = []
+    self.__bucketsBuffer = {}
+    self.__bucketsBufferLock = threading.Lock()
     self.dbCatalog = {}
     self.dbBucketsLength = {}
     self.__keysCache = {}
@@ -71,6 +74,17 @@ class AccountingDB( DB ):
 
     self.__registerTypes()
 
+    #Merge the bucket updates in memory and write them every window seconds
+    self.__bucketsAggregationWindow = self.getCSOption( "BucketsAggregationWindow", 0 )
+    self.__maxBucketsPerInsert = self.getCSOption( "MaxBucketsPerInsert", 500 )
+    if self.__bucketsAggregationWindow > 0 and not self.__readOnly:
+      th = threading.Thread( target = self.__periodicFlushBuckets )
+      th.setDaemon( 1 )
+      th.start()
+      #Write what is left in the buffer when the process ends
+      atexit.register( self.__flushBucketsAtExit )
+      ExitCallback.registerExitCallback( self.__flushBucketsAtExit )
+
   def __loadTablesCreated( self ):
     result = self._query( "show tables" )
     if not result[ 'OK' ]:
@@ -660,7 +674,8 @@ class AccountingDB( DB ):
       retVal = self.__startTransaction( connObj )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj = connObj )
+      retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj = connObj,
+                                      aggregate = True )
       if not retVal[ 'OK' ]:
         self.__rollbackTransaction( connObj )
         return retVal
@@ -677,6 +692,10 @@ class AccountingDB( DB ):
     self.log.info( "Deleting record record", "for type %s\n [%s -> %s]" % ( typeName, Time.fromEpoch( startTime ), Time.fromEpoch( endTime ) ) )
     if not typeName in self.dbCatalog:
       return S_ERROR( "Type %s has not been defined in the db" % typeName )
+    #The buckets have to contain the record before extracting it
+    retVal = self.flushBuckets()
+    if not retVal[ 'OK' ]:
+      return retVal
     sqlValues = []
     sqlValues.extend( valuesList )
     #Discover key indexes
@@ -735,9 +754,10 @@ class AccountingDB( DB ):
       return retVal
     return S_OK( numInsertions )
 
-  def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False ):
+  def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False, aggregate = False ):
     """
     Bucketize a record
+    If aggregate is requested and enabled, the buckets are merged in the buffer instead of written
     """
     #Calculate amount of buckets
     buckets = self.calculateBuckets( typeName, startTime, endTime )
@@ -745,6 +765,12 @@ class AccountingDB( DB ):
     numKeys = len( self.dbCatalog[ typeName ][ 'keys' ] )
     keyValues = valuesList[ :numKeys ]
     valuesList = valuesList[ numKeys: ]
+    if aggregate and self.__bucketsAggregationWindow > 0:
+      self.log.verbose( "Buffering entry", " in %s buckets" % len( buckets ) )
+      self.__bufferBuckets( typeName, [ ( bucketInfo[0], bucketInfo[2], keyValues,
+                                          [ float( value ) * bucketInfo[1] for value in valuesList ] )
+                                        for bucketInfo in buckets ] )
+      return S_OK()
     self.log.verbose( "Splitting entry", " in %s buckets" % len( buckets ) )
     for bucketInfo in buckets:
       bucketStartTime = bucketInfo[0]
@@ -786,6 +812,121 @@ class AccountingDB( DB ):
             break
     return S_OK()
 
+  def __bufferBuckets( self, typeName, bucketsData ):
+    """
+    Merge bucket contributions in the buffer. bucketsData is a list of
+    ( startTime, bucketLength, keyValues, bucketValues ) with the proportion already applied
+    """
+    self.__bucketsBufferLock.acquire()
+    try:
+      for startTime, bucketLength, keyValues, bucketValues in bucketsData:
+        bKey = ( typeName, startTime, bucketLength, tuple( keyValues ) )
+        if bKey not in self.__bucketsBuffer:
+          self.__bucketsBuffer[ bKey ] = list( bucketValues )
+          continue
+        bufferedValues = self.__bucketsBuffer[ bKey ]
+        for pos in range( len( bucketValues ) ):
+          bufferedValues[ pos ] += bucketValues[ pos ]
+    finally:
+      self.__bucketsBufferLock.release()
+
+  def __discardBufferedBuckets( self, typeName ):
+    """
+    Drop the buffered buckets of a type
+    """
+    self.__bucketsBufferLock.acquire()
+    try:
+      for bKey in [ bKey for bKey in self.__bucketsBuffer if bKey[0] == typeName ]:
+        self.__bucketsBuffer.pop( bKey )
+    finally:
+      self.__bucketsBufferLock.release()
+
+  def __periodicFlushBuckets( self ):
+    while True:
+      time.sleep( self.__bucketsAggregationWindow )
+      try:
+        result = self.flushBuckets()
+        if not result[ 'OK' ]:
+          self.log.error( "Could not flush the buffered buckets", result[ 'Message' ] )
+      except Exception:
+        self.log.exception( "Exception while flushing the buffered buckets" )
+
+  def __flushBucketsAtExit( self, exitCode = 0 ):
+    result = self.flushBuckets()
+    if not result[ 'OK' ]:
+      self.log.error( "Could not flush the buffered buckets at exit", result[ 'Message' ] )
+
+  def flushBuckets( self ):
+    """
+    Write all the buffered buckets to the DB with multi-row upserts
+    Buckets that could not be written are kept in the buffer
+    """
+    self.__bucketsBufferLock.acquire()
+    try:
+      buffered = self.__bucketsBuffer
+      self.__bucketsBuffer = {}
+    finally:
+      self.__bucketsBufferLock.release()
+    if not buffered:
+      return S_OK( 0 )
+    typeKeys = {}
+    for bKey in buffered:
+      if bKey[0] not in typeKeys:
+        typeKeys[ bKey[0] ] = []
+      typeKeys[ bKey[0] ].append( bKey )
+    failed = []
+    result = S_OK( len( buffered ) )
+    for typeName in typeKeys:
+      if typeName not in self.dbCatalog:
+        continue
+      #Always write in the same order to avoid dead locks between concurrent writers
+      bKeys = sorted( typeKeys[ typeName ] )
+      for iP in range( 0, len( bKeys ), self.__maxBucketsPerInsert ):
+        retVal = self.__writeBuckets( typeName, [ ( bKey[1], bKey[2], bKey[3], buffered[ bKey ] )
+                                                  for bKey in bKeys[ iP : iP + self.__maxBucketsPerInsert ] ] )
+        if not retVal[ 'OK' ]:
+          failed.extend( bKeys[ iP: ] )
+          result = retVal
+          break
+    if failed:
+      for bKey in failed:
+        self.__bufferBuckets( bKey[0], [ ( bKey[1], bKey[2], bKey[3], buffered[ bKey ] ) ] )
+    self.log.verbose( "Flushed buffered buckets", "%s written, %s kept" % ( len( buffered ) - len( failed ), len( failed ) ) )
+    return result
+
+  def __writeBuckets( self, typeName, bucketsData ):
+    """
+    Insert or update several buckets in one go
+    bucketsData is a list of ( startTime, bucketLength, keyValues, bucketValues )
+    """
+    tableName = _getTableName( "bucket", typeName )
+    valueFields = [ "`%s`" % valueField for valueField in self.dbCatalog[ typeName ][ 'values' ] ]
+    valueFields.append( '`entriesInBucket`' )
+    sqlFields = [ '`startTime`', '`bucketLength`' ]
+    sqlFields.extend( [ "`%s`" % keyField for keyField in self.dbCatalog[ typeName ][ 'keys' ] ] )
+    sqlFields.extend( valueFields )
+    sqlUpData = [ "%s=%s+VALUES(%s)" % ( valueField, valueField, valueField ) for valueField in valueFields ]
+    sqlRows = []
+    for startTime, bucketLength, keyValues, bucketValues in bucketsData:
+      sqlValues = [ str( startTime ), str( bucketLength ) ]
+      sqlValues.extend( [ str( keyValue ) for keyValue in keyValues ] )
+      sqlValues.extend( [ repr( value ) for value in bucketValues ] )
+      sqlRows.append( "( %s )" % ", ".join( sqlValues ) )
+
+    cmd = "INSERT INTO `%s` ( %s ) " % ( tableName, ", ".join( sqlFields ) )
+    cmd += "VALUES %s " % ", ".join( sqlRows )
+    cmd += "ON DUPLICATE KEY UPDATE %s" % ", ".join( sqlUpData )
+
+    for i in range( max( 1, self.__deadLockRetries ) ):
+      result = self._update( cmd )
+      if result[ 'OK' ]:
+        return result
+      #If failed because of dead lock try restarting
+      if result[ 'Message' ].find( "try restarting transaction" ) == -1:
+        return result
+
+    return S_ERROR( "Cannot update buckets: %s" % result[ 'Message' ] )
+
   def __deleteFromBuckets( self, typeName, startTime, endTime, valuesList, numInsertions, connObj = False ):
     """
     DeBucketize a record
@@ -1148,6 +1289,10 @@ class AccountingDB( DB ):
       self.__doingCompaction = True
     finally:
       gSynchro.unlock()
+    #Compaction has to see all the buckets
+    result = self.flushBuckets()
+    if not result[ 'OK' ]:
+      self.log.error( "[COMPACT] Could not flush the buffered buckets", result[ 'Message' ] )
     slow = True
     for typeName in self.dbCatalog:
       if typeFilter and typeName.find( typeFilter ) == -1:
@@ -1396,6 +1541,8 @@ class AccountingDB( DB ):
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
+    #The buckets are rebuilt from the raw records, which already contain the buffered ones
+    self.__discardBufferedBuckets( typeName )
     #Delete old entries if any
     if self.dbCatalog[ typeName ][ 'dataTimespan' ] > 0:
       self.log.info( "[REBUCKET] Deleting records older that timespan for type %s" % typeName )
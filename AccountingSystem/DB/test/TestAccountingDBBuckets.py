@@ -0,0 +1,83 @@
+""" Unit tests of the buffered bucket updates of the AccountingDB, the MySQL calls are
+    recorded by FakeMySQL
+"""
+
+import threading
+import unittest
+
+from DIRAC.AccountingSystem.DB.AccountingDB import AccountingDB
+from DIRAC.Core.Base.test.FakeMySQL import FakeMySQL
+
+class FakeAccountingDB( FakeMySQL, AccountingDB ):
+  """ AccountingDB with the attributes used by the bucket buffer only, does not connect to MySQL
+  """
+
+  def __init__( self, failOn = None, maxBucketsPerInsert = 500 ):
+    FakeMySQL.__init__( self, failOn = failOn )
+    self.dbCatalog = { 'Job' : { 'keys' : [ 'User', 'Site' ], 'values' : [ 'CPUTime', 'Jobs' ] } }
+    self._AccountingDB__bucketsBuffer = {}
+    self._AccountingDB__bucketsBufferLock = threading.Lock()
+    self._AccountingDB__maxBucketsPerInsert = maxBucketsPerInsert
+    self._AccountingDB__deadLockRetries = 2
+
+  def bufferBuckets( self, typeName, bucketsData ):
+    self._AccountingDB__bufferBuckets( typeName, bucketsData )
+
+  def getBuffer( self ):
+    return self._AccountingDB__bucketsBuffer
+
+class BucketsBufferCase( unittest.TestCase ):
+
+  def test_merge( self ):
+    """ the contributions to the same bucket are added, the other buckets are kept apart """
+    accDB = FakeAccountingDB()
+    accDB.bufferBuckets( 'Job', [ ( 3600, 3600, [ 1, 2 ], [ 10.0, 1.0, 0.5 ] ),
+                                  ( 7200, 3600, [ 1, 2 ], [ 20.0, 1.0, 0.5 ] ) ] )
+    accDB.bufferBuckets( 'Job', [ ( 3600, 3600, [ 1, 2 ], [ 5.0, 1.0, 0.5 ] ),
+                                  ( 3600, 3600, [ 1, 3 ], [ 1.0, 1.0, 1.0 ] ) ] )
+    self.assertEqual( accDB.getBuffer(), { ( 'Job', 3600, 3600, ( 1, 2 ) ) : [ 15.0, 2.0, 1.0 ],
+                                           ( 'Job', 7200, 3600, ( 1, 2 ) ) : [ 20.0, 1.0, 0.5 ],
+                                           ( 'Job', 3600, 3600, ( 1, 3 ) ) : [ 1.0, 1.0, 1.0 ] } )
+    self.assertEqual( accDB.calls, [] )
+
+  def test_upsert( self ):
+    """ the buffered buckets are written with one multi-row upsert in key order """
+    accDB = FakeAccountingDB()
+    accDB.bufferBuckets( 'Job', [ ( 7200, 3600, [ 1, 2 ], [ 20.0, 1.0, 0.5 ] ),
+                                  ( 3600, 3600, [ 1, 2 ], [ 10.0, 1.0, 0.5 ] ) ] )
+    result = accDB.flushBuckets()
+    self.assert_( result['OK'] )
+    self.assertEqual( result['Value'], 2 )
+    self.assertEqual( accDB.getCalls( 'update' ),
+                      [ "INSERT INTO `ac_bucket_Job` ( `startTime`, `bucketLength`, `User`, `Site`, `CPUTime`, `Jobs`, "
+                        "`entriesInBucket` ) VALUES ( 3600, 3600, 1, 2, 10.0, 1.0, 0.5 ), ( 7200, 3600, 1, 2, 20.0, 1.0, 0.5 ) "
+                        "ON DUPLICATE KEY UPDATE `CPUTime`=`CPUTime`+VALUES(`CPUTime`), `Jobs`=`Jobs`+VALUES(`Jobs`), "
+                        "`entriesInBucket`=`entriesInBucket`+VALUES(`entriesInBucket`)" ] )
+    self.assertEqual( accDB.getBuffer(), {} )
+
+  def test_failedWrite( self ):
+    """ the buckets of a failed write and the following ones are buffered again and merged """
+    accDB = FakeAccountingDB( failOn = [ '( 7200, 3600' ], maxBucketsPerInsert = 1 )
+    accDB.bufferBuckets( 'Job', [ ( startTime, 3600, [ 1, 2 ], [ 1.0, 1.0, 1.0 ] ) for startTime in ( 3600, 7200, 10800 ) ] )
+    result = accDB.flushBuckets()
+    self.assertFalse( result['OK'] )
+    self.assertEqual( len( accDB.getCalls( 'update' ) ), 2 )
+    self.assertEqual( sorted( accDB.getBuffer() ), [ ( 'Job', 7200, 3600, ( 1, 2 ) ), ( 'Job', 10800, 3600, ( 1, 2 ) ) ] )
+    accDB.bufferBuckets( 'Job', [ ( 7200, 3600, [ 1, 2 ], [ 1.0, 1.0, 1.0 ] ) ] )
+    self.assertEqual( accDB.getBuffer()[ ( 'Job', 7200, 3600, ( 1, 2 ) ) ], [ 2.0, 2.0, 2.0 ] )
+    accDB.failOn = []
+    result = accDB.flushBuckets()
+    self.assert_( result['OK'] )
+    self.assertEqual( accDB.getBuffer(), {} )
+
+  def test_flushAtExit( self ):
+    """ the buckets left in the buffer are written at exit """
+    accDB = FakeAccountingDB()
+    accDB.bufferBuckets( 'Job', [ ( 3600, 3600, [ 1, 2 ], [ 1.0, 1.0, 1.0 ] ) ] )
+    accDB._AccountingDB__flushBucketsAtExit( 0 )
+    self.assertEqual( len( accDB.getCalls( 'update' ) ), 1 )
+    self.assertEqual( accDB.getBuffer(), {} )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( BucketsBufferCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
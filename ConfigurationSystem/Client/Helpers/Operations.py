@@ -7,9 +7,12 @@ from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationDat
 
 class Operations( object ):
 
+  #( vo, setup ) -> ( merged CFG of the search paths, ( option path, default value ) -> typed value )
   __cache = {}
   __cacheVersion = 0
   __cacheLock = LockRing.LockRing().getLock()
+  __valuesCacheHits = 0
+  __valuesCacheMisses = 0
 
   def __init__( self, vo = False, group = False, setup = False ):
     self.__uVO = vo
@@ -38,14 +41,24 @@ class Operations( object ):
       self.__setup = CSGlobals.getSetup()
 
   def __getCache( self ):
+    return self.__getCacheEntry()[0]
+
+  def __getCacheEntry( self ):
+    #Lock free when the configuration has not changed and the merged CFG is already there
+    cacheKey = ( self.__vo, self.__setup )
+    if gConfigurationData.mergedCFG is Operations.__cacheVersion:
+      try:
+        return Operations.__cache[ cacheKey ]
+      except KeyError:
+        pass
     Operations.__cacheLock.acquire()
     try:
-      currentVersion = gConfigurationData.getVersion()
-      if currentVersion != Operations.__cacheVersion:
+      #The configuration data builds a new merged CFG each time it changes
+      currentVersion = gConfigurationData.mergedCFG
+      if currentVersion is not Operations.__cacheVersion:
         Operations.__cache = {}
         Operations.__cacheVersion = currentVersion
 
-      cacheKey = ( self.__vo, self.__setup )
       if cacheKey in Operations.__cache:
         return Operations.__cache[ cacheKey ]
 
@@ -56,7 +69,7 @@ class Operations( object ):
         if pathCFG:
           mergedCFG = mergedCFG.mergeWith( pathCFG )
 
-      Operations.__cache[ cacheKey ] = mergedCFG
+      Operations.__cache[ cacheKey ] = ( mergedCFG, {} )
 
       return Operations.__cache[ cacheKey ]
     finally:
@@ -95,7 +108,36 @@ class Operations( object ):
     return paths
 
   def getValue( self, optionPath, defaultValue = None ):
-    return self.__getCache().getOption( optionPath, defaultValue )
+    defaultKey = defaultValue
+    if type( defaultValue ) == types.ListType:
+      defaultKey = ( types.ListType, tuple( defaultValue ) )
+    try:
+      valueKey = ( optionPath, type( defaultValue ), defaultKey )
+      hash( valueKey )
+    except TypeError:
+      return self.__getCache().getOption( optionPath, defaultValue )
+    cacheCFG, valuesCache = self.__getCacheEntry()
+    try:
+      value = valuesCache[ valueKey ]
+      Operations.__valuesCacheHits += 1
+    except KeyError:
+      Operations.__valuesCacheMisses += 1
+      value = cacheCFG.getOption( optionPath, defaultValue )
+      valuesCache[ valueKey ] = value
+    if type( value ) == types.ListType:
+      return list( value )
+    return value
+
+  def getCacheStats( self ):
+    """ Hits and misses of the cache of option values
+    """
+    hits = Operations.__valuesCacheHits
+    misses = Operations.__valuesCacheMisses
+    hitRate = 0.0
+    if hits + misses:
+      hitRate = float( hits ) / ( hits + misses )
+    return S_OK( { 'Hits' : hits, 'Misses' : misses, 'HitRate' : hitRate,
+                   'Size' : sum( [ len( entry[1] ) for entry in Operations.__cache.values() ] ) } )
 
   def __getCFG( self, sectionPath ):
     cacheCFG = self.__getCache()
@@ -2,21 +2,73 @@
 __RCSID__ = "$Id$"
 
 import types
+import threading
 from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.Utilities import List
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
+from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
+from DIRAC.ConfigurationSystem.private.Refresher import gRefresher
 from DIRAC.ConfigurationSystem.Client.Helpers.CSGlobals import getVO
 
 gBaseSecuritySection = "/Registry"
 
+#Reverse lookups of the Registry section. The configuration data builds a new merged CFG
+#each time it changes ( new CS version, local modification ), the index is rebuilt for it
+gRegistryIndex = { 'CFG' : None }
+gRegistryIndexLock = threading.Lock()
+
+def __buildIndex( cfg ):
+  def getList( path ):
+    value = gConfigurationData.extractOptionFromCFG( path, cfg )
+    if not value:
+      return []
+    return List.fromChar( value, "," )
+
+  def getSections( path ):
+    return gConfigurationData.getSectionsFromCFG( path, cfg, ordered = True ) or []
+
+  index = { 'CFG' : cfg, 'UserForDN' : {}, 'HostForDN' : {}, 'Groups' : {} }
+  #Keep the first match in the section order as the sequential lookups did
+  for username in getSections( "%s/Users" % gBaseSecuritySection ):
+    for dn in getList( "%s/Users/%s/DN" % ( gBaseSecuritySection, username ) ):
+      index[ 'UserForDN' ].setdefault( dn, username )
+  for hostname in getSections( "%s/Hosts" % gBaseSecuritySection ):
+    for dn in getList( "%s/Hosts/%s/DN" % ( gBaseSecuritySection, hostname ) ):
+      index[ 'HostForDN' ].setdefault( dn, hostname )
+  #attribute -> value -> sorted groups
+  for attrName in ( 'Users', 'VO', 'Properties' ):
+    groupsForValue = {}
+    for group in getSections( "%s/Groups" % gBaseSecuritySection ):
+      for value in getList( "%s/Groups/%s/%s" % ( gBaseSecuritySection, group, attrName ) ):
+        groupsForValue.setdefault( value, set() ).add( group )
+    index[ 'Groups' ][ attrName ] = dict( [ ( value, sorted( groups ) ) for value, groups in groupsForValue.items() ] )
+  return index
+
+def __getIndex():
+  global gRegistryIndex
+  gRefresher.refreshConfigurationIfNeeded()
+  cfg = gConfigurationData.mergedCFG
+  index = gRegistryIndex
+  if index[ 'CFG' ] is cfg:
+    return index
+  gRegistryIndexLock.acquire()
+  try:
+    if gRegistryIndex[ 'CFG' ] is not cfg:
+      #Swap the whole index at once, concurrent lookups keep using the previous one
+      gRegistryIndex = __buildIndex( cfg )
+    return gRegistryIndex
+  finally:
+    gRegistryIndexLock.release()
+
 def getUsernameForDN( dn, usersList = False ):
-  if not usersList:
-    retVal = gConfig.getSections( "%s/Users" % gBaseSecuritySection )
-    if not retVal[ 'OK' ]:
-      return retVal
-    usersList = retVal[ 'Value' ]
-  for username in usersList:
-    if dn in gConfig.getValue( "%s/Users/%s/DN" % ( gBaseSecuritySection, username ), [] ):
-      return S_OK( username )
+  username = __getIndex()[ 'UserForDN' ].get( dn )
+  if username and ( not usersList or username in usersList ):
+    return S_OK( username )
+  if usersList:
+    #The first user owning the DN is not in the list, look for another one
+    for username in usersList:
+      if dn in gConfig.getValue( "%s/Users/%s/DN" % ( gBaseSecuritySection, username ), [] ):
+        return S_OK( username )
   return S_ERROR( "No username found for dn %s" % dn )
 
 def getDNForUsername( username ):
@@ -32,18 +84,10 @@ def getGroupsForDN( dn ):
   return getGroupsForUser( retVal[ 'Value' ] )
 
 def __getGroupsWithAttr( attrName, value ):
-  retVal = gConfig.getSections( "%s/Groups" % gBaseSecuritySection )
-  if not retVal[ 'OK' ]:
-    return retVal
-  groupsList = retVal[ 'Value' ]
-  groups = []
-  for group in groupsList:
-    if value in gConfig.getValue( "%s/Groups/%s/%s" % ( gBaseSecuritySection, group, attrName ), [] ):
-      groups.append( group )
+  groups = __getIndex()[ 'Groups' ][ attrName ].get( value )
   if not groups:
     return S_ERROR( "No groups found for %s=%s" % ( attrName,value ) )
-  groups.sort()
-  return S_OK( groups )
+  return S_OK( list( groups ) )
 
 def getGroupsForUser( username ):
   return __getGroupsWithAttr( 'Users', username )
@@ -57,13 +101,9 @@ def getGroupsWithProperty( propName ):
   return __getGroupsWithAttr( "Properties", propName )
 
 def getHostnameForDN( dn ):
-  retVal = gConfig.getSections( "%s/Hosts" % gBaseSecuritySection )
-  if not retVal[ 'OK' ]:
-    return retVal
-  hostList = retVal[ 'Value' ]
-  for hostname in hostList:
-    if dn in gConfig.getValue( "%s/Hosts/%s/DN" % ( gBaseSecuritySection, hostname ), [] ):
-      return S_OK( hostname )
+  hostname = __getIndex()[ 'HostForDN' ].get( dn )
+  if hostname:
+    return S_OK( hostname )
   return S_ERROR( "No hostname found for dn %s" % dn )
 
 def getDefaultUserGroup():
@@ -28,6 +28,8 @@ class ConfigurationData:
     self.localCFG = CFG()
     self.remoteCFG = CFG()
     self.mergedCFG = CFG()
+    #Flattened options of the merged CFG, path -> value
+    self.mergedOptions = {}
     self.remoteServerList = []
     if loadDefaultCFG:
       defaultCFGFile = os.path.join( DIRAC.rootPath, "etc", "dirac.cfg" )
@@ -37,12 +39,25 @@ class ConfigurationData:
         gLogger.warn( "Can't load %s file" % defaultCFGFile )
     self.sync()
 
+  def __flattenCFG( self, cfg, path, options ):
+    for key in cfg.listAll():
+      value = cfg[ key ]
+      if isinstance( value, CFG ):
+        self.__flattenCFG( value, "%s/%s" % ( path, key ), options )
+      else:
+        options[ "%s/%s" % ( path, key ) ] = value
+
   def getBackupDir( self ):
     return self.backupsDir
 
   def sync( self ):
     gLogger.debug( "Updating configuration internals" )
-    self.mergedCFG = self.remoteCFG.mergeWith( self.localCFG )
+    mergedCFG = self.remoteCFG.mergeWith( self.localCFG )
+    mergedOptions = {}
+    self.__flattenCFG( mergedCFG, "", mergedOptions )
+    #Readers use either the previous or the new options, never a partially built dict
+    self.mergedCFG = mergedCFG
+    self.mergedOptions = mergedOptions
     self.remoteServerList = []
     localServers = self.extractOptionFromCFG( "%s/Servers" % self.configurationPath,
                                         self.localCFG,
@@ -144,7 +159,13 @@ class ConfigurationData:
 
   def extractOptionFromCFG( self, path, cfg = False, disableDangerZones = False ):
     if not cfg:
-      cfg = self.mergedCFG
+      #The merged configuration is read from its flattened options without locking
+      mergedOptions = self.mergedOptions
+      try:
+        return mergedOptions[ path ]
+      except KeyError:
+        levelList = [ level.strip() for level in path.split( "/" ) if level.strip() != "" ]
+        return mergedOptions.get( "/%s" % "/".join( levelList ) )
     if not disableDangerZones:
       self.dangerZoneStart()
     try:
@@ -10,7 +10,7 @@ __RCSID__ = "$Id$"
 
 import sys, types, socket
 from DIRAC                           import gLogger, gConfig, S_OK
-from DIRAC.Core.Utilities.MySQL      import MySQL
+from DIRAC.Core.Utilities.MySQL      import MySQL, PINGIDLETIME
 from DIRAC.ConfigurationSystem.Client.PathFinder import getDatabaseSection
 
 
@@ -73,8 +73,13 @@ class DB( MySQL ):
     if result['OK']:
       self.maxQueueSize = int( result['Value'] )
 
+    # Connections idle for less than this are used without checking them with a ping
+    self.pingIdleTime = gConfig.getValue( '/Systems/Databases/PingIdleTime', PINGIDLETIME )
+    self.pingIdleTime = gConfig.getValue( self.cs_path + '/PingIdleTime', self.pingIdleTime )
+
     MySQL.__init__( self, self.dbHost, self.dbUser, self.dbPass,
-                   self.dbName, self.dbPort, maxQueueSize = maxQueueSize, debug = debug )
+                   self.dbName, self.dbPort, maxQueueSize = maxQueueSize, debug = debug,
+                   pingIdleTime = self.pingIdleTime )
 
     if not self._connected:
       raise RuntimeError( 'Can not connect to DB %s, exiting...' % self.dbName )
@@ -0,0 +1,100 @@
+########################################################################
+# $HeadURL $
+# File: FakeMySQL.py
+########################################################################
+""" :mod: FakeMySQL
+    ===============
+
+    .. module: FakeMySQL
+    :synopsis: in memory stand-in for the MySQL methods of the DB classes
+
+    Mix it in before the DB class to unit test its methods without a server::
+
+      class FakeJobDB( FakeMySQL, JobDB ):
+        pass
+
+      jobDB = FakeJobDB()
+
+    The statements and the transaction calls are recorded in the calls list in the
+    order they are made, as ( 'update', cmd, args ), ( 'query', cmd, args ), ( 'start', cmd, None ),
+    ( 'commit', cmd, None ) and ( 'rollback', cmd, None ). The statements containing one of
+    the failOn strings return S_ERROR.
+"""
+__RCSID__ = "$Id$"
+
+from DIRAC import gLogger, S_OK, S_ERROR
+
+class FakeMySQL:
+  """ MySQL methods recording the statements instead of executing them
+  """
+
+  def __init__( self, failOn = None, queryResults = None, lastRowId = 1 ):
+    """ c'tor
+
+    :param list failOn: strings making a statement fail when it contains one of them
+    :param queryResults: callable giving the rows of a query statement
+    :param int lastRowId: ID of the first row inserted by the next statement
+    """
+    self.log = gLogger
+    self.calls = []
+    self.failOn = failOn if failOn else []
+    self.queryResults = queryResults if queryResults else lambda cmd: ()
+    self.lastRowId = lastRowId
+
+  def __execute( self, callType, cmd, args = None ):
+    self.calls.append( ( callType, cmd, args ) )
+    for pattern in self.failOn:
+      if pattern in cmd:
+        return S_ERROR( "Failed %s" % cmd )
+    return S_OK()
+
+  def getCalls( self, callType = None ):
+    """ statements of the calls of the given type, the call types if no type is given """
+    if callType is None:
+      return [ recordedType for recordedType, _cmd, _args in self.calls ]
+    return [ cmd for recordedType, cmd, _args in self.calls if recordedType == callType ]
+
+  def getArgs( self, callType ):
+    """ arguments of the statements of the calls of the given type """
+    return [ args for recordedType, _cmd, args in self.calls if recordedType == callType ]
+
+  def _getConnection( self ):
+    return S_OK( 'connection' )
+
+  def _escapeString( self, myString, conn = None ):
+    return S_OK( "'%s'" % str( myString ).replace( "\\", "\\\\" ).replace( "'", "\\'" ) )
+
+  def _escapeValues( self, inValues = None ):
+    return S_OK( [ self._escapeString( value )['Value'] for value in ( inValues or [] ) ] )
+
+  def _query( self, cmd, conn = None, debug = False, args = None ):
+    result = self.__execute( 'query', cmd, args )
+    if not result['OK']:
+      return result
+    return S_OK( self.queryResults( cmd ) )
+
+  def _update( self, cmd, conn = None, debug = False, args = None ):
+    result = self.__execute( 'update', cmd, args )
+    if not result['OK']:
+      return result
+    result = S_OK( 1 )
+    result['lastRowId'] = self.lastRowId
+    return result
+
+  def _transaction( self, cmdList, conn = None ):
+    cmdRet = []
+    for cmd in cmdList:
+      result = self.__execute( 'update', cmd )
+      if not result['OK']:
+        return result
+      cmdRet.append( ( cmd, 1 ) )
+    return S_OK( cmdRet )
+
+  def transactionStart( self ):
+    return self.__execute( 'start', 'START TRANSACTION' )
+
+  def transactionCommit( self ):
+    return self.__execute( 'commit', 'COMMIT' )
+
+  def transactionRollback( self ):
+    return self.__execute( 'rollback', 'ROLLBACK' )
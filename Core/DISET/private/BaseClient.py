@@ -3,6 +3,10 @@ __RCSID__ = "$Id$"
 
 import types
 import thread
+try:
+  from hashlib import md5
+except:
+  from md5 import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -31,6 +35,7 @@ class BaseClient:
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_PERSISTENT_CONNECTION = "persistentConnection"
 
   __threadConfig = ThreadConfig()
 
@@ -48,7 +53,8 @@ class BaseClient:
     for initFunc in ( self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                       self.__discoverURL, self.__discoverCredentialsToUse,
                       self.__checkTransportSanity,
-                      self.__setKeepAliveLapse ):
+                      self.__setKeepAliveLapse,
+                      self.__discoverPersistentConnection ):
       result = initFunc()
       if not result[ 'OK' ] and self.__initStatus[ 'OK' ]:
         self.__initStatus = result
@@ -233,15 +239,24 @@ and this is thread %s
   def _disconnect( self, trid ):
     getGlobalTransportPool().close( trid )
 
-  def _proposeAction( self, transport, action ):
+  def _proposeAction( self, transport, action, keepConnection = False ):
+    retVal = self._sendProposal( transport, action, keepConnection )
+    if not retVal[ 'OK' ]:
+      return retVal
+    return self._receiveProposalResponse( transport )
+
+  def _sendProposal( self, transport, action, keepConnection = False ):
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     stConnectionInfo = ( ( self.__URLTuple[3], self.setup, self.vo ),
                          action,
                          self.__extraCredentials )
-    retVal = transport.sendData( S_OK( stConnectionInfo ) )
-    if not retVal[ 'OK' ]:
-      return retVal
+    if keepConnection:
+      #Older servers just ignore the extra field and close the connection as usual
+      stConnectionInfo += ( { 'keepConnection' : True }, )
+    return transport.sendData( S_OK( stConnectionInfo ) )
+
+  def _receiveProposalResponse( self, transport ):
     serverReturn = transport.receiveData()
     #TODO: Check if delegation is required
     if serverReturn[ 'OK' ] and 'Value' in serverReturn and type( serverReturn[ 'Value' ] ) == types.DictType:
@@ -284,6 +299,64 @@ and this is thread %s
     self.kwargs[ self.KW_KEEP_ALIVE_LAPSE ] = kaa
     return S_OK()
 
+  def __discoverPersistentConnection( self ):
+    #Keep the connection open after the RPC to reuse it?
+    if self.KW_PERSISTENT_CONNECTION in self.kwargs:
+      self.__persistentConnection = self.kwargs[ self.KW_PERSISTENT_CONNECTION ]
+    else:
+      self.__persistentConnection = gConfig.getValue( "/DIRAC/PersistentConnections/Enabled", False )
+    self.__persistentMaxIdleTime = gConfig.getValue( "/DIRAC/PersistentConnections/MaxIdleTime", 60 )
+    self.__persistentMaxLifeTime = gConfig.getValue( "/DIRAC/PersistentConnections/MaxLifeTime", 600 )
+    self.__persistentMaxPerHost = gConfig.getValue( "/DIRAC/PersistentConnections/MaxPerHost", 10 )
+    return S_OK()
+
+  def _usePersistentConnection( self ):
+    return self.__persistentConnection
+
+  def __getPersistentPoolKey( self ):
+    #Connections can only be shared between clients going to the same URL with the same credentials
+    proxyString = self.kwargs.get( self.KW_PROXY_STRING, "" )
+    if proxyString:
+      proxyString = md5( proxyString ).hexdigest()
+    return ( self.__URLTuple[1], self.serviceURL, self.useCertificates,
+             self.kwargs.get( self.KW_PROXY_LOCATION, "" ), proxyString,
+             self.kwargs.get( self.KW_SKIP_CA_CHECK, False ), str( self.__extraCredentials ),
+             self.timeout )
+
+  def _checkOutTransport( self ):
+    """
+    Get a transport to talk to the service. If persistent connections are enabled an idle
+    connection to the same service with the same credentials is reused when available.
+
+    @return: S_OK( ( trid, transport, reused ) ) / S_ERROR
+    """
+    if self.__persistentConnection:
+      self.__discoverExtraCredentials()
+      if not self.__initStatus[ 'OK' ]:
+        return self.__initStatus
+      idleTuple = getGlobalTransportPool().checkOut( self.__getPersistentPoolKey() )
+      if idleTuple:
+        gLogger.debug( "Reusing connection to: %s" % self.serviceURL )
+        return S_OK( ( idleTuple[0], idleTuple[1], True ) )
+    retVal = self._connect()
+    if not retVal[ 'OK' ]:
+      return retVal
+    trid, transport = retVal[ 'Value' ]
+    return S_OK( ( trid, transport, False ) )
+
+  def _checkInTransport( self, trid, keepConnection ):
+    """
+    Release a transport obtained from _checkOutTransport. It's kept open for later reuse
+    only if the server agreed to keep it and persistent connections are enabled.
+    """
+    if not keepConnection or not self.__persistentConnection:
+      self._disconnect( trid )
+      return
+    getGlobalTransportPool().checkIn( trid, self.__getPersistentPoolKey(),
+                                      maxIdleTime = self.__persistentMaxIdleTime,
+                                      maxPerHost = self.__persistentMaxPerHost,
+                                      maxLifeTime = self.__persistentMaxLifeTime )
+
   def _getBaseStub( self ):
     newKwargs = dict( self.kwargs )
     #Set DN
@@ -10,23 +10,62 @@ class InnerRPCClient( BaseClient ):
 
   def executeRPC( self, functionName, args ):
     stub = ( self._getBaseStub(), functionName, args )
-    retVal = self._connect()
+    retVal = self._checkOutTransport()
     if not retVal[ 'OK' ]:
       retVal[ 'rpcStub' ] = stub
       return retVal
-    trid, transport = retVal[ 'Value' ]
-    try:
-      retVal = self._proposeAction( transport, ( "RPC", functionName ) )
+    trid, transport, reused = retVal[ 'Value' ]
+    if reused:
+      receivedData, accepted = self.__executeOnReusedTransport( trid, transport, functionName, args )
+      if accepted:
+        if type( receivedData ) == types.DictType:
+          receivedData[ 'rpcStub' ] = stub
+        return receivedData
+      #The server didn't accept the proposal (most likely it dropped the idle connection), so nothing
+      #has been executed and it's safe to retry with a brand new connection
+      retVal = self._connect()
       if not retVal[ 'OK' ]:
         retVal[ 'rpcStub' ] = stub
         return retVal
+      trid, transport = retVal[ 'Value' ]
+    keepConnection = False
+    try:
+      proposalResponse = self._proposeAction( transport, ( "RPC", functionName ),
+                                              keepConnection = self._usePersistentConnection() )
+      if not proposalResponse[ 'OK' ]:
+        proposalResponse[ 'rpcStub' ] = stub
+        return proposalResponse
       retVal = transport.sendData( S_OK( args ) )
       if not retVal[ 'OK' ]:
         return retVal
       receivedData = transport.receiveData()
       if type( receivedData ) == types.DictType:
+        keepConnection = receivedData[ 'OK' ] and 'keepConnection' in proposalResponse
         receivedData[ 'rpcStub' ] = stub
       return receivedData
     finally:
-      self._disconnect( trid )
+      self._checkInTransport( trid, keepConnection )
 
+  def __executeOnReusedTransport( self, trid, transport, functionName, args ):
+    """
+    Send the proposal and the arguments in one go without waiting for the proposal acknowledgement,
+    so the RPC costs a single exchange with the server.
+
+    @return: ( received data, whether the server accepted the proposal )
+    """
+    keepConnection = False
+    try:
+      retVal = self._sendProposal( transport, ( "RPC", functionName ), keepConnection = True )
+      if retVal[ 'OK' ]:
+        retVal = transport.sendData( S_OK( args ) )
+      if not retVal[ 'OK' ]:
+        return retVal, False
+      proposalResponse = transport.receiveData()
+      if type( proposalResponse ) != types.DictType or not proposalResponse[ 'OK' ]:
+        return proposalResponse, False
+      receivedData = transport.receiveData()
+      if type( receivedData ) == types.DictType:
+        keepConnection = receivedData[ 'OK' ] and 'keepConnection' in proposalResponse
+      return receivedData, True
+    finally:
+      self._checkInTransport( trid, keepConnection )
@@ -1,6 +1,8 @@
 
 import os
 import time
+import select
+import socket
 import DIRAC
 import threading
 from DIRAC import gConfig, gLogger, S_OK, S_ERROR, gMonitor
@@ -45,6 +47,10 @@ class Service:
     self._transportPool = getGlobalTransportPool()
     self.__cloneId = 0
     self.__maxFD = 0
+    #Persistent connections waiting for the next proposal
+    self.__idleLock = threading.Lock()
+    self.__idleTransports = {}
+    self.__listeningIdle = False
 
   def setCloneProcessId( self, cloneId ):
     self.__cloneId = cloneId
@@ -244,6 +250,7 @@ class Service:
     self._monitor.registerActivity( 'ActiveQueries', "Active queries", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'RunningThreads', "Running threads", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'MaxFD', "Max File Descriptors", 'Framework', 'fd', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'IdleConnections', "Idle persistent connections", 'Framework', 'connections', MonitoringClient.OP_MEAN )
 
     self._monitor.setComponentExtraParam( 'DIRACVersion', DIRAC.version )
     self._monitor.setComponentExtraParam( 'platform', DIRAC.platform )
@@ -265,6 +272,7 @@ class Service:
     self._monitor.addMark( 'ActiveQueries', self._threadPool.numWorkingThreads() )
     self._monitor.addMark( 'RunningThreads', threading.activeCount() )
     self._monitor.addMark( 'MaxFD', self.__maxFD )
+    self._monitor.addMark( 'IdleConnections', len( self.__idleTransports ) )
     self.__maxFD = 0
 
 
@@ -300,31 +308,145 @@ class Service:
       trid = self._transportPool.add( clientTransport )
       if not trid:
         return
-      #Receive and check proposal
-      result = self._receiveAndCheckProposal( trid )
+      #Keep the credentials as they come from the handshake. Authorization modifies them
+      self._transportPool.associateData( trid, 'handshakeCredentials',
+                                         dict( clientTransport.getConnectingCredentials() ) )
+      return self._processTransport( trid )
+    finally:
+      self._lockManager.unlockGlobal()
+      if monReport:
+        self.__endReportToMonitoring( *monReport )
+
+  def _processPersistentInThread( self, trid ):
+    """
+    Serve the next proposal arriving through an already established persistent connection
+    """
+    clientTransport = self._transportPool.get( trid )
+    if not clientTransport:
+      return
+    self._lockManager.lockGlobal()
+    try:
+      #Don't block the thread if it's just a keep alive
+      result = self._transportPool.receive( trid, 1024, blockAfterKeepAlive = False, idleReceive = True )
       if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
+        gLogger.debug( "Persistent connection dropped", result[ 'Message' ] )
+        self._transportPool.close( trid )
         return
-      proposalTuple = result[ 'Value' ]
-      #Instantiate handler
-      result = self._instantiateHandler( trid, proposalTuple )
-      if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
+      if 'keepAlive' in result:
+        self.__parkTransport( trid, self._transportPool.getAssociatedData( trid, 'lastServed' ) )
         return
-      handlerObj = result[ 'Value' ]
-      #Execute the action
-      result = self._processProposal( trid, proposalTuple, handlerObj )
-      #Close the connection if required
-      if result[ 'closeTransport' ] or not result[ 'OK' ]:
-        if not result[ 'OK' ]:
-          gLogger.error( "Error processing proposal", result[ 'Message' ] )
-        self._transportPool.close( trid )
-      return result
+      self._stats[ 'connections' ] += 1
+      try:
+        monReport = self.__startReportToMonitoring()
+      except Exception, e:
+        monReport = False
+      try:
+        clientTransport.setConnectingCredentials( dict( self._transportPool.getAssociatedData( trid,
+                                                                                  'handshakeCredentials' ) ) )
+        return self._processTransport( trid )
+      finally:
+        if monReport:
+          self.__endReportToMonitoring( *monReport )
     finally:
       self._lockManager.unlockGlobal()
-      if monReport:
-        self.__endReportToMonitoring( *monReport )
 
+  def _processTransport( self, trid ):
+    #Receive and check proposal
+    result = self._receiveAndCheckProposal( trid )
+    if not result[ 'OK' ]:
+      self._transportPool.sendAndClose( trid, result )
+      return
+    proposalTuple = result[ 'Value' ]
+    #Instantiate handler
+    result = self._instantiateHandler( trid, proposalTuple )
+    if not result[ 'OK' ]:
+      self._transportPool.sendAndClose( trid, result )
+      return
+    handlerObj = result[ 'Value' ]
+    #Execute the action
+    result = self._processProposal( trid, proposalTuple, handlerObj )
+    #Close the connection if required
+    if not result[ 'OK' ] or result[ 'closeTransport' ]:
+      if not result[ 'OK' ]:
+        gLogger.error( "Error processing proposal", result[ 'Message' ] )
+      self._transportPool.close( trid )
+    elif result.get( 'keepConnection' ):
+      self.__parkTransport( trid, time.time() )
+    return result
+
+  #Persistent connections
+
+  def __acceptPersistentConnection( self, proposalTuple ):
+    if len( proposalTuple ) < 4 or proposalTuple[1][0] != 'RPC':
+      return False
+    try:
+      if not proposalTuple[3].get( 'keepConnection' ):
+        return False
+    except AttributeError:
+      return False
+    if not self._cfg.getPersistentConnectionIdleTime():
+      return False
+    return len( self.__idleTransports ) < self._cfg.getMaxPersistentConnections()
+
+  def __parkTransport( self, trid, lastServed ):
+    self._transportPool.associateData( trid, 'lastServed', lastServed )
+    self.__idleLock.acquire()
+    try:
+      self.__idleTransports[ trid ] = lastServed
+      if not self.__listeningIdle:
+        self.__listeningIdle = True
+        idleThread = threading.Thread( target = self.__listenIdleTransports )
+        idleThread.setDaemon( True )
+        idleThread.start()
+    finally:
+      self.__idleLock.release()
+
+  def __listenIdleTransports( self ):
+    while True:
+      now = time.time()
+      idleTime = self._cfg.getPersistentConnectionIdleTime()
+      readyList = []
+      expiredList = []
+      sIdList = []
+      self.__idleLock.acquire()
+      try:
+        if not self.__idleTransports:
+          self.__listeningIdle = False
+          return
+        for trid in list( self.__idleTransports ):
+          tr = self._transportPool.get( trid )
+          if not tr:
+            del( self.__idleTransports[ trid ] )
+          elif now - self.__idleTransports[ trid ] > idleTime:
+            del( self.__idleTransports[ trid ] )
+            expiredList.append( trid )
+          elif tr.byteStream or tr.receivedMessages:
+            del( self.__idleTransports[ trid ] )
+            readyList.append( trid )
+          else:
+            sIdList.append( ( trid, tr.getSocket() ) )
+      finally:
+        self.__idleLock.release()
+      for trid in expiredList:
+        gLogger.debug( "Closing idle persistent connection", trid )
+        self._transportPool.close( trid )
+      if sIdList and not readyList:
+        try:
+          inList, dummy, dummy = select.select( [ pos[1] for pos in sIdList ], [], [], 1 )
+        except ( socket.error, select.error ):
+          time.sleep( 0.1 )
+          continue
+        self.__idleLock.acquire()
+        try:
+          for trid, sock in sIdList:
+            if sock in inList and trid in self.__idleTransports:
+              del( self.__idleTransports[ trid ] )
+              readyList.append( trid )
+        finally:
+          self.__idleLock.release()
+      for trid in readyList:
+        self._threadPool.generateJobAndQueueIt( self._processPersistentInThread,
+                                                args = ( trid, ) )
 
   def _createIdentityString( self, credDict, clientTransport = False ):
     if 'username' in credDict:
@@ -448,7 +570,11 @@ class Service:
 
   def _processProposal( self, trid, proposalTuple, handlerObj ):
     #Notify the client we're ready to execute the action
-    retVal = self._transportPool.send( trid, S_OK() )
+    keepConnection = self.__acceptPersistentConnection( proposalTuple )
+    readyMsg = S_OK()
+    if keepConnection:
+      readyMsg[ 'keepConnection' ] = True
+    retVal = self._transportPool.send( trid, readyMsg )
     if not retVal[ 'OK' ]:
       return retVal
 
@@ -476,7 +602,8 @@ class Service:
       if not result[ 'OK' ]:
         self._msgBroker.removeTransport( trid )
 
-    result[ 'closeTransport' ] = not messageConnection or not result[ 'OK' ]
+    result[ 'closeTransport' ] = not ( messageConnection or keepConnection ) or not result[ 'OK' ]
+    result[ 'keepConnection' ] = keepConnection and result[ 'OK' ]
     return result
 
   def _mbConnect( self, trid, handlerObj = False ):
@@ -74,6 +74,18 @@ class ServiceConfiguration:
     except:
       return 15
 
+  def getPersistentConnectionIdleTime( self ):
+    try:
+      return int( self.getOption( "PersistentConnectionIdleTime" ) )
+    except:
+      return 120
+
+  def getMaxPersistentConnections( self ):
+    try:
+      return int( self.getOption( "MaxPersistentConnections" ) )
+    except:
+      return 100
+
   def getCloneProcesses( self ):
     try:
       return int( self.getOption( "CloneProcesses" ) )
@@ -1,5 +1,6 @@
 
 import time
+import select
 import threading
 from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
@@ -19,6 +20,15 @@ class TransportPool:
     if not result[ 'OK' ]:
       self.log.fatal( "Cannot add task to thread scheduler", result[ 'Message' ] )
     self.__keepAlivesTask = result[ 'Value' ]
+    #Idle client transports kept open to be reused by later RPCs
+    self.__idleLock = threading.Lock()
+    self.__idleTransports = {}
+    self.__idlePerHost = {}
+    self.__idleStats = { 'hits' : 0, 'misses' : 0, 'evicted' : 0, 'discarded' : 0, 'rejected' : 0 }
+    result = gThreadScheduler.addPeriodicTask( 5, self.__evictIdleTransports )
+    if not result[ 'OK' ]:
+      self.log.fatal( "Cannot add task to thread scheduler", result[ 'Message' ] )
+    self.__evictTask = result[ 'Value' ]
 
   #
   # Send keep alives
@@ -147,6 +157,120 @@ class TransportPool:
       return S_ERROR( "No transport with id %s defined" % trid )
     self.__remove( trid )
 
+  #
+  # Persistent client connections
+  #
+
+  def checkIn( self, trid, poolKey, maxIdleTime = 60, maxPerHost = 10, maxLifeTime = 600 ):
+    """
+    Park an idle client transport so later RPCs to the same destination can reuse it.
+    poolKey is a tuple whose first element is the remote host the per host cap applies to.
+    If the transport can't be parked it's closed.
+
+    @return: True if the transport has been parked
+    """
+    now = time.time()
+    created = self.getAssociatedData( trid, 'created' )
+    if not created:
+      created = now
+      self.associateData( trid, 'created', created )
+    host = poolKey[0]
+    self.__idleLock.acquire()
+    try:
+      if not self.exists( trid ) or now - created > maxLifeTime or \
+         self.__idlePerHost.get( host, 0 ) >= maxPerHost:
+        self.__idleStats[ 'rejected' ] += 1
+        parked = False
+      else:
+        self.__idleTransports.setdefault( poolKey, [] ).append( ( trid, now + maxIdleTime ) )
+        self.__idlePerHost[ host ] = self.__idlePerHost.get( host, 0 ) + 1
+        parked = True
+    finally:
+      self.__idleLock.release()
+    if not parked:
+      self.close( trid )
+    return parked
+
+  def checkOut( self, poolKey ):
+    """
+    Get a healthy idle transport for poolKey. Transports found to be unusable are closed.
+
+    @return: ( trid, transport ) or False if there's no transport available
+    """
+    while True:
+      self.__idleLock.acquire()
+      try:
+        idleList = self.__idleTransports.get( poolKey )
+        if not idleList:
+          self.__idleStats[ 'misses' ] += 1
+          return False
+        #Last in, first out. The most recently used transport is the most likely to be alive
+        trid, expiration = idleList.pop()
+        self.__forgetIdle( poolKey )
+      finally:
+        self.__idleLock.release()
+      transport = self.get( trid )
+      if transport and expiration > time.time() and self.__isHealthy( transport ):
+        self.__idleLock.acquire()
+        self.__idleStats[ 'hits' ] += 1
+        self.__idleLock.release()
+        return ( trid, transport )
+      self.__idleLock.acquire()
+      self.__idleStats[ 'discarded' ] += 1
+      self.__idleLock.release()
+      self.log.debug( "Discarding unusable idle transport %s" % trid )
+      self.close( trid )
+
+  def __forgetIdle( self, poolKey ):
+    #Must be called with the idle lock held
+    host = poolKey[0]
+    self.__idlePerHost[ host ] -= 1
+    if not self.__idlePerHost[ host ]:
+      del( self.__idlePerHost[ host ] )
+    if not self.__idleTransports[ poolKey ]:
+      del( self.__idleTransports[ poolKey ] )
+
+  def __isHealthy( self, transport ):
+    #An idle transport has nothing pending. Anything readable means the peer closed or broke the stream
+    if transport.byteStream or transport.receivedMessages:
+      return False
+    try:
+      inList, dummy, dummy = select.select( [ transport.getSocket() ], [], [], 0 )
+    except Exception:
+      return False
+    return not inList
+
+  def __evictIdleTransports( self ):
+    now = time.time()
+    toClose = []
+    self.__idleLock.acquire()
+    try:
+      for poolKey in list( self.__idleTransports ):
+        idleList = self.__idleTransports[ poolKey ]
+        for idleTuple in list( idleList ):
+          if idleTuple[1] <= now:
+            idleList.remove( idleTuple )
+            toClose.append( idleTuple[0] )
+            self.__idleStats[ 'evicted' ] += 1
+            self.__forgetIdle( poolKey )
+    finally:
+      self.__idleLock.release()
+    for trid in toClose:
+      self.log.debug( "Closing idle transport %s" % trid )
+      self.close( trid )
+
+  def getPersistentStats( self ):
+    """
+    Get the counters for the persistent client connections
+    """
+    self.__idleLock.acquire()
+    try:
+      stats = dict( self.__idleStats )
+      stats[ 'idle' ] = sum( [ len( idleList ) for idleList in self.__idleTransports.values() ] )
+    finally:
+      self.__idleLock.release()
+    return stats
+
   def __remove( self, trid ):
     self.__modLock.acquire()
     try:
@@ -3,7 +3,6 @@ __RCSID__ = "$Id$"
 
 import time
 import select
-import cStringIO
 try:
   from hashlib import md5
 except:
@@ -74,6 +73,9 @@ class BaseTransport:
   def getConnectingCredentials( self ):
     return self.peerCredentials
 
+  def setConnectingCredentials( self, credDict ):
+    self.peerCredentials = credDict
+
   def setExtraCredentials( self, group ):
     self.peerCredentials[ 'extraCredentials' ] = group
 
@@ -113,30 +115,47 @@ class BaseTransport:
     except Exception, e:
       return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
 
-  def _write( self, buffer ):
-    return S_OK( self.oSocket.send( buffer ) )
+  def _write( self, outData ):
+    return S_OK( self.oSocket.send( outData ) )
 
   def sendData( self, uData, prefix = False ):
     self.__updateLastActionTimestamp()
     sCodedData = DEncode.encode( uData )
     if prefix:
-      dataToSend = "%s%s:%s" % ( prefix, len( sCodedData ), sCodedData )
+      header = "%s%s:" % ( prefix, len( sCodedData ) )
     else:
-      dataToSend = "%s:%s" % ( len( sCodedData ), sCodedData )
-    for index in range( 0, len( dataToSend ), self.packetSize ):
-      bytesToSend = min( self.packetSize, len( dataToSend ) - index )
-      packSentBytes = 0
-      while packSentBytes < bytesToSend:
-        try:
-          result = self._write( dataToSend[ index + packSentBytes : index + bytesToSend ] )
-          if not result[ 'OK' ]:
-            return result
-          sentBytes = result[ 'Value' ]
-        except Exception, e:
-          return S_ERROR( "Exception while sending data: %s" % e )
-        if sentBytes == 0:
-          return S_ERROR( "Connection closed by peer" )
-        packSentBytes += sentBytes
+      header = "%s:" % len( sCodedData )
+    #Small messages go out in one write
+    if len( header ) + len( sCodedData ) <= self.packetSize:
+      return self.__writeAll( header + sCodedData )
+    #Big ones only copy the first packet to glue the header. The rest is written
+    #in packetSize pieces straight from the encoded string
+    firstPacketSize = self.packetSize - len( header )
+    result = self.__writeAll( header + sCodedData[ :firstPacketSize ] )
+    if not result[ 'OK' ]:
+      return result
+    for index in range( firstPacketSize, len( sCodedData ), self.packetSize ):
+      result = self.__writeAll( buffer( sCodedData, index, self.packetSize ) )
+      if not result[ 'OK' ]:
+        return result
+    return S_OK()
+
+  def __writeAll( self, outData ):
+    bytesToSend = len( outData )
+    sentBytes = 0
+    while sentBytes < bytesToSend:
+      try:
+        if sentBytes:
+          result = self._write( buffer( outData, sentBytes ) )
+        else:
+          result = self._write( outData )
+        if not result[ 'OK' ]:
+          return result
+      except Exception, e:
+        return S_ERROR( "Exception while sending data: %s" % e )
+      if result[ 'Value' ] == 0:
+        return S_ERROR( "Connection closed by peer" )
+      sentBytes += result[ 'Value' ]
     return S_OK()
 
 
@@ -177,40 +196,48 @@ class BaseTransport:
       #From here it must be a real message!
       #Process the size and remove the msg length from the bytestream
       pkgSize = int( self.byteStream[ :iSeparatorPosition ] )
-      pkgData = self.byteStream[ iSeparatorPosition + 1: ]
-      readSize = len( pkgData )
+      pkgStart = iSeparatorPosition + 1
+      pkgEnd = pkgStart + pkgSize
+      readSize = len( self.byteStream ) - pkgStart
       if readSize >= pkgSize:
-        #If we already have all the data we need
-        data = pkgData[ :pkgSize ]
-        self.byteStream = pkgData[ pkgSize: ]
+        #If we already have all the data we need, decode it in place
+        try:
+          data, decodedEnd = DEncode.decode( self.byteStream, pkgStart )
+        except Exception, e:
+          self.byteStream = self.byteStream[ pkgEnd: ]
+          return S_ERROR( "Could not decode received data: %s" % str( e ) )
+        self.byteStream = self.byteStream[ pkgEnd: ]
+        if decodedEnd != pkgEnd:
+          return S_ERROR( "Could not decode received data: length mismatch" )
       else:
-        #If we still need to read stuff
-        pkgMem = cStringIO.StringIO()
-        pkgMem.write( pkgData )
-        #Receive while there's still data to be received
+        #If we still need to read stuff, decode it as it arrives
+        decoder = DEncode.StreamDecoder()
+        try:
+          decoder.feed( self.byteStream[ pkgStart: ] )
+        except Exception, e:
+          return S_ERROR( "Could not decode received data: %s" % str( e ) )
+        self.byteStream = ""
+        #Receive while there's still data to be received. Don't ask for more than a packet
+        #at a time, the receiving string is allocated with the requested size
         while readSize < pkgSize:
-          retVal = self._read( pkgSize - readSize, skipReadyCheck = True )
+          retVal = self._read( min( pkgSize - readSize, self.packetSize ), skipReadyCheck = True )
           if not retVal[ 'OK' ]:
             return retVal
           if not retVal[ 'Value' ]:
             return S_ERROR( "Peer closed connection" )
           rcvData = retVal[ 'Value' ]
           readSize += len( rcvData )
-          pkgMem.write( rcvData )
           if maxBufferSize and readSize > maxBufferSize:
             return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
-        #Data is here! take it out from the bytestream, dencode and return
-        if readSize == pkgSize:
-          data = pkgMem.getvalue()
-          self.byteStream = ""
-        else: #readSize > pkgSize:
-          pkgMem.seek( 0, 0 )
-          data = pkgMem.read( pkgSize )
-          self.byteStream = pkgMem.read()
-      try:
-        data = DEncode.decode( data )[0]
-      except Exception, e:
-        return S_ERROR( "Could not decode received data: %s" % str( e ) )
+          try:
+            decoder.feed( rcvData )
+          except Exception, e:
+            return S_ERROR( "Could not decode received data: %s" % str( e ) )
+        try:
+          decoder.end()
+          data = decoder.getValue()
+        except Exception, e:
+          return S_ERROR( "Could not decode received data: %s" % str( e ) )
       if idleReceive:
         self.receivedMessages.append( data )
         return S_OK()
@@ -4,6 +4,10 @@ __RCSID__ = "$Id$"
 import time
 import copy
 import os.path
+try:
+  import hashlib as md5
+except:
+  import md5
 import GSI
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 from DIRAC.Core.Utilities.Network import checkHostsMatch
@@ -17,6 +21,15 @@ class SocketInfo:
   __cachedCAsCRLs = False
   __cachedCAsCRLsLastLoaded = 0
   __cachedCAsCRLsLoadLock = LockRing().getLock()
+  #Incremented each time the CAs and CRLs are reloaded
+  __cachedCAsCRLsVersion = 0
+  #( CAs location, its modification time ) when they were loaded
+  __cachedCAsCRLsStamp = False
+
+  #SSL contexts shared by the connections using the same credentials and options
+  __cachedContexts = {}
+  __cachedContextsLock = LockRing().getLock()
+  __maxCachedContexts = 100
 
 
   def __init__( self, infoDict, sslContext = False ):
@@ -123,20 +136,28 @@ class SocketInfo:
   def _serverCallback( self, conn, cert, errnum, depth, ok ):
     return ok
 
-  def __getCAStore( self ):
+  def __loadCAsCRLs( self ):
+    """
+    Load the CAs and CRLs if they have never been loaded, they are more than 15 minutes
+    old or the CAs directory has changed. Returns the version of the loaded ones
+    """
+    casPath = Locations.getCAsLocation()
+    if not casPath:
+      return S_ERROR( "No valid CAs location found" )
+    try:
+      casStamp = ( casPath, os.stat( casPath ).st_mtime )
+    except OSError, e:
+      return S_ERROR( "Can't access CAs location %s: %s" % ( casPath, str( e ) ) )
     SocketInfo.__cachedCAsCRLsLoadLock.acquire()
     try:
-      if not SocketInfo.__cachedCAsCRLs or time.time() - SocketInfo.__cachedCAsCRLsLastLoaded > 900:
-        #Need to generate the CA Store
+      if not SocketInfo.__cachedCAsCRLs or time.time() - SocketInfo.__cachedCAsCRLsLastLoaded > 900 or \
+         casStamp != SocketInfo.__cachedCAsCRLsStamp:
+        #Need to load the CAs and CRLs
         casDict = {}
         crlsDict = {}
-        casPath = Locations.getCAsLocation()
-        if not casPath:
-          return S_ERROR( "No valid CAs location found" )
         gLogger.debug( "CAs location is %s" % casPath )
         casFound = 0
         crlsFound = 0
-        SocketInfo.__caStore = GSI.crypto.X509Store()
         for fileName in os.listdir( casPath ):
           filePath = os.path.join( casPath, fileName )
           if not os.path.isfile( filePath ):
@@ -184,11 +205,22 @@ class SocketInfo:
         SocketInfo.__cachedCAsCRLs = ( [ casDict[k][1] for k in casDict ],
                                        [ crlsDict[k][1] for k in crlsDict ] )
         SocketInfo.__cachedCAsCRLsLastLoaded = time.time()
+        SocketInfo.__cachedCAsCRLsStamp = casStamp
+        SocketInfo.__cachedCAsCRLsVersion += 1
     except:
       gLogger.exception( "ASD" )
     finally:
       SocketInfo.__cachedCAsCRLsLoadLock.release()
-    #Generate CA Store
+    if not SocketInfo.__cachedCAsCRLs:
+      return S_ERROR( "Could not load the CAs from %s" % casPath )
+    return S_OK( SocketInfo.__cachedCAsCRLsVersion )
+
+  def __getCAStore( self ):
+    #Each context owns its store, a store can't be shared between contexts
+    if not SocketInfo.__cachedCAsCRLs:
+      result = self.__loadCAsCRLs()
+      if not result[ 'OK' ]:
+        return result
     caStore = GSI.crypto.X509Store()
     caList = SocketInfo.__cachedCAsCRLs[0]
     for caCert in caList:
@@ -237,12 +269,63 @@ class SocketInfo:
       self.sslContext.set_verify( GSI.SSL.VERIFY_NONE, None, gsiEnable ) # Demand a certificate
     return S_OK()
 
+  def __getFileStamp( self, filePath ):
+    try:
+      fileStat = os.stat( filePath )
+    except OSError:
+      return False
+    return ( filePath, fileStat.st_mtime, fileStat.st_size, fileStat.st_ino )
+
+  def __getCachedContext( self, credentialsID, generateFunc ):
+    """
+    Get the SSL context for the credentials identified by credentialsID out of the cache or
+    generate it with generateFunc. Changes in the CAs directory or the options give a new context
+    """
+    caVersion = False
+    if not self.__getValue( 'skipCACheck', False ):
+      result = self.__loadCAsCRLs()
+      if not result[ 'OK' ]:
+        return result
+      caVersion = result[ 'Value' ]
+    clientMode = self.__getValue( 'clientMode', False )
+    contextKey = ( clientMode, credentialsID, caVersion, self.__getValue( 'sslMethod', False ),
+                   self.__getValue( 'skipCACheck', False ), self.__getValue( 'gsiEnable', False ) )
+    if not clientMode:
+      contextKey += ( self.__getValue( 'SSLSessionTimeout', False ), )
+    SocketInfo.__cachedContextsLock.acquire()
+    try:
+      if contextKey in SocketInfo.__cachedContexts:
+        self.sslContext = SocketInfo.__cachedContexts[ contextKey ][0]
+        SocketInfo.__cachedContexts[ contextKey ][1] = time.time()
+        return S_OK()
+    finally:
+      SocketInfo.__cachedContextsLock.release()
+    retVal = generateFunc()
+    if not retVal[ 'OK' ]:
+      return retVal
+    SocketInfo.__cachedContextsLock.acquire()
+    try:
+      cache = SocketInfo.__cachedContexts
+      #Drop the contexts built with outdated CAs
+      for key in [ key for key in cache if key[2] and key[2] != SocketInfo.__cachedCAsCRLsVersion ]:
+        del cache[ key ]
+      if len( cache ) >= SocketInfo.__maxCachedContexts:
+        del cache[ min( [ ( cache[ key ][1], key ) for key in cache ] )[1] ]
+      cache[ contextKey ] = [ self.sslContext, time.time() ]
+    finally:
+      SocketInfo.__cachedContextsLock.release()
+    return S_OK()
+
   def __generateContextWithCerts( self ):
     certKeyTuple = Locations.getHostCertificateAndKeyLocation()
     if not certKeyTuple:
       return S_ERROR( "No valid certificate or key found" )
     self.setLocalCredentialsLocation( certKeyTuple )
     gLogger.debug( "Using certificate %s\nUsing key %s" % certKeyTuple )
+    credentialsID = ( self.__getFileStamp( certKeyTuple[0] ), self.__getFileStamp( certKeyTuple[1] ) )
+    return self.__getCachedContext( credentialsID, lambda: self.__loadCerts( certKeyTuple ) )
+
+  def __loadCerts( self, certKeyTuple ):
     retVal = self.__createContext()
     if not retVal[ 'OK' ]:
       return retVal
@@ -250,6 +333,8 @@ class SocketInfo:
     self.sslContext.set_verify_depth( 50 )
     self.sslContext.use_certificate_chain_file( certKeyTuple[0] )
     self.sslContext.use_privatekey_file( certKeyTuple[1] )
+    if not self.__getValue( 'clientMode', False ):
+      self.__setServerOptions()
     return S_OK()
 
   def __generateContextWithProxy( self ):
@@ -263,6 +348,9 @@ class SocketInfo:
         return S_ERROR( "No valid proxy found" )
     self.setLocalCredentialsLocation( ( proxyPath, proxyPath ) )
     gLogger.debug( "Using proxy %s" % proxyPath )
+    return self.__getCachedContext( self.__getFileStamp( proxyPath ), lambda: self.__loadProxy( proxyPath ) )
+
+  def __loadProxy( self, proxyPath ):
     retVal = self.__createContext()
     if not retVal[ 'OK' ]:
       return retVal
@@ -274,6 +362,10 @@ class SocketInfo:
     proxyString = self.infoDict[ 'proxyString' ]
     self.setLocalCredentialsLocation( ( proxyString, proxyString ) )
     gLogger.debug( "Using string proxy" )
+    credentialsID = md5.md5( proxyString ).hexdigest()
+    return self.__getCachedContext( credentialsID, lambda: self.__loadProxyString( proxyString ) )
+
+  def __loadProxyString( self, proxyString ):
     retVal = self.__createContext()
     if not retVal[ 'OK' ]:
       return retVal
@@ -282,16 +374,15 @@ class SocketInfo:
     return S_OK()
 
   def __generateServerContext( self ):
-    retVal = self.__generateContextWithCerts()
-    if not retVal[ 'OK' ]:
-      return retVal
+    return self.__generateContextWithCerts()
+
+  def __setServerOptions( self ):
     self.sslContext.set_session_id( "DISETConnection%s" % str( time.time() ) )
     #self.sslContext.get_cert_store().set_flags( GSI.crypto.X509_CRL_CHECK )
     if 'SSLSessionTimeout' in self.infoDict:
       timeout = int( self.infoDict['SSLSessionTimeout'] )
       gLogger.debug( "Setting session timeout to %s" % timeout )
       self.sslContext.set_session_timeout( timeout )
-    return S_OK()
 
   def doClientHandshake( self ):
     self.sslSocket.set_connect_state()
@@ -86,7 +86,8 @@ class SocketInfoFactory:
     if 'proxyChain' in socketInfo.infoDict:
       sessionHash.update( "|%s" % socketInfo.infoDict[ 'proxyChain' ].dumpAllToString()[ 'Value' ] )
     sessionId = sessionHash.hexdigest()
-    socketInfo.sslContext.set_session_id( str( hash( sessionId ) ) )
+    #The SSL context is shared with other connections, don't change it here.
+    #The session id context only matters on the server side
     socketInfo.setSSLSocket( sslSocket )
     if gSessionManager.isValid( sessionId ):
       sslSocket.set_session( gSessionManager.get( sessionId ) )
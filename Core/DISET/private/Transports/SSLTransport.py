@@ -140,7 +140,7 @@ class SSLTransport( BaseTransport ):
   def isLocked( self ):
     return self.__locked
 
-  def _write( self, buffer ):
+  def _write( self, outData ):
     self.__lock()
     try:
       #Renegotiation
@@ -161,12 +161,12 @@ class SSLTransport( BaseTransport ):
       timeout = self.oSocketInfo.infoDict[ 'timeout' ]
       if timeout:
         start = time.time()
-      while sentBytes < len( buffer ):
+      while sentBytes < len( outData ):
         try:
           if timeout:
             if time.time() - start > timeout:
               return S_ERROR( "Socket write timeout exceeded" )
-          sent = self.oSocket.write( buffer[ sentBytes: ] )
+          sent = self.oSocket.write( buffer( outData, sentBytes ) )
           if sent == 0:
             return S_ERROR( "Connection closed by peer" )
           if sent > 0:
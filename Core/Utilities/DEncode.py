@@ -1,6 +1,7 @@
 # $HeadURL$
 """
-Encoding and decoding for dirac, Ids:
+Encoding and decoding for dirac. Encoded data can be decoded in one go with decode or
+incrementally, as it arrives, with a StreamDecoder. Ids:
  i -> int
  I -> long
  f -> float
@@ -21,6 +22,8 @@ _dateTimeObject = datetime.datetime.utcnow()
 _dateTimeType = type( _dateTimeObject )
 _dateType = type( _dateTimeObject.date() )
 _timeType = type( _dateTimeObject.time() )
+_stringType = types.StringType
+_intType = types.IntType
 
 g_dEncodeFunctions = {}
 g_dDecodeFunctions = {}
@@ -172,17 +175,30 @@ g_dDecodeFunctions[ 'n' ] = decodeNone
 #Encode and decode a list
 def encodeList( lValue, eList ):
   eList.append( "l" )
+  encodeFunctions = g_dEncodeFunctions
   for uObject in lValue:
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+    #Strings (LFNs, PFNs...) are by far the most common list contents
+    if type( uObject ) == _stringType:
+      eList.extend( ( 's', str( len( uObject ) ), ':', uObject ) )
+    else:
+      encodeFunctions[ type( uObject ) ]( uObject, eList )
   eList.append( "e" )
 
 def decodeList( data, i ):
   oL = []
   i += 1
-  while data[ i ] != "e":
-    ob, i = g_dDecodeFunctions[ data[ i ] ]( data, i )
-    oL.append( ob )
-  return( oL, i + 1 )
+  decodeFunctions = g_dDecodeFunctions
+  while True:
+    dataType = data[ i ]
+    if dataType == "s":
+      colon = data.index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      oL.append( data[ colon + 1 : i ] )
+    elif dataType == "e":
+      return ( oL, i + 1 )
+    else:
+      ob, i = decodeFunctions[ dataType ]( data, i )
+      oL.append( ob )
 
 g_dEncodeFunctions[ types.ListType ] = encodeList
 g_dDecodeFunctions[ "l" ] = decodeList
@@ -190,8 +206,9 @@ g_dDecodeFunctions[ "l" ] = decodeList
 #Encode and decode a tuple
 def encodeTuple( lValue, eList ):
   eList.append( "t" )
+  encodeFunctions = g_dEncodeFunctions
   for uObject in lValue:
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+    encodeFunctions[ type( uObject ) ]( uObject, eList )
   eList.append( "e" )
 
 def decodeTuple( data, i ):
@@ -204,17 +221,34 @@ g_dDecodeFunctions[ "t" ] = decodeTuple
 #Encode and decode a dictionary
 def encodeDict( dValue, eList ):
   eList.append( "d" )
+  encodeFunctions = g_dEncodeFunctions
   for key in sorted( dValue ):
-    g_dEncodeFunctions[ type( key ) ]( key, eList )
-    g_dEncodeFunctions[ type( dValue[key] ) ]( dValue[key], eList )
+    value = dValue[ key ]
+    if type( key ) == _stringType:
+      eList.extend( ( 's', str( len( key ) ), ':', key ) )
+    else:
+      encodeFunctions[ type( key ) ]( key, eList )
+    encodeFunctions[ type( value ) ]( value, eList )
   eList.append( "e" )
 
 def decodeDict( data, i ):
   oD = {}
   i += 1
+  decodeFunctions = g_dDecodeFunctions
   while data[ i ] != "e":
-    k, i = g_dDecodeFunctions[ data[ i ] ]( data, i )
-    oD[ k ], i = g_dDecodeFunctions[ data[ i ] ]( data, i )
+    #Keys are almost always strings or ints (job ids, file ids...)
+    dataType = data[ i ]
+    if dataType == "s":
+      colon = data.index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      k = data[ colon + 1 : i ]
+    elif dataType == "i":
+      end = data.index( "e", i + 1 )
+      k = int( data[ i + 1 : end ] )
+      i = end + 1
+    else:
+      k, i = decodeFunctions[ dataType ]( data, i )
+    oD[ k ], i = decodeFunctions[ data[ i ] ]( data, i )
   return ( oD, i + 1 )
 
 g_dEncodeFunctions[ types.DictType ] = encodeDict
@@ -231,16 +265,243 @@ def encode( uObject ):
   except Exception:
     raise
 
-def decode( data ):
+def decode( data, start = 0 ):
+  """
+  Decode the object encoded in data starting at position start (so framed data can be decoded
+  without slicing it first). Returns a tuple with the object and the position where it ends.
+  """
   if not data:
     return data
   try:
     #print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
-    return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
+    return g_dDecodeFunctions[ data[ start ] ]( data, start )
   except Exception:
     raise
 
 
+class StreamDecoder( object ):
+  """
+  Incremental decoder. The encoded data can be fed in chunks as they arrive and it's decoded
+  on the fly, so there's no need to assemble the whole encoded string before decoding it.
+  Only the tail of a chunk that can't be decoded yet is kept between feeds.
+  """
+
+  def __init__( self ):
+    self.__buffer = ""
+    self.__position = 0
+    self.__stack = []
+    self.__pendingString = None
+    self.__finished = False
+    self.__ended = False
+    self.__value = None
+
+  def isFinished( self ):
+    """
+    Has a complete object been decoded?
+    """
+    return self.__finished
+
+  def getValue( self ):
+    """
+    Get the decoded object
+    """
+    if not self.__finished:
+      raise ValueError( "Encoded data is not complete" )
+    return self.__value
+
+  def feed( self, data ):
+    """
+    Feed more encoded data
+
+    @return: True if the object has been completely decoded
+    """
+    if self.__finished:
+      if data:
+        raise ValueError( "Extra data after the end of the encoded object" )
+      return True
+    if self.__pendingString:
+      data = self.__feedPendingString( data )
+      if self.__finished and data:
+        raise ValueError( "Extra data after the end of the encoded object" )
+    if self.__position < len( self.__buffer ):
+      self.__buffer = self.__buffer[ self.__position: ] + data
+    else:
+      self.__buffer = data
+    self.__position = 0
+    self.__decodeBuffer()
+    return self.__finished
+
+  def end( self ):
+    """
+    Notify there's no more data to come. Needed only to finish a float sent on its own.
+
+    @return: True if the object has been completely decoded
+    """
+    self.__ended = True
+    if not self.__finished:
+      self.__decodeBuffer()
+    return self.__finished
+
+  def __feedPendingString( self, data ):
+    dataType, missing, parts = self.__pendingString
+    if len( data ) < missing:
+      parts.append( data )
+      self.__pendingString[1] = missing - len( data )
+      return ""
+    parts.append( data[ :missing ] )
+    self.__pendingString = None
+    value = "".join( parts )
+    if dataType == "u":
+      value = unicode( value, 'utf-8' )
+    self.__addValue( value )
+    return data[ missing: ]
+
+  def __decodeBuffer( self ):
+    data = self.__buffer
+    dataLen = len( data )
+    i = self.__position
+    stack = self.__stack
+    while i < dataLen:
+      dataType = data[ i ]
+      if dataType == "s":
+        colon = data.find( ":", i + 1 )
+        if colon == -1:
+          break
+        start = colon + 1
+        end = start + int( data[ i + 1 : colon ] )
+        if end > dataLen:
+          #Keep the parts instead of growing the buffer with a big string
+          self.__pendingString = [ dataType, end - dataLen, [ data[ start: ] ] ]
+          i = dataLen
+          break
+        value = data[ start : end ]
+        i = end
+      elif dataType == "i":
+        end = data.find( "e", i + 1 )
+        if end == -1:
+          break
+        value = int( data[ i + 1 : end ] )
+        i = end + 1
+      elif dataType == "d":
+        stack.append( [ dataType, {}, False, None ] )
+        i += 1
+        continue
+      elif dataType == "l" or dataType == "t":
+        stack.append( [ dataType, [], False, None ] )
+        i += 1
+        continue
+      elif dataType == "e":
+        if not stack or stack[-1][0] == "z":
+          raise ValueError( "Unexpected end of container at position %s" % i )
+        container = stack.pop()
+        if container[0] == "t":
+          value = tuple( container[1] )
+        else:
+          value = container[1]
+        i += 1
+      elif dataType == "I":
+        end = data.find( "e", i + 1 )
+        if end == -1:
+          break
+        value = long( data[ i + 1 : end ] )
+        i = end + 1
+      elif dataType == "f":
+        end = data.find( "e", i + 1 )
+        if end == -1:
+          break
+        #Floats may come with an exponent as in f2e+20e
+        if end + 1 == dataLen and not self.__ended:
+          break
+        if end + 1 < dataLen and data[ end + 1 ] in ( '+', '-' ):
+          expEnd = data.find( "e", end + 1 )
+          if expEnd == -1:
+            break
+          value = float( data[ i + 1 : end ] ) * 10 ** int( data[ end + 1 : expEnd ] )
+          end = expEnd
+        else:
+          value = float( data[ i + 1 : end ] )
+        i = end + 1
+      elif dataType == "b":
+        if i + 1 == dataLen:
+          break
+        value = data[ i + 1 ] != "0"
+        i += 2
+      elif dataType == "n":
+        value = None
+        i += 1
+      elif dataType == "u":
+        colon = data.find( ":", i + 1 )
+        if colon == -1:
+          break
+        start = colon + 1
+        end = start + int( data[ i + 1 : colon ] )
+        if end > dataLen:
+          self.__pendingString = [ dataType, end - dataLen, [ data[ start: ] ] ]
+          i = dataLen
+          break
+        value = unicode( data[ start : end ], 'utf-8' )
+        i = end
+      elif dataType == "z":
+        if i + 1 == dataLen:
+          break
+        stack.append( [ dataType, data[ i + 1 ], False, None ] )
+        i += 2
+        continue
+      else:
+        raise ValueError( "Unknown data type %s" % dataType )
+      #Fast path for values inside lists and dicts
+      if stack:
+        container = stack[-1]
+        cType = container[0]
+        if cType == "d":
+          if container[2]:
+            container[1][ container[3] ] = value
+            container[2] = False
+          else:
+            container[2] = True
+            container[3] = value
+          continue
+        if cType != "z":
+          container[1].append( value )
+          continue
+      self.__addValue( value )
+      if self.__finished:
+        break
+    self.__position = i
+    if self.__finished and i < dataLen:
+      raise ValueError( "Extra data after the end of the encoded object" )
+
+  def __addValue( self, value ):
+    stack = self.__stack
+    while stack:
+      container = stack[-1]
+      cType = container[0]
+      if cType == "d":
+        if container[2]:
+          container[1][ container[3] ] = value
+          container[2] = False
+          container[3] = None
+        else:
+          container[2] = True
+          container[3] = value
+        return
+      if cType != "z":
+        container[1].append( value )
+        return
+      #Datetimes are encoded as a type char followed by a tuple
+      stack.pop()
+      if container[1] == 'a':
+        value = datetime.datetime( *value )
+      elif container[1] == 'd':
+        value = datetime.date( *value )
+      elif container[1] == 't':
+        value = datetime.time( *value )
+      else:
+        raise ValueError( "Unexpected type %s while decoding a datetime object" % container[1] )
+    self.__value = value
+    self.__finished = True
+
+
 if __name__ == "__main__":
   gObject = {2:"3", True : ( 3, None ), 2.0 * 10 ** 20 : 2.0 * 10 ** -10 }
   print "Initial: %s" % gObject
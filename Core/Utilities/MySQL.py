@@ -32,9 +32,10 @@
     Returns S_OK or S_ERROR.
 
 
-    _query( cmd, [conn] )
+    _query( cmd, [conn], [args] )
 
-    Executes SQL command "cmd".
+    Executes SQL command "cmd". If a tuple of values "args" is given, they are
+    escaped and substituted to the %s placeholders of "cmd" by the driver.
     Gets a connection from the Queue (or open a new one if none is available),
     the used connection is  back into the Queue.
     If a connection to the the DB is passed as second argument this connection
@@ -42,9 +43,16 @@
     Returns S_OK with fetchall() out in Value or S_ERROR upon failure.
 
 
-    _update( cmd, [conn] )
+    _queryIter( cmd, [chunkSize], [args] )
 
-    Executes SQL command "cmd" and issue a commit
+    Generator executing SQL command "cmd", "args" as for _query. The result set is
+    kept on the server side and read through a connection out of the Queue, yields
+    S_OK with tuples of at most chunkSize rows or S_ERROR upon failure.
+
+
+    _update( cmd, [conn], [args] )
+
+    Executes SQL command "cmd" and issue a commit, "args" as for _query
     Gets a connection from the Queue (or open a new one if none is available),
     the used connection is  back into the Queue.
     If a connection to the the DB is passed as second argument this connection
@@ -158,6 +166,7 @@ from DIRAC                                  import S_OK, S_ERROR
 from DIRAC                                  import Time
 
 import MySQLdb
+import MySQLdb.cursors
 # This is for proper initialization of embeded server, it should only be called once
 MySQLdb.server_init( ['--defaults-file=/opt/dirac/etc/my.cnf', '--datadir=/opt/mysql/db'], ['mysqld'] )
 gInstancesCount = 0
@@ -171,6 +180,12 @@ import threading
 from types import StringTypes, DictType, ListType
 
 MAXCONNECTRETRY = 10
+# Connections idle for less than this number of seconds are used without pinging the server
+PINGIDLETIME = 30
+# Client errors for a connection closed by the server: "gone away" and "lost connection".
+# After the latter the statement may have been executed
+SERVERGONEERROR = 2006
+LOSTCONNECTIONERRORS = ( SERVERGONEERROR, 2013 )
 
 def _checkQueueSize( maxQueueSize ):
   """
@@ -230,15 +245,18 @@ class MySQL:
     Management of connections per thread
     """
 
-    def __init__( self, host, user, passwd, port = 3306, graceTime = 600 ):
+    def __init__( self, host, user, passwd, port = 3306, graceTime = 600, pingIdleTime = PINGIDLETIME ):
       self.__host = host
       self.__user = user
       self.__passwd = passwd
       self.__port = port
       self.__graceTime = graceTime
+      self.__pingIdleTime = pingIdleTime
+      self.__cleanPeriod = min( 60, graceTime )
       self.__spares = collections.deque()
       self.__maxSpares = 10
       self.__lastClean = 0
+      #thread -> [ connection, dbName, last use, in transaction ]
       self.__assigned = {}
 
     @property
@@ -263,7 +281,9 @@ class MySQL:
 
     def get( self, dbName, retries = 10 ):
       retries = max( 0, min( MAXCONNECTRETRY, retries ) )
-      self.clean()
+      now = time.time()
+      if now - self.__lastClean > self.__cleanPeriod:
+        self.clean( now )
       return self.__getWithRetry( dbName, retries, retries )
 
 
@@ -272,13 +292,14 @@ class MySQL:
       if sleepTime > 0:
         time.sleep( sleepTime )
       try:
-        conn, lastName, thid = self.__innerGet()
+        conn, lastName, thid, idleTime = self.__innerGet()
       except MySQLdb.MySQLError, excp:
         if retriesLeft >= 0:
           return self.__getWithRetry( dbName, totalRetries, retriesLeft - 1 )
         return S_ERROR( "Could not connect: %s" % excp )
 
-      if not self.__ping( conn ):
+      #Only check connections that have been idle for a while, a recently used one is most likely alive
+      if idleTime > self.__pingIdleTime and not self.__ping( conn ):
         try:
           self.__assigned.pop( thid )
         except KeyError:
@@ -315,29 +336,90 @@ class MySQL:
       now = time.time()
       if thid in self.__assigned:
         data = self.__assigned[ thid ]
-        conn = data[0]
+        idleTime = now - data[2]
         data[2] = now
-        return data[0], data[1], thid
+        return data[0], data[1], thid, idleTime
       # Not cached
       try:
-        conn, dbName = self.__spares.pop()
+        conn, dbName, lastUse = self.__spares.pop()
+        idleTime = now - lastUse
       except IndexError:
         conn = self.__newConn()
         dbName = ""
+        idleTime = 0
 
-      self.__assigned[ thid ] = [ conn, dbName, now ]
-      return conn, dbName, thid
+      self.__assigned[ thid ] = [ conn, dbName, now, False ]
+      return conn, dbName, thid, idleTime
 
     def __pop( self, thid ):
       try:
         data = self.__assigned.pop( thid )
         if len( self.__spares ) < self.__maxSpares:
-          self.__spares.append( ( data[0], data[1] ) )
+          self.__spares.append( ( data[0], data[1], data[2] ) )
         else:
           data[ 0 ].close()
       except KeyError:
         pass
 
+    def discardLost( self, excp, readOnly = False ):
+      """
+      Drop the connection of the current thread if the exception says the server closed it.
+      Returns True if the statement can be retried with a new connection: out of a transaction
+      and either read only or not sent to the server
+      """
+      if not isinstance( excp, MySQLdb.OperationalError ) or not excp.args or \
+         excp.args[0] not in LOSTCONNECTIONERRORS:
+        return False
+      try:
+        data = self.__assigned.pop( self.__thid )
+      except KeyError:
+        return False
+      try:
+        data[0].close()
+      except Exception:
+        pass
+      return not data[3] and ( readOnly or excp.args[0] == SERVERGONEERROR )
+
+    def __setInTransaction( self, inTransaction ):
+      try:
+        self.__assigned[ self.__thid ][3] = inTransaction
+      except KeyError:
+        pass
+
+    def getDedicated( self, dbName ):
+      """
+      Get a connection not assigned to the current thread, e.g. to stream a result set
+      while the thread keeps querying with its own one. Give it back with putDedicated
+      """
+      now = time.time()
+      try:
+        conn, lastName, lastUse = self.__spares.pop()
+        if now - lastUse > self.__pingIdleTime and not self.__ping( conn ):
+          conn, lastName = self.__newConn(), ""
+      except IndexError:
+        try:
+          conn, lastName = self.__newConn(), ""
+        except MySQLdb.MySQLError, excp:
+          return S_ERROR( "Could not connect: %s" % excp )
+      except MySQLdb.MySQLError, excp:
+        return S_ERROR( "Could not connect: %s" % excp )
+      if lastName != dbName:
+        try:
+          conn.select_db( dbName )
+        except MySQLdb.MySQLError, excp:
+          conn.close()
+          return S_ERROR( "Could not select db %s: %s" % ( dbName, excp ) )
+      return S_OK( conn )
+
+    def putDedicated( self, conn, dbName ):
+      """
+      Give back a connection obtained with getDedicated
+      """
+      if len( self.__spares ) < self.__maxSpares:
+        self.__spares.append( ( conn, dbName, time.time() ) )
+      else:
+        conn.close()
+
     def clean( self, now = False ):
       if not now:
         now = time.time()
@@ -358,7 +440,12 @@ class MySQL:
         return result
       conn = result[ 'Value' ]
       try:
-        return S_OK( self.__execute( conn, "START TRANSACTION WITH CONSISTENT SNAPSHOT" ) )
+        #Don't go through __execute: the commit it issues would end the transaction right away
+        cursor = conn.cursor()
+        result = cursor.execute( "START TRANSACTION WITH CONSISTENT SNAPSHOT" )
+        cursor.close()
+        self.__setInTransaction( True )
+        return S_OK( result )
       except MySQLdb.MySQLError, excp:
         return S_ERROR( "Could not begin transaction: %s" % excp )
 
@@ -367,6 +454,7 @@ class MySQL:
       if not result[ 'OK' ]:
         return result
       conn = result[ 'Value' ]
+      self.__setInTransaction( False )
       try:
         result = self.__execute( conn, "COMMIT" )
         return S_OK( result )
@@ -378,6 +466,7 @@ class MySQL:
       if not result[ 'OK' ]:
         return result
       conn = result[ 'Value' ]
+      self.__setInTransaction( False )
       try:
         result = self.__execute( conn, "ROLLBACK" )
         return S_OK( result )
@@ -386,7 +475,8 @@ class MySQL:
 
   __connectionPools = {}
 
-  def __init__( self, hostName, userName, passwd, dbName, port = 3306, maxQueueSize = 3, debug = False ):
+  def __init__( self, hostName, userName, passwd, dbName, port = 3306, maxQueueSize = 3, debug = False,
+                pingIdleTime = PINGIDLETIME ):
     """
     set MySQL connection parameters and try to connect
     """
@@ -412,7 +502,7 @@ class MySQL:
     self.__port = port
     cKey = ( self.__hostName, self.__userName, self.__passwd, self.__port )
     if cKey not in MySQL.__connectionPools:
-      MySQL.__connectionPools[ cKey ] = MySQL.ConnectionPool( *cKey )
+      MySQL.__connectionPools[ cKey ] = MySQL.ConnectionPool( *cKey, pingIdleTime = pingIdleTime )
     self.__connectionPool = MySQL.__connectionPools[ cKey ]
 
     self.__initialized = True
@@ -456,13 +546,9 @@ class MySQL:
     To be used for escaping any MySQL string before passing it to the DB
     this should prevent passing non-MySQL accepted characters to the DB
     It also includes quotation marks " around the given string
+    The escaping does not depend on the connection, so none is needed
     """
 
-    retDict = self.__getConnection()
-    if not retDict['OK']:
-      return retDict
-    connection = retDict['Value']
-
     specialValues = ( 'UTC_TIMESTAMP', 'TIMESTAMPADD', 'TIMESTAMPDIFF' )
 
     try:
@@ -474,7 +560,7 @@ class MySQL:
       for sV in specialValues:
         if myString.find( sV ) == 0:
           return S_OK( myString )
-      escape_string = connection.escape_string( str( myString ) )
+      escape_string = MySQLdb.escape_string( myString )
       self.log.debug( '__escape_string: returns', '"%s"' % escape_string )
       return S_OK( '"%s"' % escape_string )
     except Exception, x:
@@ -565,9 +651,10 @@ class MySQL:
       return self._except( '_connect', x, 'Could not connect to DB.' )
 
 
-  def _query( self, cmd, conn = None, debug = False ):
+  def _query( self, cmd, conn = None, debug = False, args = None ):
     """
     execute MySQL query command
+    if args is given, its values are substituted to the %s placeholders of cmd
     return S_OK structure with fetchall result as tuple
     it returns an empty tuple if no matching rows are found
     return S_ERROR upon error
@@ -583,36 +670,44 @@ class MySQL:
     if gDebugFile:
       start = time.time()
 
-    retDict = self.__getConnection()
-    if not retDict['OK']:
-      return retDict
-    connection = retDict[ 'Value' ]
+    for retry in ( True, False ):
+      retDict = self.__getConnection()
+      if not retDict['OK']:
+        return retDict
+      connection = retDict[ 'Value' ]
+      try:
+        cursor = connection.cursor()
+        if cursor.execute( cmd, args ):
+          res = cursor.fetchall()
+        else:
+          res = ()
+        break
+      except Exception, x:
+        # The connection was not checked before use, get a new one if the server closed it
+        if retry and self.__connectionPool.discardLost( x, readOnly = True ):
+          continue
+        self.log.warn( '_query:', cmd )
+        try:
+          cursor.close()
+        except Exception:
+          pass
+        return self._except( '_query', x, 'Execution failed.' )
 
-    try:
-      cursor = connection.cursor()
-      if cursor.execute( cmd ):
-        res = cursor.fetchall()
+    # Log the result limiting it to just 10 records
+    if len( res ) <= 10:
+      if debug:
+        self.logger.debug( '_query: returns', res )
       else:
-        res = ()
-
-      # Log the result limiting it to just 10 records
-      if len( res ) <= 10:
-        if debug:
-          self.logger.debug( '_query: returns', res )
-        else:
-          self.logger.verbose( '_query: returns', res )
+        self.logger.verbose( '_query: returns', res )
+    else:
+      if debug:
+        self.logger.debug( '_query: Total %d records returned' % len( res ) )
+        self.logger.debug( '_query: %s ...' % str( res[:10] ) )
       else:
-        if debug:
-          self.logger.debug( '_query: Total %d records returned' % len( res ) )
-          self.logger.debug( '_query: %s ...' % str( res[:10] ) )
-        else:
-          self.logger.verbose( '_query: Total %d records returned' % len( res ) )
-          self.logger.verbose( '_query: %s ...' % str( res[:10] ) )
+        self.logger.verbose( '_query: Total %d records returned' % len( res ) )
+        self.logger.verbose( '_query: %s ...' % str( res[:10] ) )
 
-      retDict = S_OK( res )
-    except Exception , x:
-      self.log.warn( '_query:', cmd )
-      retDict = self._except( '_query', x, 'Execution failed.' )
+    retDict = S_OK( res )
 
     try:
       cursor.close()
@@ -626,8 +721,75 @@ class MySQL:
     return retDict
 
 
-  def _update( self, cmd, conn = None, debug = False ):
+  def _queryIter( self, cmd, chunkSize = 1000, args = None ):
+    """
+    execute MySQL query command keeping the result set on the server side,
+    "args" as for _query
+    it is a generator yielding S_OK structures with tuples of at most chunkSize rows,
+    so the result is never held as a whole in memory.
+    it yields an S_ERROR and stops upon error
+    The rows are read through a connection of their own, the thread connection can
+    be used to query while iterating. Do not update the tables being read meanwhile
+    """
+    if self.logger._minLevel == self.logger._logLevels.getLevelValue( 'DEBUG' ):
+      self.logger.verbose( '_queryIter:', cmd )
+    else:
+      self.logger.verbose( '_queryIter:', cmd[:min( len( cmd ) , 512 )] )
+
+    if not self.__initialized:
+      error = 'DB not properly initialized'
+      gLogger.error( error )
+      yield S_ERROR( error )
+      return
+
+    retDict = self.__connectionPool.getDedicated( self.__dbName )
+    if not retDict['OK']:
+      yield retDict
+      return
+    connection = retDict['Value']
+    cursor = None
+    exhausted = False
+    nRows = 0
+    try:
+      try:
+        cursor = connection.cursor( MySQLdb.cursors.SSCursor )
+        cursor.execute( cmd, args )
+      except Exception, x:
+        self.log.warn( '_queryIter:', cmd )
+        yield self._except( '_queryIter', x, 'Execution failed.' )
+        return
+      while True:
+        try:
+          rows = cursor.fetchmany( chunkSize )
+        except Exception, x:
+          self.log.warn( '_queryIter:', cmd )
+          yield self._except( '_queryIter', x, 'Fetching rows failed.' )
+          return
+        if not rows:
+          exhausted = True
+          break
+        nRows += len( rows )
+        yield S_OK( rows )
+      self.logger.verbose( '_queryIter: Total %d records returned' % nRows )
+    finally:
+      # Closing an unbuffered cursor reads whatever is left of the result set,
+      # when the iteration is given up the connection is dropped instead
+      if exhausted:
+        try:
+          cursor.close()
+        except Exception:
+          pass
+        self.__connectionPool.putDedicated( connection, self.__dbName )
+      else:
+        try:
+          connection.close()
+        except Exception:
+          pass
+
+
+  def _update( self, cmd, conn = None, debug = False, args = None ):
     """ execute MySQL update command
+        if args is given, its values are substituted to the %s placeholders of cmd
         return S_OK with number of updated registers upon success
         return S_ERROR upon error
     """
@@ -642,25 +804,30 @@ class MySQL:
     if gDebugFile:
       start = time.time()
 
-    retDict = self.__getConnection( conn = conn )
-    if not retDict['OK']:
-      return retDict
-    connection = retDict['Value']
-
-    try:
-      cursor = connection.cursor()
-      res = cursor.execute( cmd )
-      # connection.commit()
-      if debug:
-        self.log.debug( '_update:', res )
-      else:
-        self.log.verbose( '_update:', res )
-      retDict = S_OK( res )
-      if cursor.lastrowid:
-        retDict[ 'lastRowId' ] = cursor.lastrowid
-    except Exception, x:
-      self.log.warn( '_update: %s: %s' % ( cmd, str( x ) ) )
-      retDict = self._except( '_update', x, 'Execution failed.' )
+    for retry in ( True, False ):
+      retDict = self.__getConnection( conn = conn )
+      if not retDict['OK']:
+        return retDict
+      connection = retDict['Value']
+      try:
+        cursor = connection.cursor()
+        res = cursor.execute( cmd, args )
+        # connection.commit()
+        if debug:
+          self.log.debug( '_update:', res )
+        else:
+          self.log.verbose( '_update:', res )
+        retDict = S_OK( res )
+        if cursor.lastrowid:
+          retDict[ 'lastRowId' ] = cursor.lastrowid
+        break
+      except Exception, x:
+        # The connection was not checked before use, get a new one if the server closed it
+        if retry and self.__connectionPool.discardLost( x ):
+          continue
+        self.log.warn( '_update: %s: %s' % ( cmd, str( x ) ) )
+        retDict = self._except( '_update', x, 'Execution failed.' )
+        break
 
     try:
       cursor.close()
@@ -701,7 +868,7 @@ class MySQL:
         cmdRet.append( ( cmd, cursor.execute( cmd ) ) )
       connection.commit()
     except Exception, error:
-      self.logger.execption( error )
+      self.logger.exception( error )
       # # rollback, put back connection to the pool
       connection.rollback()
       return S_ERROR( error )
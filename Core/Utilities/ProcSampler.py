@@ -0,0 +1,263 @@
+########################################################################
+# $Id$
+# File :   ProcSampler.py
+########################################################################
+
+""" The ProcSampler reads the resource consumption of a process tree directly
+    from the /proc file system (and from the cgroup of the process when the
+    cgroup v1 or v2 memory controller is mounted) without forking any command.
+
+    One call to sample() walks /proc once and returns a snapshot with the CPU
+    consumed by the process, its children and the processes of its group, the
+    resident and proportional memory, the IO counters, the load average, the
+    node memory used and the available disk space. The sampler keeps the peak
+    memory values seen over its lifetime.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import resource
+
+from DIRAC import S_OK, S_ERROR
+
+try:
+  CLOCK_TICKS = float( os.sysconf( 'SC_CLK_TCK' ) )
+except ( AttributeError, ValueError, OSError ):
+  CLOCK_TICKS = 100.
+try:
+  PAGE_SIZE_KB = os.sysconf( 'SC_PAGE_SIZE' ) / 1024
+except ( AttributeError, ValueError, OSError ):
+  PAGE_SIZE_KB = 4
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+def _readFile( path ):
+  """ Content of a (small) file or None if it can not be read
+  """
+  try:
+    fd = open( path, 'r' )
+    try:
+      return fd.read()
+    finally:
+      fd.close()
+  except ( IOError, OSError ):
+    return None
+
+def _readKeyValues( path, separator = ':' ):
+  """ Parse 'key<separator> value [unit]' lines into a dictionary of integers
+  """
+  content = _readFile( path )
+  if content is None:
+    return {}
+  values = {}
+  for line in content.split( '\n' ):
+    key, _sep, value = line.partition( separator )
+    try:
+      values[key.strip()] = int( value.split()[0] )
+    except ( IndexError, ValueError ):
+      continue
+  return values
+
+def getProcessTable():
+  """ Read /proc/<pid>/stat of all the processes.
+      Returns { pid : ( ppid, pgrp, cpuSeconds, rssKB ) }, the CPU including the
+      one of the already terminated children
+  """
+  table = {}
+  for entry in os.listdir( '/proc' ):
+    if not entry.isdigit():
+      continue
+    stat = _readFile( '/proc/%s/stat' % entry )
+    if not stat:
+      continue
+    # The command name can contain spaces, the fields start after its closing bracket
+    fields = stat[stat.rfind( ')' ) + 2:].split()
+    try:
+      ticks = int( fields[11] ) + int( fields[12] ) + int( fields[13] ) + int( fields[14] )
+      table[int( entry )] = ( int( fields[1] ), int( fields[2] ), ticks / CLOCK_TICKS, int( fields[21] ) * PAGE_SIZE_KB )
+    except ( IndexError, ValueError ):
+      continue
+  return table
+
+def getProcessTree( pid, table = None ):
+  """ Process IDs of the given process, of all its descendants and of the
+      orphans left in its process group
+  """
+  if table is None:
+    table = getProcessTable()
+  if pid not in table:
+    return []
+  children = {}
+  for childPID, info in table.items():
+    children.setdefault( info[0], [] ).append( childPID )
+  tree = set( [pid] )
+  toVisit = [pid]
+  while toVisit:
+    for childPID in children.get( toVisit.pop(), [] ):
+      if childPID not in tree:
+        tree.add( childPID )
+        toVisit.append( childPID )
+  pgrp = table[pid][1]
+  for otherPID, info in table.items():
+    if info[1] == pgrp:
+      tree.add( otherPID )
+  return sorted( tree )
+
+def getLoadAverage():
+  """ 1 minute load average of the node
+  """
+  content = _readFile( '/proc/loadavg' )
+  if not content:
+    return S_ERROR( 'Could not read /proc/loadavg' )
+  try:
+    return S_OK( float( content.split()[0] ) )
+  except ValueError:
+    return S_ERROR( 'Could not parse /proc/loadavg' )
+
+def getMemoryUsed():
+  """ Memory used on the node in kB, as reported by free in the 'used' column
+  """
+  memInfo = _readKeyValues( '/proc/meminfo' )
+  if 'MemTotal' not in memInfo or 'MemFree' not in memInfo:
+    return S_ERROR( 'Could not read /proc/meminfo' )
+  return S_OK( float( memInfo['MemTotal'] - memInfo['MemFree'] ) )
+
+def getDiskSpace( path = '.' ):
+  """ Free disk space in MB in the partition containing the path
+  """
+  try:
+    stat = os.statvfs( path )
+  except OSError, x:
+    return S_ERROR( 'Could not get disk space for %s: %s' % ( path, str( x ) ) )
+  return S_OK( float( stat.f_bavail * stat.f_frsize ) / 1024. / 1024. )
+
+def getCGroupMemoryPaths( pid ):
+  """ Files giving the current and the peak memory usage of the cgroup of the process,
+      ( None, None ) if no memory controller is available
+  """
+  content = _readFile( '/proc/%s/cgroup' % pid )
+  if not content:
+    return ( None, None )
+  for line in content.split( '\n' ):
+    fields = line.split( ':', 2 )
+    if len( fields ) != 3:
+      continue
+    hierarchy, controllers, path = fields
+    if hierarchy == '0' and not controllers:
+      # cgroup v2 unified hierarchy
+      cgroupDir = os.path.join( CGROUP_ROOT, path.lstrip( '/' ) )
+      usage = os.path.join( cgroupDir, 'memory.current' )
+      peak = os.path.join( cgroupDir, 'memory.peak' )
+    elif 'memory' in controllers.split( ',' ):
+      # cgroup v1 memory controller
+      cgroupDir = os.path.join( CGROUP_ROOT, 'memory', path.lstrip( '/' ) )
+      usage = os.path.join( cgroupDir, 'memory.usage_in_bytes' )
+      peak = os.path.join( cgroupDir, 'memory.max_usage_in_bytes' )
+    else:
+      continue
+    if os.path.exists( usage ):
+      if not os.path.exists( peak ):
+        peak = None
+      return ( usage, peak )
+  return ( None, None )
+
+class ProcSampler:
+
+  def __init__( self, pid, path = '.' ):
+    """ Constructor, takes the PID of the process to monitor and the directory
+        where to check the available disk space
+    """
+    self.pid = int( pid )
+    self.path = path
+    self.cgroupUsage, self.cgroupPeak = getCGroupMemoryPaths( self.pid )
+    # smaps_rollup is only available on recent kernels, check it once on this process rather than
+    # on the monitored ones which can exit at any time
+    self.pssAvailable = os.path.exists( '/proc/self/smaps_rollup' )
+    self.peaks = {}
+
+  def __updatePeak( self, snapshot, key, peakKey ):
+    if key in snapshot:
+      self.peaks[peakKey] = max( self.peaks.get( peakKey, 0 ), snapshot[key] )
+
+  def __getPSS( self, pid ):
+    if not self.pssAvailable:
+      return None
+    # Empty if the process has exited meanwhile or belongs to another user
+    return _readKeyValues( '/proc/%s/smaps_rollup' % pid ).get( 'Pss' )
+
+  def __getCGroupMemory( self, path ):
+    content = _readFile( path )
+    try:
+      return int( content ) / 1024
+    except ( TypeError, ValueError ):
+      return None
+
+  def sample( self ):
+    """ Take a snapshot of the resources used by the process tree.
+        Memory values are in kB, IO counters in bytes and the disk space in MB.
+    """
+    table = getProcessTable()
+    pidList = getProcessTree( self.pid, table )
+    if not pidList:
+      return S_ERROR( 'Process %s does not exist' % self.pid )
+
+    snapshot = { 'PIDs' : pidList, 'CPUConsumed' : 0., 'RSS' : 0, 'ReadBytes' : 0, 'WriteBytes' : 0 }
+    pss = 0
+    for pid in pidList:
+      _ppid, _pgrp, cpu, rss = table[pid]
+      snapshot['CPUConsumed'] += cpu
+      snapshot['RSS'] += rss
+      if pss is not None:
+        pidPSS = self.__getPSS( pid )
+        if pidPSS is None:
+          # Do not report a partial sum
+          pss = None
+        else:
+          pss += pidPSS
+      # The IO counters are only readable for the processes of the same user
+      io = _readKeyValues( '/proc/%s/io' % pid )
+      snapshot['ReadBytes'] += io.get( 'read_bytes', 0 )
+      snapshot['WriteBytes'] += io.get( 'write_bytes', 0 )
+    if pss is not None:
+      snapshot['PSS'] = pss
+
+    if self.cgroupUsage:
+      usage = self.__getCGroupMemory( self.cgroupUsage )
+      if usage is not None:
+        snapshot['CGroupMemory'] = usage
+      if self.cgroupPeak:
+        peak = self.__getCGroupMemory( self.cgroupPeak )
+        if peak is not None:
+          snapshot['CGroupMemoryPeak'] = peak
+
+    # Largest resident size of the children already waited for, in kB on Linux
+    childrenMaxRSS = resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss
+    if childrenMaxRSS:
+      snapshot['ChildrenMaxRSS'] = childrenMaxRSS
+
+    for key, method in ( ( 'LoadAverage', getLoadAverage ), ( 'MemoryUsed', getMemoryUsed ) ):
+      result = method()
+      if result['OK']:
+        snapshot[key] = result['Value']
+    result = getDiskSpace( self.path )
+    if result['OK']:
+      snapshot['DiskSpace'] = result['Value']
+
+    self.__updatePeak( snapshot, 'RSS', 'MaxRSS' )
+    self.__updatePeak( snapshot, 'ChildrenMaxRSS', 'MaxRSS' )
+    self.__updatePeak( snapshot, 'PSS', 'MaxPSS' )
+    self.__updatePeak( snapshot, 'CGroupMemory', 'MaxCGroupMemory' )
+    self.__updatePeak( snapshot, 'CGroupMemoryPeak', 'MaxCGroupMemory' )
+    snapshot.update( self.peaks )
+    return S_OK( snapshot )
+
+  def getPeaks( self ):
+    """ Peak memory values ( MaxRSS, MaxPSS, MaxCGroupMemory ) seen so far in kB
+    """
+    childrenMaxRSS = resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss
+    if childrenMaxRSS:
+      self.peaks['MaxRSS'] = max( self.peaks.get( 'MaxRSS', 0 ), childrenMaxRSS )
+    return dict( self.peaks )
+
+#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#
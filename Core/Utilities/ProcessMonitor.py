@@ -10,7 +10,7 @@
 """
 
 from DIRAC import gLogger, S_OK, S_ERROR
-from DIRAC.Core.Utilities.Subprocess import shellCall
+from DIRAC.Core.Utilities.ProcSampler import getProcessTable, getProcessTree
 
 __RCSID__ = "$Id$"
 
@@ -40,95 +40,28 @@ class ProcessMonitor:
   #############################################################################
   def getCPUConsumedLinux( self, pid ):
     """Returns the CPU consumed given a PID assuming a proc file system exists.
+       The process table is read once from /proc, the CPU of the process, of all
+       its descendants and of the orphan processes in the same process group is
+       added up.
     """
     masterProcPath = '/proc/%s/stat' % ( pid )
     if not os.path.exists( masterProcPath ):
       return S_ERROR( 'Process %s does not exist' % ( pid ) )
 
-    #Get the current process list
-    pidListResult = self.__getProcListLinux()
-    if not pidListResult['OK']:
-      return pidListResult
+    try:
+      procTable = getProcessTable()
+    except OSError, x:
+      return S_ERROR( 'Could not read the process table: %s' % str( x ) )
 
-    pidList = pidListResult['Value']
     currentCPU = 0
-    #Now recursively add all child process CPU contributions
-    childCPUResult = self.__getChildCPUConsumedLinux( pid, pidList )
-    currentCPU += childCPUResult
-
-    procGroup = self.__getProcGroupLinux( pid )
-    if not procGroup['OK']:
-      return procGroup
-
-    procGroup = procGroup['Value'].strip()
-
-    #Next add any contributions from orphan processes in same process group
-    for pidCheck in pidList:
-      info = self.__getProcInfoLinux( pidCheck )
-      if info['OK']:
-        info = info['Value']
-        if info[4] == procGroup:
-          contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-          currentCPU += contribution
-          self.log.debug( 'Added %s to CPU total (now %s) from orphan PID %s %s' % ( contribution, currentCPU, info[0], info[1] ) )
+    for pidCheck in getProcessTree( int( pid ), procTable ):
+      contribution = procTable[pidCheck][2]
+      currentCPU += contribution
+      self.log.debug( 'Added %s to CPU total (now %s) from PID %s' % ( contribution, currentCPU, pidCheck ) )
 
     self.log.verbose( 'Final CPU estimate is %s' % currentCPU )
     return S_OK( currentCPU )
 
-  #############################################################################
-  def __getProcListLinux( self ):
-    """Gets list of process IDs from /proc/*.
-    """
-    result = shellCall( 10, 'ls -d /proc/[0-9]*' )
-
-    if not result['OK']:
-      if not 'Value' in result:
-        return result
-    procList = result['Value'][1].replace( '/proc', '' ).split( '\n' )
-
-    return S_OK( procList )
-
-  #############################################################################
-  def __getChildCPUConsumedLinux( self, pid, pidList ):
-    """Adds contributions to CPU total from child processes recursively.
-    """
-    childCPU = 0
-    for pidCheck in pidList:
-      info = self.__getProcInfoLinux( pidCheck )
-      if info['OK']:
-        info = info['Value']
-        if info[3] == pid:
-          contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-          childCPU += contribution
-          self.log.debug( 'Added %s to CPU total (now %s) from child PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-          childCPU += self.__getChildCPUConsumedLinux( pidCheck, pidList )
-
-    return childCPU
-
-  #############################################################################
-  def __getProcInfoLinux( self, pid ):
-    """Attempts to read /proc/PID/stat and returns list of items if ok.
-    """
-    procPath = '/proc/%s/stat' % ( pid )
-    try:
-      fopen = open( procPath, 'r' )
-      procStat = fopen.readline()
-      fopen.close()
-    except Exception:
-      return S_ERROR( 'Not able to check %s' % pid )
-    return S_OK( procStat.split( ' ' ) )
-
-  #############################################################################
-  def __getProcGroupLinux( self, pid ):
-    """Returns UID for given PID.
-    """
-    result = shellCall( 10, 'ps --no-headers -o pgrp -p %s' % ( pid ) )
-    if not result['OK']:
-      if  not 'Value' in result:
-        return result
-
-    return S_OK( result['Value'][1] )
-
   #############################################################################
   def __checkCurrentOS( self ):
     """Checks it is possible to determine CPU consumed with this utility
@@ -0,0 +1,99 @@
+########################################################################
+# $HeadURL $
+# File: DEncodeBenchmark.py
+########################################################################
+""" :mod: DEncodeBenchmark
+    =======================
+
+    .. module: DEncodeBenchmark
+    :synopsis: timing of DEncode encoding, decoding and stream decoding
+
+    Run it with python DEncodeBenchmark.py [repetitions]. For each sample it prints the encoded
+    size and the best time out of the repetitions for encode, decode and StreamDecoder fed in
+    transport sized chunks.
+"""
+__RCSID__ = "$Id$"
+# # imports
+import sys
+import time
+import datetime
+# # SUT
+from DIRAC.Core.Utilities import DEncode
+
+def lfnList( nFiles ):
+  """ list of LFNs as in replica and transformation file lists """
+  return [ "/lhcb/LHCb/Collision12/BHADRON.MDST/00020198/0000/00020198_%08d_1.bhadron.mdst" % i
+           for i in range( nFiles ) ]
+
+def replicasResult( nFiles ):
+  """ getReplicas like result """
+  successful = {}
+  for lfn in lfnList( nFiles ):
+    successful[ lfn ] = { "CERN-DST" : "srm://srm-eoslhcb.cern.ch/eos/lhcb/grid/prod%s" % lfn,
+                          "GRIDKA-DST" : "srm://gridka-dCache.fzk.de/pnfs/gridka.de/lhcb%s" % lfn }
+  return { "OK" : True, "Value" : { "Successful" : successful, "Failed" : {} } }
+
+def transformationFiles( nFiles ):
+  """ getTransformationFiles like result """
+  now = datetime.datetime.utcnow()
+  return { "OK" : True, "Value" : [ { "LFN" : lfn, "FileID" : 1234567890123L + i, "TransformationID" : 20198L,
+                                      "Status" : "Assigned", "TaskID" : i / 10, "TargetSE" : "CERN-DST",
+                                      "UsedSE" : "", "ErrorCount" : 0, "LastUpdate" : now,
+                                      "InsertedTime" : now }
+                                    for i, lfn in enumerate( lfnList( nFiles ) ) ] }
+
+def nestedDicts( depth, width ):
+  """ deeply nested dictionaries """
+  if not depth:
+    return { "int" : 1, "long" : 1L << 40, "float" : 0.5, "str" : "leaf" }
+  return dict( [ ( "level%s_%s" % ( depth, i ), nestedDicts( depth - 1, width ) ) for i in range( width ) ] )
+
+def dateTimes( nItems ):
+  """ lists of datetimes and longs """
+  now = datetime.datetime.utcnow()
+  return [ ( now + datetime.timedelta( seconds = i ), now.date(), now.time(), 10L ** 20 + i )
+           for i in range( nItems ) ]
+
+SAMPLES = [ ( "nested dicts (6 levels x 4)", nestedDicts( 6, 4 ) ),
+            ( "100k LFN list", lfnList( 100000 ) ),
+            ( "getReplicas 20k files", replicasResult( 20000 ) ),
+            ( "getTransformationFiles 20k files", transformationFiles( 20000 ) ),
+            ( "50k datetimes and longs", dateTimes( 50000 ) ) ]
+
+def bestTime( func, repetitions ):
+  """ best wall clock time of func out of repetitions """
+  best = None
+  for _i in range( repetitions ):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+def streamDecode( encoded, chunkSize = 16384 ):
+  """ decode in chunks as BaseTransport does """
+  decoder = DEncode.StreamDecoder()
+  for index in range( 0, len( encoded ), chunkSize ):
+    decoder.feed( encoded[ index : index + chunkSize ] )
+  decoder.end()
+  return decoder.getValue()
+
+def runBenchmark( repetitions = 3 ):
+  """ time all samples """
+  print "%-36s %12s %10s %10s %10s" % ( "sample", "size(bytes)", "encode(s)", "decode(s)", "stream(s)" )
+  for name, sample in SAMPLES:
+    encoded = DEncode.encode( sample )
+    if DEncode.decode( encoded )[0] != sample or streamDecode( encoded ) != sample:
+      print "%s: round trip FAILED" % name
+      continue
+    encTime = bestTime( lambda: DEncode.encode( sample ), repetitions )
+    decTime = bestTime( lambda: DEncode.decode( encoded ), repetitions )
+    streamTime = bestTime( lambda: streamDecode( encoded ), repetitions )
+    print "%-36s %12d %10.3f %10.3f %10.3f" % ( name, len( encoded ), encTime, decTime, streamTime )
+
+if __name__ == "__main__":
+  reps = 3
+  if len( sys.argv ) > 1:
+    reps = int( sys.argv[1] )
+  runBenchmark( reps )
@@ -0,0 +1,74 @@
+########################################################################
+# $HeadURL $
+# File: DEncodeTests.py
+########################################################################
+""" :mod: DEncodeTests
+    =======================
+
+    .. module: DEncodeTests
+    :synopsis: tests for DEncode codec and StreamDecoder
+"""
+__RCSID__ = "$Id$"
+# # imports
+import unittest
+import datetime
+# # SUT
+from DIRAC.Core.Utilities import DEncode
+
+class DEncodeTests( unittest.TestCase ):
+  """
+  .. class:: DEncodeTests
+  """
+  def setUp( self ):
+    """ test setup """
+    now = datetime.datetime.utcnow()
+    lfns = [ "/lhcb/data/2012/RAW/FULL/LHCb/%08d_%08d.raw" % ( run, run * 7 ) for run in range( 200 ) ]
+    self.objects = [ 1, -3, 10L ** 30, 1.5, 2.0 * 10 ** 20, 2.0 * 10 ** -10, True, False, None,
+                     "string", u"unicod\xe9", "x" * 5000, [], (), {},
+                     now, now.date(), now.time(),
+                     { 2 : "3", True : ( 3, None ), 2.0 * 10 ** 20 : 2.0 * 10 ** -10 },
+                     { "OK" : True, "Value" : { "Successful" : dict( [ ( lfn, { "Size" : 1L << 40,
+                                                                                "Date" : now } )
+                                                                       for lfn in lfns ] ),
+                                                "Failed" : {} } },
+                     [ lfns, ( 1, [ 2, ( 3, { "a" : [ now ] } ) ] ) ] ]
+
+  def testEncodeDecode( self ):
+    """ encode/decode round trip """
+    for obj in self.objects:
+      encoded = DEncode.encode( obj )
+      self.assertEqual( DEncode.decode( encoded ), ( obj, len( encoded ) ) )
+
+  def testWireFormat( self ):
+    """ wire format is stable """
+    self.assertEqual( DEncode.encode( { "a" : [ 1, "bc" ], 2 : ( None, True ) } ),
+                      "di2etnb1es1:ali1es2:bcee" )
+    self.assertEqual( DEncode.encode( 10L ), "I10e" )
+
+  def testStreamDecoder( self ):
+    """ StreamDecoder fed in chunks of several sizes """
+    for obj in self.objects:
+      encoded = DEncode.encode( obj )
+      for chunkSize in ( 1, 2, 3, 7, 64, 4096, len( encoded ) ):
+        decoder = DEncode.StreamDecoder()
+        for index in range( 0, len( encoded ), chunkSize ):
+          decoder.feed( encoded[ index : index + chunkSize ] )
+        decoder.end()
+        self.assertEqual( decoder.isFinished(), True )
+        self.assertEqual( decoder.getValue(), obj )
+
+  def testStreamDecoderErrors( self ):
+    """ StreamDecoder errors """
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( "l" )
+    self.assertEqual( decoder.isFinished(), False )
+    self.assertRaises( ValueError, decoder.getValue )
+    self.assertRaises( ValueError, decoder.feed, "i1eei2e" )
+    self.assertRaises( ValueError, DEncode.StreamDecoder().feed, "X" )
+    self.assertRaises( ValueError, DEncode.StreamDecoder().feed, "e" )
+
+# # test execution
+if __name__ == "__main__":
+  testLoader = unittest.TestLoader()
+  suite = testLoader.loadTestsFromTestCase( DEncodeTests )
+  unittest.TextTestRunner( verbosity = 3 ).run( suite )
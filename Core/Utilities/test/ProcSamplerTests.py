@@ -0,0 +1,76 @@
+########################################################################
+# $HeadURL $
+# File: ProcSamplerTests.py
+########################################################################
+""" :mod: ProcSamplerTests
+    ======================
+
+    .. module: ProcSamplerTests
+    :synopsis: unittests for the /proc sampler
+"""
+__RCSID__ = "$Id$"
+
+import os
+import time
+import unittest
+import subprocess
+# # SUT
+import DIRAC.Core.Utilities.ProcSampler as moduleTested
+from DIRAC.Core.Utilities.ProcSampler import ProcSampler, getProcessTable, getProcessTree
+
+class ProcSamplerTests( unittest.TestCase ):
+  """ ProcSampler test case, needs a /proc file system
+  """
+
+  def setUp( self ):
+    self.child = subprocess.Popen( [ 'sleep', '5' ] )
+    time.sleep( 0.2 )
+
+  def tearDown( self ):
+    self.child.kill()
+    self.child.wait()
+
+  def testProcessTree( self ):
+    """ the tree contains the process and its children """
+    table = getProcessTable()
+    self.assertTrue( os.getpid() in table )
+    tree = getProcessTree( os.getpid(), table )
+    self.assertTrue( os.getpid() in tree )
+    self.assertTrue( self.child.pid in tree )
+    self.assertEqual( getProcessTree( -1, table ), [] )
+
+  def testSample( self ):
+    """ snapshot values and peaks """
+    sampler = ProcSampler( os.getpid() )
+    result = sampler.sample()
+    self.assertTrue( result['OK'] )
+    snapshot = result['Value']
+    for key in ( 'CPUConsumed', 'RSS', 'LoadAverage', 'MemoryUsed', 'DiskSpace', 'MaxRSS' ):
+      self.assertTrue( key in snapshot, key )
+    self.assertTrue( snapshot['RSS'] > 0 )
+    self.assertTrue( sampler.getPeaks()['MaxRSS'] >= snapshot['RSS'] )
+    self.assertFalse( ProcSampler( 2 ** 30 ).sample()['OK'] )
+
+  def testExitedChild( self ):
+    """ a child exiting while the tree is sampled does not disable the PSS """
+    sampler = ProcSampler( os.getpid() )
+    exitedPID = 2 ** 30
+    def getTableWithExitedChild():
+      table = getProcessTable()
+      table[exitedPID] = ( os.getpid(), table[os.getpid()][1], 0., 0 )
+      return table
+    moduleTested.getProcessTable = getTableWithExitedChild
+    try:
+      result = sampler.sample()
+    finally:
+      moduleTested.getProcessTable = getProcessTable
+    self.assertTrue( result['OK'] )
+    self.assertTrue( exitedPID in result['Value']['PIDs'] )
+    self.assertFalse( 'PSS' in result['Value'] )
+    self.assertEqual( sampler.pssAvailable, os.path.exists( '/proc/self/smaps_rollup' ) )
+    if sampler.pssAvailable:
+      self.assertTrue( 'PSS' in sampler.sample()['Value'] )
+
+if __name__ == "__main__":
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ProcSamplerTests )
+  unittest.TextTestRunner( verbosity = 3 ).run( suite )
@@ -24,7 +24,7 @@ from DIRAC.Core.Utilities.File import makeGuid, getSize
 from DIRAC.Core.Utilities.List import sortList, randomize
 from DIRAC.Core.Utilities.SiteSEMapping import getSEsForSite, isSameSiteSE, getSEsForCountry
 from DIRAC.Resources.Catalog.FileCatalog import FileCatalog
-from DIRAC.Resources.Storage.StorageElement import StorageElement
+from DIRAC.Resources.Storage.StorageElement import getStorageElement
 from DIRAC.ResourceStatusSystem.Client.ResourceStatus import ResourceStatus
 
 class CatalogBase( object ):
@@ -524,7 +524,7 @@ class StorageBase( object ):
       self.log.error( errMessage )
       return S_ERROR( errMessage )
     self.log.debug( "_callStorageElementFcn: Will execute '%s' with %s pfns." % ( method, len( pfns ) ) )
-    storageElement = StorageElement( storageElementName )
+    storageElement = getStorageElement( storageElementName )
     res = storageElement.isValid( method )
     if not res['OK']:
       errStr = "_callStorageElementFcn: Failed to instantiate Storage Element"
@@ -565,7 +565,7 @@ class StorageBase( object ):
     """
     if type( lfns ) == type( '' ):
       lfns = [lfns]
-    storageElement = StorageElement( storageElementName )
+    storageElement = getStorageElement( storageElementName )
     res = storageElement.isValid( "getPfnForLfn" )
     if not res['OK']:
       self.log.error( "getPfnForLfn: Failed to instantiate StorageElement at %s" % storageElementName )
@@ -586,7 +586,7 @@ class StorageBase( object ):
     :param list lfns: list of LFNs
     :param str stotrageElementName: DIRAC SE name
     """
-    storageElement = StorageElement( storageElementName )
+    storageElement = getStorageElement( storageElementName )
     res = storageElement.isValid( "getPfnPath" )
     if not res['OK']:
       self.log.error( "getLfnForPfn: Failed to instantiate StorageElement at %s" % storageElementName )
@@ -609,7 +609,7 @@ class StorageBase( object ):
     :param str protocol: protocol name (default: 'SRM2')
     :param bool withPort: flag to include port in PFN (default: True)
     """
-    storageElement = StorageElement( storageElementName )
+    storageElement = getStorageElement( storageElementName )
     res = storageElement.isValid( "getPfnForProtocol" )
     if not res["OK"]:
       self.log.error( "getPfnForProtocol: Failed to instantiate StorageElement at %s" % storageElementName )
@@ -1436,7 +1436,7 @@ class ReplicaManager( CatalogToStorage ):
 
     ##########################################################
     #  Instantiate the destination storage element here.
-    storageElement = StorageElement( diracSE )
+    storageElement = getStorageElement( diracSE )
     res = storageElement.isValid()
     if not res['OK']:
       errStr = "putAndRegister: The storage element is not currently valid."
@@ -1679,7 +1679,7 @@ class ReplicaManager( CatalogToStorage ):
     ###########################################################
     # Check that the destination storage element is sane and resolve its name
     self.log.verbose( "%s Verifying dest StorageElement validity (%s)." % ( logStr, destSE ) )
-    destStorageElement = StorageElement( destSE )
+    destStorageElement = getStorageElement( destSE )
     res = destStorageElement.isValid()
     if not res['OK']:
       errStr = "%s The storage element is not currently valid." % logStr
@@ -1819,7 +1819,7 @@ class ReplicaManager( CatalogToStorage ):
       #  self.log.info( "__resolveBestReplicas: %s is currently banned as a source." % diracSE )
       else:
         self.log.info( "%s %s is available for use." % ( logStr, diracSE ) )
-        storageElement = StorageElement( diracSE )
+        storageElement = getStorageElement( diracSE )
         res = storageElement.isValid()
         if not res['OK']:
           errStr = "%s The storage element is not currently valid." % logStr
@@ -1901,7 +1901,7 @@ class ReplicaManager( CatalogToStorage ):
     failed = {}
     fileDict = {}
     for storageElementName, fileTuple in seDict.items():
-      destStorageElement = StorageElement( storageElementName )
+      destStorageElement = getStorageElement( storageElementName )
       res = destStorageElement.isValid()
       if not res['OK']:
         errStr = "__registerFile: The storage element is not currently valid."
@@ -1963,7 +1963,7 @@ class ReplicaManager( CatalogToStorage ):
     failed = {}
     replicaTuples = []
     for storageElementName, replicaTuple in seDict.items():
-      destStorageElement = StorageElement( storageElementName )
+      destStorageElement = getStorageElement( storageElementName )
       res = destStorageElement.isValid()
       if not res['OK']:
         errStr = "__registerReplica: The storage element is not currently valid."
@@ -2319,7 +2319,7 @@ class ReplicaManager( CatalogToStorage ):
     """ remove replica from storage element """
     self.log.verbose( "__removePhysicalReplica: Attempting to remove %s pfns at %s." % ( len( pfnsToRemove ),
                                                                                          storageElementName ) )
-    storageElement = StorageElement( storageElementName )
+    storageElement = getStorageElement( storageElementName )
     res = storageElement.isValid()
     if not res['OK']:
       errStr = "__removePhysicalReplica: The storage element is not currently valid."
@@ -2391,7 +2391,7 @@ class ReplicaManager( CatalogToStorage ):
 
     ##########################################################
     #  Instantiate the destination storage element here.
-    storageElement = StorageElement( diracSE )
+    storageElement = getStorageElement( diracSE )
     res = storageElement.isValid()
     if not res['OK']:
       errStr = "put: The storage element is not currently valid."
@@ -9,7 +9,8 @@ __RCSID__ = "$Id$"
 
 import os, types
 from DIRAC import S_OK, S_ERROR
-from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities import queryTime
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities import queryTime, getMetaSelectivityRank, \
+                                                                         intersectIDSets
 
 class DirectoryMetadata:
 
@@ -493,8 +494,10 @@ class DirectoryMetadata:
       return result
     dirList = result['Value']
     table = self.db.dtree.getTreeTable()
-    dirString = ','.join( [ str( x ) for x in dirList ] )
-    req = 'SELECT DirID FROM %s WHERE DirID NOT IN ( %s )' % ( table, dirString )
+    req = 'SELECT DirID FROM %s' % table
+    if dirList:
+      dirString = ','.join( [ str( x ) for x in set( dirList ) ] )
+      req += ' WHERE DirID NOT IN ( %s )' % dirString
     result = self.db._query( req )
     if not result['OK']:
       return result
@@ -561,25 +564,29 @@ class DirectoryMetadata:
         if not result['OK']:
           return result
         pathSelection = result['Value']
-      dirList = []
-      first = True
-      for meta, value in metaDict.items():
-        if value == "Missing":
-          result = self.__findSubdirMissingMeta( meta, pathSelection )
-        else:
-          result = self.__findSubdirByMeta( meta, value, pathSelection )
-        if not result['OK']:
-          return result
-        mList = result['Value']
-        if first:
-          dirList = mList
-          first = False
+      # Evaluate the most selective conditions first and stop as soon as nothing is left.
+      # 'Missing' conditions come last and only remove directories from the current selection
+      dirSet = None
+      for meta, value in sorted( metaDict.items(), key = lambda item: getMetaSelectivityRank( item[1] ) ):
+        if value == "Missing" and dirSet is not None:
+          result = self.__findSubdirByMeta( meta, 'Any', pathSelection )
+          if not result['OK']:
+            return result
+          dirSet.difference_update( result['Value'] )
         else:
-          newList = []
-          for d in dirList:
-            if d in mList:
-              newList.append( d )
-          dirList = newList
+          if value == "Missing":
+            result = self.__findSubdirMissingMeta( meta, pathSelection )
+          else:
+            result = self.__findSubdirByMeta( meta, value, pathSelection )
+          if not result['OK']:
+            return result
+          if dirSet is None:
+            dirSet = set( result['Value'] )
+          else:
+            dirSet = intersectIDSets( [ dirSet, result['Value'] ] )
+        if not dirSet:
+          break
+      dirList = list( dirSet )
     else:
       if pathDirID:
         result = self.db.dtree.getSubdirectoriesByID( pathDirID, includeParent = True )
@@ -592,8 +599,6 @@ class DirectoryMetadata:
     if metaDict:
       dirSelect = True
       finalList = dirList
-      if pathDirList:
-        finalList = [ d for d in dirList if d in pathDirList ]
     else:
       if pathDirList:
         dirSelect = True
@@ -692,12 +697,10 @@ class DirectoryMetadata:
       parentDirs += result['Value']
 
     # Constrain the output to only those that are present in the input list  
-    resDirs = parentDirs + subDirs + selectedDirs
+    resDirs = set( parentDirs + subDirs + selectedDirs )
     if fromDirs:
-      resDirs = []
-      for dir_ in parentDirs + subDirs + selectedDirs:
-        if dir_ in fromDirs:
-          resDirs.append( dir_ )
+      resDirs = intersectIDSets( [ resDirs, fromDirs ] )
+    resDirs = list( resDirs )
 
     return S_OK( resDirs )
 
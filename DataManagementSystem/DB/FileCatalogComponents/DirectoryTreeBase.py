@@ -542,10 +542,11 @@ class DirectoryTreeBase:
     treeTable = self.getTreeTable()
     req = "SELECT CONCAT(D.DirName,'/',F.FileName) FROM FC_Files as F, %s as D WHERE D.DirID IN ( %s ) and D.DirID=F.DirID"
     req = req % ( treeTable,dirListString )
-    result = self.db._query(req)
-    if not result['OK']:
-      return result
-    lfnList = [ x[0] for x in result['Value'] ]
+    lfnList = []
+    for result in self.db._queryIter(req):
+      if not result['OK']:
+        return result
+      lfnList.extend( [ x[0] for x in result['Value'] ] )
     return S_OK(lfnList)
   
   def getFileLFNsInDirectoryByDirectory(self,dirID,credDict):
@@ -559,14 +560,13 @@ class DirectoryTreeBase:
     treeTable = self.getTreeTable()
     req = "SELECT D.DirName,F.FileName FROM FC_Files as F, %s as D WHERE D.DirID IN ( %s ) and D.DirID=F.DirID"
     req = req % ( treeTable,dirListString )
-    result = self.db._query(req)
-    if not result['OK']:
-      return result
-
     lfnDict = {}
-    for dir,fname in result['Value']:
-      lfnDict.setdefault(dir,[])
-      lfnDict[dir].append(fname)
+    for result in self.db._queryIter(req):
+      if not result['OK']:
+        return result
+      for dir,fname in result['Value']:
+        lfnDict.setdefault(dir,[])
+        lfnDict[dir].append(fname)
 
     return S_OK(lfnDict)
  
@@ -1019,8 +1019,8 @@ class FileManagerBase:
     return S_OK()
 
   def _getStorageElement( self, seName ):
-    from DIRAC.Resources.Storage.StorageElement              import StorageElement
-    storageElement = StorageElement( seName )
+    from DIRAC.Resources.Storage.StorageElement              import getStorageElement
+    storageElement = getStorageElement( seName )
     if not storageElement.valid:
       return S_ERROR( storageElement.errorReason )
     return S_OK( storageElement )
@@ -10,7 +10,8 @@ __RCSID__ = "$Id$"
 
 import time, os, types
 from DIRAC import S_OK, S_ERROR
-from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities import queryTime
+from DIRAC.Core.Utilities.List import getChunk
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities import queryTime, getMetaSelectivityRank
 
 class FileMetadata:
 
@@ -357,7 +358,7 @@ class FileMetadata:
         selectString = ' AND '.join( selectList )
     elif type( value ) == types.ListType:
       vString = ','.join( [ "'" + str( x ) + "'" for x in value] )
-      selectString = "%sValue in %s" % ( table, vString )
+      selectString = "%sValue in (%s)" % ( table, vString )
     else:
       if value == "Any":
         selectString = ''
@@ -366,65 +367,64 @@ class FileMetadata:
 
     return S_OK(selectString)
 
-  def __findFilesForMetaValue( self, meta, value, dirList ):
-    """ Find files in the given list of directories corresponding to the given
-        selection criteria
+  def __buildFileMetaQuery( self, metaDict ):
+    """ Build the query selecting the IDs of the files meeting all the metaDict
+        requirements. Each condition is a join on its metadata table, the most
+        selective ones first
     """
-
-    result = self.__createMetaSelection( meta, value, "M." )
-    if not result['OK']:
-      return result
-    selectString = result['Value']
-
-    dirString = ','.join([ str(x) for x in dirList])
-
-    req = " SELECT F.FileID, F.DirID FROM FC_FileMeta_%s AS M, FC_Files AS F" % meta
-    if dirString:
-      req += " WHERE F.DirID in (%s)" % dirString
-    if selectString:
-      if dirString:
-        req += " AND %s AND F.FileID=M.FileID" % selectString
-      else:
-        req += " WHERE %s AND F.FileID=M.FileID" % selectString
-
-
-    result = self.db._query( req )
+    req = "SELECT F.FileID FROM FC_Files AS F"
+    metaItems = sorted( metaDict.items(), key = lambda item: getMetaSelectivityRank( item[1] ) )
+    for index, ( meta, value ) in enumerate( metaItems ):
+      table = "M%d" % index
+      result = self.__createMetaSelection( meta, value, "%s." % table )
+      if not result['OK']:
+        return result
+      selectString = result['Value']
+      req += " JOIN FC_FileMeta_%s AS %s ON %s.FileID=F.FileID" % ( meta, table, table )
+      if selectString:
+        req += " AND ( %s )" % selectString
+    return S_OK( req )
+
+  def __iterFilesByMetadata( self, metaDict, dirList, dirsPerQuery = 1000 ):
+    """ Generate lists of IDs of the files meeting the metaDict requirements and
+        belonging to directories in dirList, querying dirsPerQuery directories
+        at a time. Yields S_OK( fileIDList ) or S_ERROR
+    """
+    result = self.__buildFileMetaQuery( metaDict )
     if not result['OK']:
-      return result
-    if not result['Value']:
-      return S_OK( [] )
-
-    fileList = []
-    for row in result['Value']:
-      fileID = row[0]
-      fileList.append( fileID )
-
-    return S_OK( fileList )
-
+      yield result
+      return
+    req = result['Value']
+    if not dirList:
+      result = self.db._query( req )
+      if result['OK']:
+        result = S_OK( [ row[0] for row in result['Value'] ] )
+      yield result
+      return
+    for dirChunk in getChunk( list( dirList ), dirsPerQuery ):
+      dirString = ','.join( [ str( x ) for x in dirChunk ] )
+      result = self.db._query( "%s WHERE F.DirID IN (%s)" % ( req, dirString ) )
+      if result['OK']:
+        result = S_OK( [ row[0] for row in result['Value'] ] )
+      yield result
+      if not result['OK']:
+        return
 
-  def __findFilesByMetadata( self,metaDict,dirList,credDict ):
-    """ Find a list of file IDs meeting the metaDict requirements and belonging
-        to directories in dirList 
+  def __findLFNsByMetadata( self, metaDict, dirList ):
+    """ Find the LFNs of the files meeting the metaDict requirements and belonging
+        to directories in dirList. The file IDs are resolved chunk by chunk
     """
-
-    fileList = []
-    first = True    
-    for meta,value in metaDict.items():
-      result = self.__findFilesForMetaValue( meta,value,dirList )
+    lfnList = []
+    for result in self.__iterFilesByMetadata( metaDict, dirList ):
       if not result['OK']:
         return result
-      mList = result['Value']
-      if first:
-        fileList = mList
-        first = False
-      else:
-        newList = []
-        for f in fileList:
-          if f in mList:
-            newList.append( f )
-        fileList = newList
-
-    return S_OK(fileList)
+      if not result['Value']:
+        continue
+      result = self.db.fileManager._getFileLFNs( result['Value'] )
+      if not result['OK']:
+        return result
+      lfnList += result['Value']['Successful'].values()
+    return S_OK( lfnList )
 
   @queryTime
   def findFilesByMetadata( self, metaDict, path, credDict ):
@@ -452,34 +452,15 @@ class FileMetadata:
       if key in result['Value']:
         fileMetaDict[key] = value
 
-    fileList = []
-    lfnList = []
-
     if dirFlag == "None":
       return S_OK([])
     elif dirFlag == "All":
-      result = self.__findFilesByMetadata( fileMetaDict, [], credDict )
-      if not result['OK']:
-        return result
-      fileList = result['Value']
-      if fileList:
-        result = self.db.fileManager._getFileLFNs(fileList)
-        lfnList = [ x[1] for x in result['Value']['Successful'].items() ]   
-        return S_OK(lfnList)  
-      else:
+      if not fileMetaDict:
         return S_OK([])
+      return self.__findLFNsByMetadata( fileMetaDict, [] )
 
-    if fileMetaDict:
-      result = self.__findFilesByMetadata( fileMetaDict,dirList,credDict )
-      if not result['OK']:
-        return result
-      fileList = result['Value']
-    else:
+    if not fileMetaDict:
       result = self.db.dtree.getFileLFNsInDirectoryByDirectory( dirList, credDict )
       return result
 
-    if fileList:
-      result = self.db.fileManager._getFileLFNs(fileList)
-      lfnList = [ x[1] for x in result['Value']['Successful'].items() ]
-
-    return S_OK( lfnList ) 
+    return self.__findLFNsByMetadata( fileMetaDict, dirList ) 
@@ -98,4 +98,39 @@ def queryTime(f):
     result = f(*args, **kwargs)
     result['QueryTime'] = time.time() - start
     return result
-  return measureQueryTime
\ No newline at end of file
+  return measureQueryTime
+
+
+def getMetaSelectivityRank( value ):
+  """ Rank a metadata query value by the expected size of its selection: equality
+      first, then lists of values, ranges, negations, 'Any' and 'Missing' last
+  """
+  if type( value ) == DictType:
+    operations = value.keys()
+    if [ op for op in operations if op in [ '=', 'in' ] ]:
+      return 1
+    if [ op for op in operations if op in [ '>', '<', '>=', '<=' ] ]:
+      return 2
+    return 3
+  if type( value ) == ListType:
+    return 1
+  if value == 'Any':
+    return 4
+  if value == 'Missing':
+    return 5
+  return 0
+
+def intersectIDSets( idCollections ):
+  """ Intersect collections of IDs starting from the smallest one, stop as soon
+      as the intersection is empty. Returns a set
+  """
+  idSets = [ ids if type( ids ) in [ set, frozenset ] else set( ids ) for ids in idCollections ]
+  if not idSets:
+    return set()
+  idSets.sort( key = len )
+  result = set( idSets[0] )
+  for ids in idSets[1:]:
+    if not result:
+      break
+    result &= ids
+  return result
@@ -0,0 +1,135 @@
+########################################################################
+# $HeadURL $
+# File: FileCatalogMetaQueryBenchmark.py
+########################################################################
+""" :mod: FileCatalogMetaQueryBenchmark
+    ====================================
+
+    .. module: FileCatalogMetaQueryBenchmark
+    :synopsis: timing of the directory selection of metadata queries
+
+    Run it with python FileCatalogMetaQueryBenchmark.py [depth] [width]. It builds a synthetic
+    directory tree with metadata defined at different levels and times
+    DirectoryMetadata.findDirIDsByMetadata on it. The database is replaced by an in memory one
+    answering the queries of each condition with precomputed selections, so that only the
+    combination of the selections is timed. The result is checked against a plain list scan
+    of the same selections, in the dictionary order as it was done before.
+"""
+__RCSID__ = "$Id$"
+# # imports
+import re
+import sys
+import time
+# # from DIRAC
+from DIRAC import S_OK
+# # SUT
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata import DirectoryMetadata
+
+# # list scans are quadratic, do not try them above this size
+MAX_LIST_SCAN = 20000
+
+def buildTree( depth, width ):
+  """ directory tree as { dirID : [ subdirIDs ] } and { level : [ dirIDs ] } """
+  children = { 1 : [] }
+  levels = { 0 : [ 1 ] }
+  nextID = 2
+  for level in range( 1, depth + 1 ):
+    levels[level] = []
+    for parent in levels[level - 1]:
+      for _i in range( width ):
+        children[parent].append( nextID )
+        children[nextID] = []
+        levels[level].append( nextID )
+        nextID += 1
+  return children, levels
+
+def subdirectories( children, dirList ):
+  """ all the subdirectories of the directories as getAllSubdirectoriesByID returns them """
+  result = []
+  parents = dirList
+  while parents:
+    subdirs = []
+    for parent in parents:
+      subdirs += children[parent]
+    result += subdirs
+    parents = subdirs
+  return result
+
+def metaDefinitions( levels ):
+  """ { meta : ( query value, directories where the meta is defined ) } """
+  definitions = {}
+  for level, meta, step in ( ( 1, "Year", 3 ), ( 2, "Energy", 2 ), ( 3, "Polarity", 5 ), ( 4, "EventType", 7 ) ):
+    if level in levels:
+      definitions[meta] = ( "value", levels[level][::step] )
+  definitions["DataType"] = ( "Any", levels[1] )
+  definitions["Version"] = ( { ">" : 10 }, levels[min( 2, len( levels ) - 1 )][::2] )
+  return definitions
+
+class FakeDirectoryTree:
+  """ directory tree answering the subdirectory queries with precomputed results """
+
+  def __init__( self, children, definitions ):
+    self.subdirs = {}
+    for _value, defined in definitions.values():
+      self.subdirs[tuple( defined )] = subdirectories( children, defined )
+
+  def getAllSubdirectoriesByID( self, dirList ):
+    return S_OK( self.subdirs[tuple( dirList )] )
+
+  def getTreeTable( self ):
+    return "FC_DirectoryTree"
+
+class FakeDB:
+  """ file catalog database answering the queries of DirectoryMetadata, all the defined
+      values match the conditions
+  """
+
+  def __init__( self, children, definitions ):
+    self.dtree = FakeDirectoryTree( children, definitions )
+    self.definitions = definitions
+
+  def _query( self, req ):
+    if "FC_MetaFields" in req:
+      return S_OK( [ ( meta, "VARCHAR(128)" ) for meta in self.definitions ] )
+    meta = re.search( r"FC_Meta_(\w+)", req ).group( 1 )
+    return S_OK( [ ( dirID, ) for dirID in self.definitions[meta][1] ] )
+
+def listScan( subdirs, definitions ):
+  """ intersection of the selections as done before, in the dictionary order """
+  dirList = None
+  for _value, defined in definitions.values():
+    mList = defined + subdirs[tuple( defined )]
+    if dirList is None:
+      dirList = mList
+    else:
+      dirList = [ d for d in dirList if d in mList ]
+  return dirList
+
+def timeIt( func, *args ):
+  """ result and wall clock time of func """
+  start = time.time()
+  result = func( *args )
+  return result, time.time() - start
+
+if __name__ == "__main__":
+  depth = int( sys.argv[1] ) if len( sys.argv ) > 1 else 6
+  width = int( sys.argv[2] ) if len( sys.argv ) > 2 else 6
+  children, levels = buildTree( depth, width )
+  definitions = metaDefinitions( levels )
+  queryDict = dict( [ ( meta, value ) for meta, ( value, _defined ) in definitions.items() ] )
+  dirMeta = DirectoryMetadata( FakeDB( children, definitions ) )
+  print "%d directories, depth %d, width %d" % ( len( children ), depth, width )
+  for meta, ( value, defined ) in sorted( definitions.items() ):
+    print "  %-10s %-12s %8d directories" % ( meta, value, len( defined ) + len( dirMeta.db.dtree.subdirs[tuple( defined )] ) )
+  result, queryTime = timeIt( dirMeta.findDirIDsByMetadata, queryDict, '/', {} )
+  if not result['OK']:
+    print "ERROR: %s" % result['Message']
+    sys.exit( 1 )
+  print "findDirIDsByMetadata: %8d directories in %.4f s" % ( len( result['Value'] ), queryTime )
+  if max( [ len( dirMeta.db.dtree.subdirs[tuple( defined )] ) for _value, defined in definitions.values() ] ) > MAX_LIST_SCAN:
+    print "list scan: skipped, more than %d directories per condition" % MAX_LIST_SCAN
+  else:
+    listResult, listTime = timeIt( listScan, dirMeta.db.dtree.subdirs, definitions )
+    print "list scan:            %8d directories in %.4f s" % ( len( set( listResult ) ), listTime )
+    if set( listResult ) != set( result['Value'] ):
+      print "ERROR: selections differ"
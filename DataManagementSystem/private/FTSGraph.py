@@ -21,6 +21,7 @@ __RCSID__ = "$Id: $"
 # @brief Definition of FTSGraph class.
 
 # # imports
+import itertools
 # # from DIRAC
 from DIRAC import S_OK, S_ERROR, gLogger
 from DIRAC.Core.Utilities.Graph import Graph, Node, Edge
@@ -91,6 +92,8 @@ class FTSGraph( Graph ):
   __rssClient = None
   # # resources
   __resources = None
+  # # epoch counter, shared by all graphs
+  __epochs = itertools.count( 1 )
 
   def __init__( self,
                 name,
@@ -113,6 +116,14 @@ class FTSGraph( Graph ):
     self.accFailureRate = accFailureRate
     self.accFailedFiles = accFailedFiles
     self.schedulingType = schedulingType
+    # # SE name -> Site
+    self.__seSites = {}
+    # # ( fromSite name, toSite name ) -> Route
+    self.__siteRoutes = {}
+    # # route name -> Route
+    self.__namedRoutes = {}
+    # # changed each time sites, routes or RW access are updated
+    self.epoch = 0
     self.initialize( ftsSites, ftsHistoryViews )
 
   def initialize( self, ftsSites = None, ftsHistoryViews = None ):
@@ -174,6 +185,8 @@ class FTSGraph( Graph ):
         self.log.debug( "adding route between %s and %s" % ( route.fromNode.name, route.toNode.name ) )
         self.addEdge( route )
 
+    self.__buildIndex()
+
     for ftsHistory in ftsHistoryViews:
 
       route = self.findRoute( ftsHistory.SourceSE, ftsHistory.TargetSE )
@@ -244,19 +257,42 @@ class FTSGraph( Graph ):
         self.log.debug( "Site '%s' SE '%s' read %s write %s " % ( site.name, se,
                                                                   rwDict[se]["read"], rwDict[se]["write"] ) )
       site.SEs = rwDict
+    self.__buildIndex()
     return S_OK()
 
+  def __buildIndex( self ):
+    """ build SE to site and sites to route lookups, the first matching site or route wins """
+    seSites = {}
+    for site in self.nodes():
+      for se in site.SEs:
+        seSites.setdefault( se, site )
+    siteRoutes = {}
+    namedRoutes = {}
+    for route in self.edges():
+      siteRoutes.setdefault( ( route.fromNode.name, route.toNode.name ), route )
+      namedRoutes.setdefault( route.routeName, route )
+    self.__seSites = seSites
+    self.__siteRoutes = siteRoutes
+    self.__namedRoutes = namedRoutes
+    self.epoch = self.__epochs.next()
+
   def findSiteForSE( self, se ):
     """ return FTSSite for a given SE """
-    for node in self.nodes():
-      if se in node:
-        return S_OK( node )
+    if se in self.__seSites:
+      return S_OK( self.__seSites[se] )
     return S_ERROR( "StorageElement %s not found" % se )
 
   def findRoute( self, fromSE, toSE ):
     """ find route between :fromSE: and :toSE: """
-    for edge in self.edges():
-      if fromSE in edge.fromNode.SEs and toSE in edge.toNode.SEs:
-        return S_OK( edge )
+    fromSite = self.__seSites.get( fromSE )
+    toSite = self.__seSites.get( toSE )
+    if fromSite and toSite and ( fromSite.name, toSite.name ) in self.__siteRoutes:
+      return S_OK( self.__siteRoutes[( fromSite.name, toSite.name )] )
     return S_ERROR( "FTSGraph: unable to find route between '%s' and '%s'" % ( fromSE, toSE ) )
 
+  def findRouteByName( self, routeName ):
+    """ get route given its :routeName: """
+    if routeName in self.__namedRoutes:
+      return S_OK( self.__namedRoutes[routeName] )
+    return S_ERROR( "FTSGraph: route '%s' not found" % routeName )
+
@@ -21,7 +21,9 @@ __RCSID__ = "$Id: $"
 # @brief Definition of FTSStrategy class.
 
 # # imports
+import copy
 import random
+import time
 # # from DIRAC
 from DIRAC import gLogger, gConfig, S_OK, S_ERROR
 from DIRAC.Core.Utilities.DIRACSingleton import DIRACSingleton
@@ -59,6 +61,10 @@ class FTSStrategy( object ):
   acceptableFailedFiles = 5
   # # scheduling type
   schedulingType = "File"
+  # # max number of memoized replication trees
+  maxCachedTrees = 10000
+  # # strategies not depending on the routes load, only their trees are memoized
+  cachedStrategies = [ 'Simple' ]
 
   def __init__( self, csPath = None, ftsSites = None, ftsHistoryViews = None ):
     """c'tor
@@ -94,6 +100,10 @@ class FTSStrategy( object ):
     self.log.info( "AcceptableFailureRate = %s" % self.acceptableFailureRate )
     self.acceptableFailedFiles = gConfig.getValue( "%s/%s" % ( self.csPath, "AcceptableFailedFiles" ), 5 )
     self.log.info( "AcceptableFailedFiles = %s" % self.acceptableFailedFiles )
+    self.treeCacheLifeTime = gConfig.getValue( "%s/%s" % ( self.csPath, "TreeCacheLifeTime" ), 60 )
+    self.log.info( "TreeCacheLifeTime = %s" % self.treeCacheLifeTime )
+    # # ( sourceSEs, targetSEs, strategy, graph epoch ) => ( expiration time, replication tree )
+    self.__treeCache = {}
     # # chosen strategy
     self.chosenStrategy = 0
     # dispatcher
@@ -166,10 +176,11 @@ class FTSStrategy( object ):
     if replicationTree:
       try:
         self.graphLock().acquire()
-        for route in self.ftsGraph.edges():
-          if route.routeName in replicationTree:
-            route.WaitingSize += size
-            route.WaitingFiles += 1
+        for routeName in replicationTree:
+          route = self.ftsGraph.findRouteByName( routeName )
+          if route["OK"]:
+            route["Value"].WaitingSize += size
+            route["Value"].WaitingFiles += 1
       finally:
         self.graphLock().release()
     return S_OK()
@@ -444,11 +455,17 @@ class FTSStrategy( object ):
 
     self.log.info( "replicationTree: strategy=%s sourceSEs=%s targetSEs=%s size=%s" % \
                      ( strategy, sourceSEs, targetSEs, size ) )
-    # # fire action from dispatcher
-    tree = self.strategyDispatcher[strategy]( sourceSEs, targetSEs )
-    if not tree["OK"]:
-      self.log.error( "replicationTree: %s" % tree["Message"] )
-      return tree
+    # # reuse the tree of the previous files with the same sources and targets, the strategies
+    # # using the waiting transfers of the routes are evaluated again for each file
+    tree = self.__getCachedTree( sourceSEs, targetSEs, strategy )
+    if not tree:
+      # # fire action from dispatcher, strategies modify the SE lists
+      cacheKey = self.__treeCacheKey( sourceSEs, targetSEs, strategy )
+      tree = self.strategyDispatcher[strategy]( list( sourceSEs ), list( targetSEs ) )
+      if not tree["OK"]:
+        self.log.error( "replicationTree: %s" % tree["Message"] )
+        return tree
+      self.__cacheTree( cacheKey, tree["Value"] )
     # # update graph edges
     self.log.always( "replicationTree: %s" % tree["Value"] )
     update = self.addTreeToGraph( replicationTree = tree["Value"], size = size )
@@ -457,6 +474,31 @@ class FTSStrategy( object ):
       return update
     return tree
 
+  def __treeCacheKey( self, sourceSEs, targetSEs, strategy ):
+    """ memo key for a replication tree, the graph epoch changes with the graph or its RW access """
+    return ( tuple( sourceSEs ), tuple( targetSEs ), strategy, self.ftsGraph.epoch )
+
+  def __getCachedTree( self, sourceSEs, targetSEs, strategy ):
+    """ get still valid memoized replication tree or None """
+    if not self.treeCacheLifeTime or strategy not in self.cachedStrategies:
+      return None
+    cached = self.__treeCache.get( self.__treeCacheKey( sourceSEs, targetSEs, strategy ) )
+    if not cached or cached[0] < time.time():
+      return None
+    return S_OK( copy.deepcopy( cached[1] ) )
+
+  def __cacheTree( self, cacheKey, tree ):
+    """ memoize replication tree for :treeCacheLifeTime: seconds """
+    if not self.treeCacheLifeTime or cacheKey[2] not in self.cachedStrategies:
+      return
+    now = time.time()
+    if len( self.__treeCache ) >= self.maxCachedTrees:
+      self.__treeCache = dict( [ ( key, cached ) for key, cached in self.__treeCache.items()
+                                 if cached[0] >= now and key[3] == self.ftsGraph.epoch ] )
+      if len( self.__treeCache ) >= self.maxCachedTrees:
+        self.__treeCache = {}
+    self.__treeCache[cacheKey] = ( now + self.treeCacheLifeTime, copy.deepcopy( tree ) )
+
   def __selectStrategy( self ):
     """ If more than one active strategy use one after the other.
 
@@ -102,6 +102,18 @@ class FTSGraphTests( unittest.TestCase ):
     route = graph.findRoute( "RAL-FOO", "CERN-BAR" )
     self.assertEqual( route["OK"], False, "findRoute failed for unknown source and target SEs" )
 
+    route = graph.findRoute( "CERN-USER", "RAL-USER" )
+    self.assertEqual( route["OK"], True, "findRoute failed for known source and target SEs" )
+    self.assertEqual( route["Value"].fromNode, sourceSite["Value"], "wrong route source site" )
+    self.assertEqual( route["Value"].toNode, targetSite["Value"], "wrong route target site" )
+    namedRoute = graph.findRouteByName( route["Value"].routeName )
+    self.assertEqual( namedRoute["OK"], True, "findRouteByName failed for known route" )
+    self.assertEqual( namedRoute["Value"], route["Value"], "findRouteByName returned wrong route" )
+
+    epoch = graph.epoch
+    graph.updateRWAccess()
+    self.assertNotEqual( graph.epoch, epoch, "epoch not changed by updateRWAccess" )
+
 
 # # test execution
 if __name__ == "__main__":
@@ -22,11 +22,54 @@ __RCSID__ = "$Id: $"
 
 # # imports
 import unittest
+# # from DIRAC
+from DIRAC import S_OK, S_ERROR
 # # SUT
+import DIRAC.DataManagementSystem.private.FTSStrategy as moduleTested
 from DIRAC.DataManagementSystem.private.FTSStrategy import FTSStrategy
 # # helper classes
 from DIRAC.DataManagementSystem.private.FTSHistoryView import FTSHistoryView
 
+class FakeSite( object ):
+  """ site with all its SEs readable and writable """
+  def __init__( self, name, seList ):
+    self.name = name
+    self.SEs = dict( [ ( se, { "read" : True, "write" : True } ) for se in seList ] )
+
+class FakeRoute( object ):
+  """ route with a fixed time to start """
+  def __init__( self, fromNode, toNode, timeToStart ):
+    self.fromNode = fromNode
+    self.toNode = toNode
+    self.routeName = self.name = "%s => %s" % ( fromNode.name, toNode.name )
+    self.timeToStart = timeToStart
+    self.WaitingFiles = 0
+    self.WaitingSize = 0
+
+class FakeGraph( object ):
+  """ FTSGraph with two source sites and one target site """
+  def __init__( self, *args ):
+    sourceA = FakeSite( "A", [ "A-SE" ] )
+    sourceB = FakeSite( "B", [ "B-SE" ] )
+    target = FakeSite( "T", [ "T-SE" ] )
+    self.seSites = { "A-SE" : sourceA, "B-SE" : sourceB, "T-SE" : target }
+    self.routes = dict( [ ( ( source.name, target.name ), FakeRoute( source, target, 0.0 ) )
+                          for source in ( sourceA, sourceB ) ] )
+    self.epoch = 1
+    self.findRouteCalls = 0
+
+  def findRoute( self, fromSE, toSE ):
+    self.findRouteCalls += 1
+    key = ( self.seSites[fromSE].name, self.seSites[toSE].name )
+    if key in self.routes:
+      return S_OK( self.routes[key] )
+    return S_ERROR( "no route" )
+
+  def findRouteByName( self, routeName ):
+    for route in self.routes.values():
+      if route.routeName == routeName:
+        return S_OK( route )
+    return S_ERROR( "no route" )
 
 ########################################################################
 class FTSStrategyTests( unittest.TestCase ):
@@ -37,13 +80,44 @@ class FTSStrategyTests( unittest.TestCase ):
 
   def setUp( self ):
     """ test case setup """
-    pass
+    self.ftsGraph = moduleTested.FTSGraph
+    moduleTested.FTSGraph = FakeGraph
+    FTSStrategy.instance = None
+    self.strategy = FTSStrategy( csPath = "/Systems/DataManagement/Test/Agents/FTSAgent" )
+    self.strategy.activeStrategies = [ "MinimiseTotalWait", "Swarm", "Simple" ]
+    self.strategy.treeCacheLifeTime = 60
+    self.graph = self.strategy.ftsGraph
 
   def tearDown( self ):
     """ test case tear down """
-    pass
+    moduleTested.FTSGraph = self.ftsGraph
+    FTSStrategy.instance = None
+
+  def testLoadChangesTree( self ):
+    """ a changed route load gives a new tree for the load dependent strategies """
+    for strategy in ( "MinimiseTotalWait", "Swarm" ):
+      self.graph.routes[( "A", "T" )].timeToStart = 1.0
+      self.graph.routes[( "B", "T" )].timeToStart = 10.0
+      tree = self.strategy.replicationTree( [ "A-SE", "B-SE" ], [ "T-SE" ], 1, strategy )
+      self.assertTrue( tree["OK"] )
+      self.assertEqual( tree["Value"].keys(), [ "A => T" ] )
+      self.graph.routes[( "A", "T" )].timeToStart = 20.0
+      tree = self.strategy.replicationTree( [ "A-SE", "B-SE" ], [ "T-SE" ], 1, strategy )
+      self.assertTrue( tree["OK"] )
+      self.assertEqual( tree["Value"].keys(), [ "B => T" ], strategy )
 
+  def testSimpleIsCached( self ):
+    """ the load independent tree is memoized """
+    tree = self.strategy.replicationTree( [ "A-SE" ], [ "T-SE" ], 1, "Simple" )
+    self.assertTrue( tree["OK"] )
+    calls = self.graph.findRouteCalls
+    self.assertEqual( self.strategy.replicationTree( [ "A-SE" ], [ "T-SE" ], 1, "Simple" ), tree )
+    self.assertEqual( self.graph.findRouteCalls, calls )
+    # # waiting files added for each file
+    self.assertEqual( self.graph.routes[( "A", "T" )].WaitingFiles, 2 )
 
 # # test execution
 if __name__ == "__main__":
-  pass
+  gTestLoader = unittest.TestLoader()
+  gSuite = gTestLoader.loadTestsFromTestCase( FTSStrategyTests )
+  unittest.TextTestRunner( verbosity = 3 ).run( gSuite )
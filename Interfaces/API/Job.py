@@ -26,12 +26,12 @@
 
 __RCSID__ = "$Id$"
 
-import re, os, types, urllib
+import re, os, types, urllib, copy
 
 from DIRAC                                                    import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Workflow.Parameter                            import Parameter
-from DIRAC.Core.Workflow.Module                               import ModuleDefinition
-from DIRAC.Core.Workflow.Step                                 import StepDefinition
+from DIRAC.Core.Workflow.Parameter                            import Parameter, ParameterCollection, AttributeCollection
+from DIRAC.Core.Workflow.Module                               import ModuleDefinition, DefinitionsPool, InstancesPool
+from DIRAC.Core.Workflow.Step                                 import StepDefinition, StepInstance
 from DIRAC.Core.Workflow.Workflow                             import Workflow
 from DIRAC.Core.Base.API                                      import API
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight                import ClassAd
@@ -92,6 +92,8 @@ class Job( API ):
                       'SystemConfig': 'Member("VALUE",other.CompatiblePlatforms)'}
     ##Add member to handle Parametric jobs
     self.parametric = {}
+    ##( definition names, serialised module and step definitions ) shared by a template job and its copies
+    self._definitionsXML = None
     self.script = script
     if not script:
       self.workflow = Workflow()
@@ -1026,7 +1028,55 @@ class Job( API ):
   def _toXML( self ):
     """Creates an XML representation of itself as a Job.
     """
-    return self.workflow.toXML()
+    if self._definitionsXML is None or self._definitionsXML[0] != self.__getDefinitionNames():
+      return self.workflow.toXML()
+    # Template or copy of a template with the definitions unchanged, they are serialised once
+    return '<Workflow>\n' + AttributeCollection.toXML( self.workflow ) + self.workflow.parameters.toXML() + \
+           self._definitionsXML[1] + self.workflow.step_instances.toXML() + '</Workflow>\n'
+
+  #############################################################################
+  def __getDefinitionNames( self ):
+    """Names of the module and step definitions of the workflow.
+    """
+    return ( sorted( self.workflow.module_definitions.keys() ), sorted( self.workflow.step_definitions.keys() ) )
+
+  #############################################################################
+  def _copy( self ):
+    """Developer function.
+       Creates a new job using this one as a template, e.g. for the tasks of a transformation.
+       The workflow attributes and parameters and the step instances are copied. The module and
+       step definitions objects are shared with the template and serialised once: adding or
+       removing definitions, e.g. with setExecutable, is detected and the job is then fully
+       serialised, but the shared definitions themselves must not be modified in place.
+    """
+    definitionNames = self.__getDefinitionNames()
+    if self._definitionsXML is None or self._definitionsXML[0] != definitionNames:
+      self._definitionsXML = ( definitionNames,
+                               self.workflow.module_definitions.toXML() + self.workflow.step_definitions.toXML() )
+    job = copy.copy( self )
+    job.addToInputSandbox = list( self.addToInputSandbox )
+    job.addToOutputSandbox = list( self.addToOutputSandbox )
+    job.addToInputData = list( self.addToInputData )
+    job.parametric = copy.deepcopy( self.parametric )
+    job.workflow = Workflow()
+    for name, value in self.workflow.items():
+      if name != 'parent':
+        job.workflow[name] = value
+    job.workflow.parameters = ParameterCollection( self.workflow.parameters )
+    # Own pools so that the definitions added to the copy are not added to the template
+    for poolName in ( 'module_definitions', 'step_definitions' ):
+      pool = DefinitionsPool( job.workflow )
+      dict.update( pool, getattr( self.workflow, poolName ) )
+      setattr( job.workflow, poolName, pool )
+    job.workflow.step_instances = InstancesPool( job.workflow )
+    for templateInstance in self.workflow.step_instances:
+      stepInstance = StepInstance( None )
+      for name, value in templateInstance.items():
+        if name != 'parent':
+          stepInstance[name] = value
+      stepInstance.parameters = ParameterCollection( templateInstance.parameters )
+      job.workflow.step_instances.append( stepInstance )
+    return job
 
   #############################################################################
   def _toJDL( self, xmlFile = '' ): #messy but need to account for xml file being in /tmp/guid dir
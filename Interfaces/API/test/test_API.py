@@ -88,6 +88,31 @@ class APISuccess( APITestCase ):
 
     self.assertEqual( xml, expected )
 
+  def test_copy( self ):
+    """ the copies of a template job are independent and serialised as a job built from scratch """
+    self.job.setName( 'jobName' )
+    self.job.setExecutable( 'someExe' )
+    template = Job( self.job._toXML() )
+    copy1 = template._copy()
+    copy2 = template._copy()
+    self.assertEqual( copy1._toXML(), Job( self.job._toXML() )._toXML() )
+
+    copy1.setName( 'otherName' )
+    copy1.workflow.step_instances[0].setValue( 'executable', 'otherExe' )
+    fresh = Job( self.job._toXML() )
+    fresh.setName( 'otherName' )
+    fresh.workflow.step_instances[0].setValue( 'executable', 'otherExe' )
+    self.assertEqual( copy1._toXML(), fresh._toXML() )
+    self.assertEqual( copy2._toXML(), self.job._toXML() )
+    self.assertEqual( template._toXML(), self.job._toXML() )
+
+    # The definitions added to a copy are serialised and not added to the template
+    copy2.setExecutable( 'secondExe' )
+    fresh = Job( self.job._toXML() )
+    fresh.setExecutable( 'secondExe' )
+    self.assertEqual( copy2._toXML(), fresh._toXML() )
+    self.assertEqual( template._copy()._toXML(), self.job._toXML() )
+
 
 
 #############################################################################
@@ -232,21 +232,26 @@ class RequestExecutingAgent( AgentModule ):
     gMonitor.addMark( "Iteration", 1 )
     # # requests (and so tasks) counter
     taskCounter = 0
+    # # requests read in one go but not enqueued yet
+    requestsToProcess = []
     while taskCounter < self.__requestsPerCycle:
       self.log.debug( "execute: executing %d request in this cycle" % taskCounter )
-      getRequest = self.requestClient().getRequest()
-      if not getRequest["OK"]:
-        self.log.error( "execute: %s" % getRequest["Message"] )
-        break
-      if not getRequest["Value"]:
-        self.log.info( "execute: not more 'Waiting' requests to process" )
-        break
+      if not requestsToProcess:
+        getRequests = self.requestClient().getRequests( self.__requestsPerCycle - taskCounter )
+        if not getRequests["OK"]:
+          self.log.error( "execute: %s" % getRequests["Message"] )
+          break
+        if not getRequests["Value"]:
+          self.log.info( "execute: not more 'Waiting' requests to process" )
+          break
+        requestsToProcess = getRequests["Value"]
+        # # save requests in cache, so they are put back if not processed
+        for request in requestsToProcess:
+          self.cacheRequest( request )
       # # OK, we've got you
-      request = getRequest["Value"]
+      request = requestsToProcess.pop( 0 )
       # # set task id
       taskID = request.RequestName
-      # # save current request in cache
-      self.cacheRequest( request )
       # # serialize to JSON
       requestJSON = request.toJSON()
       if not requestJSON["OK"]:
@@ -285,6 +290,13 @@ class RequestExecutingAgent( AgentModule ):
             time.sleep( 0.1 )
             break
 
+    # # put back requests that have not been enqueued
+    for request in requestsToProcess:
+      reset = self.resetRequest( request.RequestName )
+      if not reset["OK"]:
+        self.log.error( "execute: %s" % reset["Message"] )
+      self.cleanCache( request.RequestName )
+
     # # clean return
     return S_OK()
 
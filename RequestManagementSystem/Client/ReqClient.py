@@ -129,6 +129,21 @@ class ReqClient( Client ):
       return getRequest
     return S_OK( Request( getRequest["Value"] ) )
 
+  def getRequests( self, numberOfRequests = 10 ):
+    """ get up to :numberOfRequests: requests from RequestDB in a single call
+
+    :param self: self reference
+    :param int numberOfRequests: maximal number of requests to get
+
+    :return: S_OK( [ Request instance, ... ] ) or S_ERROR
+    """
+    self.log.debug( "getRequests: attempting to get %s requests." % numberOfRequests )
+    getRequests = self.requestManager().getRequests( numberOfRequests )
+    if not getRequests["OK"]:
+      self.log.error( "getRequests: unable to get requests: %s" % getRequests["Message"] )
+      return getRequests
+    return S_OK( [ Request( requestJSON ) for requestJSON in getRequests["Value"] ] )
+
   def peekRequest( self, requestName ):
     """ peek request """
     self.log.debug( "peekRequest: attempting to get request." )
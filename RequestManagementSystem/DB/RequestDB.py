@@ -21,7 +21,6 @@ __RCSID__ = "$Id $"
 # @brief Definition of RequestDB class.
 
 # # imports
-import random
 import threading
 import MySQLdb.cursors
 from MySQLdb import Error as MySQLdbError
@@ -234,69 +233,147 @@ class RequestDB( DB ):
     return S_OK( query[0][0] )
 
 
-  def getRequest( self, requestName = '', assigned = True ):
-    """ read request for execution
+  def __claimRequests( self, selectQuery, assigned = True ):
+    """ select requests with a locking read and flag them as 'Assigned' within the same transaction,
+    so concurrent readers never get the same request
 
-    :param str requestName: request's name (default None)
+    :param str selectQuery: SELECT query returning `RequestID` and `Status` columns
+    :param bool assigned: flag to set the selected requests 'Assigned'
+    :return: S_OK( [ { "RequestID" : ..., "Status" : ... }, ... ] ) or S_ERROR
     """
-    requestID = None
-    if requestName:
-      self.log.info( "getRequest: selecting request '%s'" % requestName )
-      reqIDQuery = "SELECT `RequestID`, `Status` FROM `Request` WHERE `RequestName` = '%s';" % str( requestName )
-      reqID = self._transaction( reqIDQuery )
-      if not reqID["OK"]:
-        self.log.error( "getRequest: %s" % reqID["Message"] )
-        return reqID
-      requestID = reqID["Value"][reqIDQuery][0]["RequestID"] if "RequestID" in reqID["Value"][reqIDQuery][0] else None
-      status = reqID["Value"][reqIDQuery][0]["Status"] if "Status" in reqID["Value"][reqIDQuery][0] else None
-      if not all( ( requestID, status ) ):
-        return S_ERROR( "getRequest: request '%s' not exists" % requestName )
-      if requestID and status and status == "Assigned" and assigned:
-        return S_ERROR( "getRequest: status of request '%s' is 'Assigned', request cannot be selected" % requestName )
-    else:
-      reqIDsQuery = "SELECT `RequestID` FROM `Request` WHERE `Status` = 'Waiting' ORDER BY `LastUpdate` ASC LIMIT 100;"
-      reqIDs = self._transaction( reqIDsQuery )
-      if not reqIDs["OK"]:
-        self.log.error( "getRequest: %s" % reqIDs["Message"] )
-        return reqIDs
-      reqIDs = reqIDs["Value"][reqIDsQuery]
-      reqIDs = [ reqID["RequestID"] for reqID in reqIDs ]
-      if not reqIDs:
-        return S_OK()
-      random.shuffle( reqIDs )
-      requestID = reqIDs[0]
-
-    selectQuery = [ "SELECT * FROM `Request` WHERE `RequestID` = %s;" % requestID,
-                    "SELECT * FROM `Operation` WHERE `RequestID` = %s;" % requestID ]
+    getCursorAndConnection = self.dictCursor()
+    if not getCursorAndConnection["OK"]:
+      return getCursorAndConnection
+    connection, cursor = getCursorAndConnection["Value"]
+    connection.autocommit( False )
+    try:
+      cursor.execute( "%s FOR UPDATE;" % selectQuery.rstrip( "; " ) if assigned else selectQuery )
+      records = list( cursor.fetchall() )
+      toAssign = [ str( record["RequestID"] ) for record in records if record["Status"] != "Assigned" ]
+      if assigned and toAssign:
+        cursor.execute( "UPDATE `Request` SET `Status` = 'Assigned' WHERE `RequestID` IN (%s);" % ",".join( toAssign ) )
+      connection.commit()
+      cursor.close()
+      connection.autocommit( True )
+      return S_OK( records )
+    except MySQLdbError, error:
+      self.log.exception( error )
+      connection.rollback()
+      connection.autocommit( True )
+      cursor.close()
+      return S_ERROR( str( error ) )
+
+  def __releaseRequests( self, requestIDs, status = "Waiting" ):
+    """ put back requests claimed by :__claimRequests: that could not be read """
+    release = self._update( "UPDATE `Request` SET `Status` = '%s' WHERE `RequestID` IN (%s);" % \
+                            ( status, ",".join( [ str( requestID ) for requestID in requestIDs ] ) ) )
+    if not release["OK"]:
+      self.log.error( "__releaseRequests: %s" % release["Message"] )
+    return release
+
+  def __loadRequests( self, requestIDs ):
+    """ build Request instances for a list of RequestIDs reading Request, Operation and File tables
+    with one query each
+
+    :param list requestIDs: list of Request.RequestID
+    :return: S_OK( { requestID : Request, ... } ) or S_ERROR
+    """
+    if not requestIDs:
+      return S_OK( {} )
+    reqIDsStr = ",".join( [ str( requestID ) for requestID in requestIDs ] )
+    selectQuery = [ "SELECT * FROM `Request` WHERE `RequestID` IN (%s);" % reqIDsStr,
+                    "SELECT * FROM `Operation` WHERE `RequestID` IN (%s);" % reqIDsStr,
+                    "SELECT `File`.* FROM `File` JOIN `Operation` ON `File`.`OperationID` = `Operation`.`OperationID` "\
+                      "WHERE `Operation`.`RequestID` IN (%s);" % reqIDsStr ]
     selectReq = self._transaction( selectQuery )
     if not selectReq["OK"]:
-      self.log.error( "getRequest: %s" % selectReq["Message"] )
+      self.log.error( "__loadRequests: %s" % selectReq["Message"] )
       return S_ERROR( selectReq["Message"] )
     selectReq = selectReq["Value"]
 
-    request = Request( selectReq[selectQuery[0]][0] )
+    # # files grouped by OperationID
+    opFiles = {}
+    for getFile in selectReq[selectQuery[2]]:
+      getFileDict = dict( [ ( key, value ) for key, value in getFile.items() if value != None ] )
+      opFiles.setdefault( getFile["OperationID"], [] ).append( getFileDict )
+
+    requests = dict( [ ( records["RequestID"], Request( records ) ) for records in selectReq[selectQuery[0]] ] )
     for records in sorted( selectReq[selectQuery[1]], key = lambda k: k["Order"] ):
+      request = requests.get( records["RequestID"] )
+      if request is None:
+        continue
       # # order is ro, remove
       del records["Order"]
       operation = Operation( records )
-      getFilesQuery = "SELECT * FROM `File` WHERE `OperationID` = %s;" % operation.OperationID
-      getFiles = self._transaction( getFilesQuery )
-      if not getFiles["OK"]:
-        self.log.error( "getRequest: %s" % getFiles["Message"] )
-        return getFiles
-      getFiles = getFiles["Value"][getFilesQuery]
-      for getFile in getFiles:
-        getFileDict = dict( [ ( key, value ) for key, value in getFile.items() if value != None ] )
+      for getFileDict in opFiles.get( operation.OperationID, [] ):
         operation.addFile( File( getFileDict ) )
       request.addOperation( operation )
+    return S_OK( requests )
 
-    if assigned:
-      setAssigned = self._transaction( "UPDATE `Request` SET `Status` = 'Assigned' WHERE RequestID = %s;" % requestID )
-      if not setAssigned["OK"]:
-        self.log.error( "getRequest: %s" % setAssigned["Message"] )
-        return setAssigned
+  def getRequest( self, requestName = '', assigned = True ):
+    """ read request for execution
 
-    return S_OK( request )
+    :param str requestName: request's name (default None)
+    """
+    if not requestName:
+      getRequests = self.getRequests( 1, assigned )
+      if not getRequests["OK"]:
+        return getRequests
+      return S_OK( getRequests["Value"][0] if getRequests["Value"] else None )
+
+    self.log.info( "getRequest: selecting request '%s'" % requestName )
+    reqIDQuery = "SELECT `RequestID`, `Status` FROM `Request` WHERE `RequestName` = '%s'" % str( requestName )
+    reqIDs = self.__claimRequests( reqIDQuery, assigned )
+    if not reqIDs["OK"]:
+      self.log.error( "getRequest: %s" % reqIDs["Message"] )
+      return reqIDs
+    reqIDs = reqIDs["Value"]
+    if not reqIDs:
+      return S_ERROR( "getRequest: request '%s' not exists" % requestName )
+    requestID = reqIDs[0]["RequestID"]
+    if reqIDs[0]["Status"] == "Assigned" and assigned:
+      return S_ERROR( "getRequest: status of request '%s' is 'Assigned', request cannot be selected" % requestName )
+
+    requests = self.__loadRequests( [ requestID ] )
+    if not requests["OK"]:
+      self.log.error( "getRequest: %s" % requests["Message"] )
+      if assigned:
+        self.__releaseRequests( [ requestID ], reqIDs[0]["Status"] )
+      return requests
+    if requestID not in requests["Value"]:
+      return S_ERROR( "getRequest: request '%s' not exists" % requestName )
+
+    return S_OK( requests["Value"][requestID] )
+
+  def getRequests( self, numberOfRequests = 10, assigned = True ):
+    """ read up to :numberOfRequests: 'Waiting' requests for execution, the oldest first
+
+    The requests are selected and set 'Assigned' in a single transaction, their operations and files
+    are read with one query per table.
+
+    :param int numberOfRequests: maximal number of requests to read
+    :param bool assigned: flag to set the selected requests 'Assigned'
+    :return: S_OK( [ Request, ... ] ) or S_ERROR
+    """
+    reqIDsQuery = "SELECT `RequestID`, `Status` FROM `Request` WHERE `Status` = 'Waiting' "\
+      "ORDER BY `LastUpdate` ASC LIMIT %d" % int( numberOfRequests )
+    reqIDs = self.__claimRequests( reqIDsQuery, assigned )
+    if not reqIDs["OK"]:
+      self.log.error( "getRequests: %s" % reqIDs["Message"] )
+      return reqIDs
+    reqIDs = [ reqID["RequestID"] for reqID in reqIDs["Value"] ]
+    if not reqIDs:
+      return S_OK( [] )
+    self.log.info( "getRequests: selected %d requests" % len( reqIDs ) )
+
+    requests = self.__loadRequests( reqIDs )
+    if not requests["OK"]:
+      self.log.error( "getRequests: %s" % requests["Message"] )
+      if assigned:
+        self.__releaseRequests( reqIDs )
+      return requests
+    requests = requests["Value"]
+    return S_OK( [ requests[reqID] for reqID in reqIDs if reqID in requests ] )
 
   def peekRequest( self, requestName ):
     """ get request (ro), no update on states
@@ -141,6 +141,28 @@ class ReqManagerHandler( RequestHandler ):
       gLogger.exception( errStr, lException = error )
       return S_ERROR( errStr )
 
+  types_getRequests = [ ( IntType, LongType ) ]
+  @classmethod
+  def export_getRequests( cls, numberOfRequests = 10 ):
+    """ Get up to :numberOfRequests: 'Waiting' requests from the database in one go """
+    try:
+      getRequests = cls.__requestDB.getRequests( numberOfRequests )
+      if not getRequests["OK"]:
+        gLogger.error( "getRequests: %s" % getRequests["Message"] )
+        return getRequests
+      requestsJSON = []
+      for request in getRequests["Value"]:
+        toJSON = request.toJSON()
+        if not toJSON["OK"]:
+          gLogger.error( toJSON["Message"] )
+          return toJSON
+        requestsJSON.append( toJSON["Value"] )
+      return S_OK( requestsJSON )
+    except Exception, error:
+      errStr = "getRequests: Exception while getting requests."
+      gLogger.exception( errStr, lException = error )
+      return S_ERROR( errStr )
+
   types_peekRequest = [ StringTypes ]
   @classmethod
   def export_peekRequest( cls, requestName = "" ):
@@ -260,6 +260,42 @@ class RequestDBTests( unittest.TestCase ):
     self.assertEqual( len( r ), 2, "3. len wrong" )
 
 
+  def test07BulkRead( self ):
+    """ bulk read of requests """
+
+    db = RequestDB()
+
+    for i in range( 10 ):
+      request = Request( { "RequestName": "bulk-%d" % i } )
+      op = Operation( { "Type": "RemoveReplica", "TargetSE": "CERN-USER" } )
+      op += File( { "LFN": "/lhcb/user/c/cibak/foo-%d" % i } )
+      op += File( { "LFN": "/lhcb/user/c/cibak/bar-%d" % i } )
+      request += op
+      request += Operation( { "Type": "RemoveFile" } )
+      put = db.putRequest( request )
+      self.assertEqual( put["OK"], True, "put failed" )
+
+    get = db.getRequests( 4 )
+    self.assertEqual( get["OK"], True, "getRequests failed: %s" % get.get( "Message", "" ) )
+    requests = get["Value"]
+    self.assertEqual( len( requests ), 4, "wrong number of requests" )
+    for request in requests:
+      self.assertEqual( len( request ), 2, "wrong number of operations" )
+      self.assertEqual( len( request[0] ), 2, "wrong number of files" )
+      self.assertEqual( request[1].Type, "RemoveFile", "wrong operation order" )
+
+    # # assigned requests are not selected again
+    get = db.getRequests( 10 )
+    self.assertEqual( get["OK"], True, "getRequests failed: %s" % get.get( "Message", "" ) )
+    names = [ request.RequestName for request in requests ]
+    for request in get["Value"]:
+      self.assertEqual( request.RequestName in names, False, "request selected twice" )
+
+    for i in range( 10 ):
+      delete = db.deleteRequest( "bulk-%d" % i )
+      self.assertEqual( delete["OK"], True, "delete failed" )
+
+
 
 # # test suite execution
 if __name__ == "__main__":
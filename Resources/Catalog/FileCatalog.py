@@ -10,7 +10,24 @@ from DIRAC  import gLogger, gConfig, S_OK, S_ERROR
 from DIRAC.Resources.Catalog.FileCatalogFactory import FileCatalogFactory
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Security.ProxyInfo import getVOfromProxyGroup
-import types, re
+from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
+from DIRAC.Core.Utilities.ThreadPool import ThreadPool
+import types, re, time, threading, Queue
+
+# Threads for the parallel catalog calls, shared by all the FileCatalog instances
+gCatalogThreadPool = None
+gCatalogThreadPoolLock = threading.Lock()
+
+def getCatalogThreadPool():
+  global gCatalogThreadPool
+  gCatalogThreadPoolLock.acquire()
+  try:
+    if not gCatalogThreadPool:
+      gCatalogThreadPool = ThreadPool( 5, 20 )
+      gCatalogThreadPool.daemonize()
+    return gCatalogThreadPool
+  finally:
+    gCatalogThreadPoolLock.release()
 
 class FileCatalog:
 
@@ -38,6 +55,12 @@ class FileCatalog:
         return result
       self.vo = result['Value']
     self.opHelper = Operations( vo = self.vo )
+    # Opt-in concurrent calls: non-master write catalogs in parallel once the masters succeeded,
+    # read catalogs hedged after HedgeDelay seconds ( 0 queries all of them at once )
+    self.parallelWrite = self.opHelper.getValue( '/Services/Catalogs/ParallelWrite', False )
+    self.parallelRead = self.opHelper.getValue( '/Services/Catalogs/ParallelRead', False )
+    self.hedgeDelay = self.opHelper.getValue( '/Services/Catalogs/HedgeDelay', 0.0 )
+    self.catalogTimeout = self.opHelper.getValue( '/Services/Catalogs/CatalogTimeout', self.timeout )
 
     if type( catalogs ) in types.StringTypes:
       catalogs = [catalogs]
@@ -93,31 +116,22 @@ class FileCatalog:
       return res
     fileInfo = res['Value']
     allLfns = fileInfo.keys()
-    for catalogName, oCatalog, master in self.writeCatalogs:
+    writeCatalogs = self.writeCatalogs
+    if self.parallelWrite:
+      # The masters go first and in sequence, the others in parallel once they are done
+      writeCatalogs = [ catalog for catalog in self.writeCatalogs if catalog[2] ]
+    for catalogName, oCatalog, master in writeCatalogs:
       method = getattr( oCatalog, self.call )
       res = method( fileInfo, **kws )
+      res = self.__addWriteResult( catalogName, master, res, fileInfo, successful, failed, failedCatalogs )
       if not res['OK']:
-        if master:
-          # If this is the master catalog and it fails we dont want to continue with the other catalogs
-          gLogger.error( "FileCatalog.w_execute: Failed to execute %s on master catalog %s." % ( self.call, catalogName ), res['Message'] )
-          return res
-        else:
-          # Otherwise we keep the failed catalogs so we can update their state later
-          failedCatalogs.append( ( catalogName, res['Message'] ) )
-      else:
-        for lfn, message in res['Value']['Failed'].items():
-          # Save the error message for the failed operations
-          if not failed.has_key( lfn ):
-            failed[lfn] = {}
-          failed[lfn][catalogName] = message
-          if master:
-            # If this is the master catalog then we should not attempt the operation on other catalogs
-            fileInfo.pop( lfn )
-        for lfn, result in res['Value']['Successful'].items():
-          # Save the result return for each file for the successful operations
-          if not successful.has_key( lfn ):
-            successful[lfn] = {}
-          successful[lfn][catalogName] = result
+        return res
+    if self.parallelWrite and fileInfo:
+      others = [ ( catalogName, getattr( oCatalog, self.call ), ( dict( fileInfo ), ), kws )
+                 for catalogName, oCatalog, master in self.writeCatalogs if not master ]
+      results = self.__executeParallel( others )
+      for catalogName, _method, _args, _kws in others:
+        self.__addWriteResult( catalogName, False, results[catalogName], fileInfo, successful, failed, failedCatalogs )
     # This recovers the states of the files that completely failed i.e. when S_ERROR is returned by a catalog
     for catalogName, errorMessage in failedCatalogs:
       for file in allLfns:
@@ -127,14 +141,42 @@ class FileCatalog:
     resDict = {'Failed':failed, 'Successful':successful}
     return S_OK( resDict )
 
+  def __addWriteResult( self, catalogName, master, res, fileInfo, successful, failed, failedCatalogs ):
+    """ Merge the result of a write catalog, S_ERROR is returned only for a failing master
+    """
+    if not res['OK']:
+      if master:
+        # If this is the master catalog and it fails we dont want to continue with the other catalogs
+        gLogger.error( "FileCatalog.w_execute: Failed to execute %s on master catalog %s." % ( self.call, catalogName ), res['Message'] )
+        return res
+      # Otherwise we keep the failed catalogs so we can update their state later
+      failedCatalogs.append( ( catalogName, res['Message'] ) )
+      return S_OK()
+    for lfn, message in res['Value']['Failed'].items():
+      # Save the error message for the failed operations
+      if not failed.has_key( lfn ):
+        failed[lfn] = {}
+      failed[lfn][catalogName] = message
+      if master:
+        # If this is the master catalog then we should not attempt the operation on other catalogs
+        fileInfo.pop( lfn, None )
+    for lfn, result in res['Value']['Successful'].items():
+      # Save the result return for each file for the successful operations
+      if not successful.has_key( lfn ):
+        successful[lfn] = {}
+      successful[lfn][catalogName] = result
+    return S_OK()
+
   def r_execute( self, *parms, **kws ):
     """ Read method executor.
     """
     successful = {}
     failed = {}
-    for catalogName, oCatalog, master in self.readCatalogs:
-      method = getattr( oCatalog, self.call )
-      res = method( *parms, **kws )
+    if self.parallelRead:
+      results = self.__readParallel( parms, kws )
+    else:
+      results = self.__readSerial( parms, kws )
+    for res in results:
       if res['OK']:
         if 'Successful' in res['Value']:
           for key, item in res['Value']['Successful'].items():
@@ -149,12 +191,99 @@ class FileCatalog:
             resDict = {'Failed':failed, 'Successful':successful}
             return S_OK( resDict )
         else:
-          return res  
+          return res
     if ( len( successful ) == 0 ) and ( len( failed ) == 0 ):
       return S_ERROR( 'Failed to perform %s from any catalog' % self.call )
     resDict = {'Failed':failed, 'Successful':successful}
     return S_OK( resDict )
 
+  def __readSerial( self, parms, kws ):
+    """ Generator of the read catalogs results, one catalog after the other
+    """
+    for catalogName, oCatalog, master in self.readCatalogs:
+      method = getattr( oCatalog, self.call )
+      yield method( *parms, **kws )
+
+  def __readParallel( self, parms, kws ):
+    """ Generator of the read catalogs results in the order they arrive, the results arrived together
+        are given in the catalogs order. The next catalog is queried when the ones already queried have
+        not answered within the hedge delay or have all answered, all of them at once if the delay is 0
+    """
+    resultQueue = Queue.Queue()
+    threadConfig = ThreadConfig().dump()
+    catalogs = [ ( catalogName, getattr( oCatalog, self.call ) ) for catalogName, oCatalog, master in self.readCatalogs ]
+    # index -> start time of the calls without answer
+    pending = {}
+    nextIndex = 0
+    lastStart = 0
+    while nextIndex < len( catalogs ) or pending:
+      now = time.time()
+      if nextIndex < len( catalogs ) and ( not pending or now - lastStart >= self.hedgeDelay ):
+        catalogName, method = catalogs[nextIndex]
+        self.__submit( nextIndex, catalogName, method, parms, kws, resultQueue, threadConfig )
+        pending[nextIndex] = now
+        lastStart = now
+        nextIndex += 1
+        continue
+      waitTime = min( pending.values() ) + self.catalogTimeout - now
+      if nextIndex < len( catalogs ):
+        waitTime = min( waitTime, lastStart + self.hedgeDelay - now )
+      results = {}
+      try:
+        resultIndex, res = resultQueue.get( True, max( waitTime, 0.01 ) )
+        results[resultIndex] = res
+        while True:
+          resultIndex, res = resultQueue.get_nowait()
+          results[resultIndex] = res
+      except Queue.Empty:
+        pass
+      now = time.time()
+      for index, startTime in pending.items():
+        if index not in results and now - startTime >= self.catalogTimeout:
+          results[index] = S_ERROR( "Timeout calling %s on %s" % ( self.call, catalogs[index][0] ) )
+      for index in sorted( results ):
+        # The late answers of the calls that timed out are ignored
+        if index in pending:
+          del pending[index]
+          yield results[index]
+
+  def __executeParallel( self, calls ):
+    """ Execute the calls [ ( catalogName, method, args, kws ) ] at once in the catalogs thread pool
+        and wait for their results { catalogName : result } at most catalogTimeout seconds
+    """
+    resultQueue = Queue.Queue()
+    threadConfig = ThreadConfig().dump()
+    for catalogName, method, args, kws in calls:
+      self.__submit( catalogName, catalogName, method, args, kws, resultQueue, threadConfig )
+    results = {}
+    deadline = time.time() + self.catalogTimeout
+    while len( results ) < len( calls ):
+      try:
+        catalogName, res = resultQueue.get( True, max( deadline - time.time(), 0.01 ) )
+        results[catalogName] = res
+      except Queue.Empty:
+        break
+    for catalogName, _method, _args, _kws in calls:
+      if catalogName not in results:
+        gLogger.warn( "FileCatalog: timeout calling %s" % self.call, catalogName )
+        results[catalogName] = S_ERROR( "Timeout calling %s on %s" % ( self.call, catalogName ) )
+    return results
+
+  def __submit( self, key, catalogName, method, args, kws, resultQueue, threadConfig ):
+    """ Queue a catalog call in the thread pool, ( key, result ) is put in the resultQueue
+    """
+    def execute():
+      # The calls are done on behalf of the caller identity
+      ThreadConfig().reset()
+      ThreadConfig().load( threadConfig )
+      try:
+        res = method( *args, **kws )
+      except Exception, x:
+        gLogger.exception( "FileCatalog: exception calling %s on %s" % ( self.call, catalogName ) )
+        res = S_ERROR( "Exception calling %s on %s: %s" % ( self.call, catalogName, str( x ) ) )
+      resultQueue.put( ( key, res ) )
+    return getCatalogThreadPool().generateJobAndQueueIt( execute )
+
   ###########################################################################################
   #
   # Below is the method for obtaining the objects instantiated for a provided catalogue configuration
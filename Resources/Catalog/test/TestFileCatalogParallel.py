@@ -0,0 +1,97 @@
+""" Unit tests of the parallel reads of the FileCatalog with fake catalogs answering after a delay
+"""
+
+import time
+import unittest
+
+from DIRAC.Resources.Catalog.FileCatalog import FileCatalog
+from DIRAC import S_OK, S_ERROR
+
+class FakeCatalog:
+  """ Catalog answering getReplicas after some delay
+  """
+
+  def __init__( self, name, delay, successful = None, failed = None, error = False ):
+    self.name = name
+    self.delay = delay
+    self.successful = successful or {}
+    self.failed = failed or {}
+    self.error = error
+    self.calls = 0
+
+  def getReplicas( self, lfns ):
+    self.calls += 1
+    time.sleep( self.delay )
+    if self.error:
+      return S_ERROR( '%s is down' % self.name )
+    return S_OK( { 'Successful' : dict( self.successful ), 'Failed' : dict( self.failed ) } )
+
+class ParallelFileCatalog( FileCatalog ):
+  """ FileCatalog reading the fake catalogs in parallel, the configuration is not read
+  """
+
+  def __init__( self, fakeCatalogs, hedgeDelay, catalogTimeout ):
+    self.valid = True
+    self.readCatalogs = [ ( fake.name, fake, index == 0 ) for index, fake in enumerate( fakeCatalogs ) ]
+    self.writeCatalogs = []
+    self.parallelWrite = False
+    self.parallelRead = True
+    self.hedgeDelay = hedgeDelay
+    self.catalogTimeout = catalogTimeout
+
+class FileCatalogParallelReadCase( unittest.TestCase ):
+
+  def getCatalog( self, fakeCatalogs, hedgeDelay, catalogTimeout = 10 ):
+    return ParallelFileCatalog( fakeCatalogs, hedgeDelay, catalogTimeout )
+
+  def test_fastPrimary( self ):
+    """ the hedge is not fired when the first catalog answers in time """
+    primary = FakeCatalog( 'Primary', 0.0, successful = { '/lfn' : 'Primary' } )
+    secondary = FakeCatalog( 'Secondary', 0.0, successful = { '/lfn' : 'Secondary' } )
+    result = self.getCatalog( [ primary, secondary ], 1.0 ).getReplicas( [ '/lfn' ] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Successful'], { '/lfn' : 'Primary' } )
+    self.assertEqual( secondary.calls, 0 )
+
+  def test_slowPrimary( self ):
+    """ a complete answer of the hedged catalog is accepted without waiting for the first one """
+    primary = FakeCatalog( 'Primary', 2.0, successful = { '/lfn' : 'Primary' } )
+    secondary = FakeCatalog( 'Secondary', 0.0, successful = { '/lfn' : 'Secondary' } )
+    start = time.time()
+    result = self.getCatalog( [ primary, secondary ], 0.2 ).getReplicas( [ '/lfn' ] )
+    self.assertTrue( time.time() - start < 1.5 )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Successful'], { '/lfn' : 'Secondary' } )
+
+  def test_partialAnswers( self ):
+    """ the partial answers are merged, the first catalog wins among the answers arrived together """
+    primary = FakeCatalog( 'Primary', 0.3, successful = { '/lfn1' : 'Primary' }, failed = { '/lfn2' : 'No such file' } )
+    secondary = FakeCatalog( 'Secondary', 0.0, successful = { '/lfn1' : 'Secondary', '/lfn2' : 'Secondary' } )
+    result = self.getCatalog( [ primary, secondary ], 0.0 ).getReplicas( [ '/lfn1', '/lfn2' ] )
+    self.assertTrue( result['OK'] )
+    # The secondary answers first and completely
+    self.assertEqual( result['Value']['Successful'], { '/lfn1' : 'Secondary', '/lfn2' : 'Secondary' } )
+
+    primary = FakeCatalog( 'Primary', 0.0, successful = { '/lfn1' : 'Primary' }, failed = { '/lfn2' : 'No such file' } )
+    secondary = FakeCatalog( 'Secondary', 0.3, successful = { '/lfn1' : 'Secondary', '/lfn2' : 'Secondary' } )
+    result = self.getCatalog( [ primary, secondary ], 0.0 ).getReplicas( [ '/lfn1', '/lfn2' ] )
+    self.assertEqual( result['Value']['Successful'], { '/lfn1' : 'Primary', '/lfn2' : 'Secondary' } )
+
+  def test_failedPrimary( self ):
+    """ the next catalog is queried at once when the first one fails """
+    primary = FakeCatalog( 'Primary', 0.0, error = True )
+    secondary = FakeCatalog( 'Secondary', 0.0, successful = { '/lfn' : 'Secondary' } )
+    start = time.time()
+    result = self.getCatalog( [ primary, secondary ], 5.0 ).getReplicas( [ '/lfn' ] )
+    self.assertTrue( time.time() - start < 2.0 )
+    self.assertEqual( result['Value']['Successful'], { '/lfn' : 'Secondary' } )
+
+  def test_timeout( self ):
+    """ the catalogs not answering within the timeout are given up """
+    primary = FakeCatalog( 'Primary', 2.0, successful = { '/lfn' : 'Primary' } )
+    result = self.getCatalog( [ primary ], 0.0, catalogTimeout = 0.3 ).getReplicas( [ '/lfn' ] )
+    self.assertFalse( result['OK'] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileCatalogParallelReadCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
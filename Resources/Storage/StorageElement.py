@@ -9,10 +9,15 @@
     self.localProtocols is a list of the local protocols that were created by StorageFactory
     self.remoteProtocols is a list of the remote protocols that were created by StorageFactory
     self.protocolOptions is a list of dictionaries containing the options found in the CS. (should be removed)
+
+    getStorageElement returns StorageElement objects shared by the whole process, they are built once
+    per SE name, protocols and VO and kept until their lifetime expires or the CS changes.
 """
 __RCSID__ = "$Id$"
 ## custom duty
 import re
+import time
+import threading
 from types import ListType, StringType, StringTypes, DictType
 ## from DIRAC
 from DIRAC import gLogger, S_OK, S_ERROR, gConfig
@@ -21,6 +26,8 @@ from DIRAC.Core.Utilities.Pfn import pfnparse
 from DIRAC.Core.Utilities.SiteSEMapping import getSEsForSite
 from DIRAC.Core.Security.ProxyInfo import getVOfromProxyGroup
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
+from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
+from DIRAC.ConfigurationSystem.private.Refresher import gRefresher
 
 class StorageElement:
   """
@@ -697,3 +704,74 @@ class StorageElement:
     res = S_OK( pfnDict )
     res['Failed'] = failed
     return res
+
+class StorageElementCache( object ):
+  """
+  .. class:: StorageElementCache
+
+  process wide cache of the valid StorageElement objects, the storage plugins are reused by all the callers
+  """
+
+  def __init__( self, lifeTime = 600 ):
+    """ c'tor
+
+    :param int lifeTime: seconds an SE object is kept, the whole cache is dropped anyhow when the CS changes
+    """
+    self.lifeTime = lifeTime
+    self.__cache = {}
+    self.__cfg = None
+    self.__lock = threading.Lock()
+
+  def get( self, name, protocols = None, vo = None ):
+    """ get the StorageElement for :name:, building it if needed
+
+    :param str name: SE name
+    :param list protocols: requested protocols
+    :param str vo: VO, the one of the proxy group by default
+    """
+    if not vo:
+      result = getVOfromProxyGroup()
+      if not result['OK']:
+        return StorageElement( name, protocols )
+      vo = result['Value']
+    if protocols is not None:
+      protocols = list( protocols )
+      key = ( name, tuple( protocols ), vo )
+    else:
+      key = ( name, None, vo )
+    gRefresher.refreshConfigurationIfNeeded()
+    cfg = gConfigurationData.mergedCFG
+    self.__lock.acquire()
+    try:
+      if cfg is not self.__cfg:
+        self.__cache = {}
+        self.__cfg = cfg
+      cached = self.__cache.get( key )
+      if cached and cached[0] > time.time():
+        return cached[1]
+    finally:
+      self.__lock.release()
+    storageElement = StorageElement( name, protocols, vo )
+    # Do not keep the SEs that failed to be created, the reason may be transient
+    if storageElement.valid:
+      self.__lock.acquire()
+      try:
+        if cfg is self.__cfg:
+          self.__cache[key] = ( time.time() + self.lifeTime, storageElement )
+      finally:
+        self.__lock.release()
+    return storageElement
+
+  def clear( self ):
+    """ drop all the cached SEs """
+    self.__lock.acquire()
+    try:
+      self.__cache = {}
+    finally:
+      self.__lock.release()
+
+gStorageElementCache = StorageElementCache()
+
+def getStorageElement( name, protocols = None, vo = None ):
+  """ shared StorageElement for :name:, see StorageElementCache.get """
+  return gStorageElementCache.get( name, protocols, vo )
@@ -35,6 +35,9 @@ from sets import Set
 THROTTLING_TIME = 86400
 THROTTLING_STEPS = 12
 
+# Maximum number of replicas inserted, updated or selected by a single statement
+MAX_REPLICAS_PER_STATEMENT = 1000
+
 class StorageManagementDB( DB ):
 
   def __init__( self, systemInstance = 'Default', maxQueueSize = 10 ):
@@ -44,6 +47,8 @@ class StorageManagementDB( DB ):
     self.REPLICAPARAMS = ['ReplicaID', 'Type', 'Status', 'SE', 'LFN', 'PFN', 'Size', 'FileChecksum', 'GUID', 'SubmitTime', 'LastUpdate', 'Reason', 'Links']
     self.STAGEPARAMS = ['ReplicaID', 'StageStatus', 'RequestID', 'StageRequestSubmitTime', 'StageRequestCompletedTime', 'PinLength', 'PinExpiryTime']
     self.STATES = ['Failed', 'New', 'Waiting', 'Offline', 'StageSubmitted', 'Staged']
+    # Log the records before and after each state transition, it costs two more queries per transition
+    self.auditLog = gConfig.getValue( '%s/AuditLog' % self.cs_path, False )
 
   def __getConnection( self, connection ):
     if connection:
@@ -56,6 +61,20 @@ class StorageManagementDB( DB ):
 
   def _caller( self ):
     return inspect.stack()[2][3]
+
+  def __auditRecords( self, table, idName, ids, action, method, connection = False ):
+    """ Log the records of table with their idName in ids, only if the AuditLog option is set
+    """
+    if not self.auditLog or not ids:
+      return
+    caller = inspect.stack()[2][3]
+    req = "SELECT * FROM %s WHERE %s IN (%s);" % ( table, idName, intListToString( ids ) )
+    res = self._query( req, connection )
+    if not res['OK']:
+      gLogger.info( "%s.%s_DB: problem retrieving records: %s. %s" % ( caller, method, req, res['Message'] ) )
+      return
+    for record in res['Value']:
+      gLogger.info( "%s.%s_DB: %s %s = %s" % ( caller, method, action, table, record ) )
   ################################################################
   #
   # State machine management
@@ -78,29 +97,12 @@ class StorageManagementDB( DB ):
     if not toUpdate:
       return S_OK( toUpdate )
 
-    reqSelect = "SELECT * FROM Tasks WHERE TaskID IN (%s) AND Status != '%s';" % ( intListToString( toUpdate ), newTaskStatus )
-    resSelect = self._query( reqSelect, connection )
-    if not resSelect['OK']:
-      gLogger.error( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), '__updateTaskStatus', reqSelect, resSelect['Message'] ) )
-
+    self.__auditRecords( 'Tasks', 'TaskID', toUpdate, 'to_update', '__updateTaskStatus', connection )
     req = "UPDATE Tasks SET Status='%s',LastUpdate=UTC_TIMESTAMP() WHERE TaskID IN (%s) AND Status != '%s';" % ( newTaskStatus, intListToString( toUpdate ), newTaskStatus )
     res = self._update( req, connection )
     if not res['OK']:
       return res
-
-    taskIDs = []
-    for record in resSelect['Value']:
-      taskIDs.append( record[0] )
-      gLogger.info( "%s.%s_DB: to_update Tasks =  %s" % ( self._caller(), '__updateTaskStatus', record ) )
-
-    if len( taskIDs ) > 0:
-      reqSelect1 = "SELECT * FROM Tasks WHERE TaskID IN (%s);" % intListToString( taskIDs )
-      resSelect1 = self._query( reqSelect1, connection )
-      if not resSelect1["OK"]:
-        gLogger.info( "%s.%s_DB: problem retrieving records: %s. %s" % ( self._caller(), '__updateTaskStatus', reqSelect1, resSelect1['Message'] ) )
-
-      for record in resSelect1['Value']:
-        gLogger.info( "%s.%s_DB: updated Tasks = %s" % ( self._caller(), '__updateTaskStatus', record ) )
+    self.__auditRecords( 'Tasks', 'TaskID', toUpdate, 'updated', '__updateTaskStatus', connection )
 
     return S_OK( toUpdate )
 
@@ -147,32 +149,18 @@ class StorageManagementDB( DB ):
     toUpdate = res['Value']
     if not toUpdate:
       return S_OK( toUpdate )
-    reqSelect = "SELECT * FROM CacheReplicas WHERE ReplicaID IN (%s) AND Status != '%s';" % ( intListToString( toUpdate ), newReplicaStatus )
-    resSelect = self._query( reqSelect, connection )
-    if not resSelect['OK']:
-      gLogger.error( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'updateReplicaStatus', reqSelect, resSelect['Message'] ) )
-
+    self.__auditRecords( 'CacheReplicas', 'ReplicaID', toUpdate, 'to_update', 'updateReplicaStatus', connection )
     req = "UPDATE CacheReplicas SET Status='%s',LastUpdate=UTC_TIMESTAMP() WHERE ReplicaID IN (%s) AND Status != '%s';" % ( newReplicaStatus, intListToString( toUpdate ), newReplicaStatus )
     res = self._update( req, connection )
     if not res['OK']:
       return res
+    self.__auditRecords( 'CacheReplicas', 'ReplicaID', toUpdate, 'updated', 'updateReplicaStatus', connection )
 
-    replicaIDs = []
-    for record in resSelect['Value']:
-      replicaIDs.append( record[0] )
-      gLogger.info( "%s.%s_DB: to_update CacheReplicas =  %s" % ( self._caller(), 'updateReplicaStatus', record ) )
-    if len( replicaIDs ) > 0:
-      reqSelect1 = "SELECT * FROM CacheReplicas WHERE ReplicaID IN (%s);" % intListToString( replicaIDs )
-      resSelect1 = self._query( reqSelect1, connection )
-      if not resSelect1['OK']:
-        gLogger.info( "%s.%s_DB: problem retrieving records: %s. %s" % ( self._caller(), 'updateReplicaStatus', reqSelect1, resSelect1['Message'] ) )
-
-    for record in resSelect1['Value']:
-      gLogger.info( "%s.%s_DB: updated CacheReplicas = %s" % ( self._caller(), 'updateReplicaStatus', record ) )
-
-    res = self._updateTasksForReplica( replicaIDs, connection = connection )
-    if not res['OK']:
-      return res
+    # The tasks only have to be updated if some replica changed
+    if res['Value']:
+      res = self._updateTasksForReplica( toUpdate, connection = connection )
+      if not res['OK']:
+        return res
     return S_OK( toUpdate )
 
   def _updateTasksForReplica( self, replicaIDs, connection = False ):
@@ -180,18 +168,27 @@ class StorageManagementDB( DB ):
     for state in self.STATES:
       tasksInStatus[state] = []
 
-    req = "SELECT T.TaskID,T.Status FROM Tasks AS T, TaskReplicas AS R WHERE R.ReplicaID IN ( %s ) AND R.TaskID = T.TaskID GROUP BY T.TaskID;" % intListToString( replicaIDs )
+    if not replicaIDs:
+      return S_OK( tasksInStatus )
+
+    # The distinct replica states of all the tasks of the replicas in one go
+    req = "SELECT T.TaskID,T.Status,C.Status FROM ( SELECT DISTINCT TaskID FROM TaskReplicas WHERE ReplicaID IN ( %s ) ) AS A " % intListToString( replicaIDs )
+    req += "JOIN Tasks AS T ON T.TaskID = A.TaskID JOIN TaskReplicas AS R ON R.TaskID = A.TaskID "
+    req += "LEFT JOIN CacheReplicas AS C ON C.ReplicaID = R.ReplicaID GROUP BY T.TaskID,C.Status;"
     res = self._query( req, connection )
     if not res['OK']:
       return res
 
-    for taskId, status in res['Value']:
-      subreq = "SELECT DISTINCT(C.Status) FROM TaskReplicas AS R, CacheReplicas AS C WHERE R.TaskID=%s AND R.ReplicaID = C.ReplicaID;" % taskId
-      subres = self._query( subreq, connection )
-      if not subres['OK']:
-        return subres
+    taskStatus = {}
+    cacheStates = {}
+    for taskId, status, cacheStatus in res['Value']:
+      taskStatus[taskId] = status
+      cacheStates.setdefault( taskId, [] )
+      if cacheStatus is not None:
+        cacheStates[taskId].append( cacheStatus )
 
-      cacheStatesForTask = [row[0] for row in subres['Value']]
+    for taskId, status in taskStatus.items():
+      cacheStatesForTask = cacheStates[taskId]
       if not cacheStatesForTask:
         tasksInStatus['Failed'].append( taskId )
         continue
@@ -273,28 +270,12 @@ class StorageManagementDB( DB ):
     toUpdate = res['Value']
     if not toUpdate:
       return S_OK( toUpdate )
-    reqSelect = "Select * FROM CacheReplicas WHERE ReplicaID IN (%s) AND Status != '%s';" % ( intListToString( toUpdate ), newStageStatus )
-    resSelect = self._query( reqSelect, connection )
-    if not resSelect['OK']:
-      gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'updateStageRequestStatus', reqSelect, resSelect['Message'] ) )
-
+    self.__auditRecords( 'CacheReplicas', 'ReplicaID', toUpdate, 'to_update', 'updateStageRequestStatus', connection )
     req = "UPDATE CacheReplicas SET Status='%s',LastUpdate=UTC_TIMESTAMP() WHERE ReplicaID IN (%s) AND Status != '%s';" % ( newStageStatus, intListToString( toUpdate ), newStageStatus )
     res = self._update( req, connection )
     if not res['OK']:
       return res
-
-    replicaIDs = []
-    for record in resSelect['Value']:
-      replicaIDs.append( record[0] )
-      gLogger.info( "%s.%s_DB: to_update CacheReplicas =  %s" % ( self._caller(), 'updateStageRequestStatus', record ) )
-
-    reqSelect1 = "SELECT * FROM CacheReplicas WHERE ReplicaID IN (%s);" % intListToString( replicaIDs )
-    resSelect1 = self._query( reqSelect1, connection )
-    if not resSelect1['OK']:
-      gLogger.info( "%s.%s_DB: problem retrieving records: %s. %s" % ( self._caller(), 'updateStageRequestStatus', reqSelect1, resSelect1['Message'] ) )
-
-    for record in resSelect1['Value']:
-      gLogger.info( "%s.%s_DB: updated CacheReplicas = %s" % ( self._caller(), 'updateStageRequestStatus', record ) )
+    self.__auditRecords( 'CacheReplicas', 'ReplicaID', toUpdate, 'updated', 'updateStageRequestStatus', connection )
 
     # Now update the replicas associated to the replicaIDs
     newReplicaStatus = self.__getReplicaStateFromStageState( newStageStatus )
@@ -512,7 +493,6 @@ class StorageManagementDB( DB ):
     taskID = res['Value']
     # Get the Replicas which already exist in the CacheReplicas table
     allReplicaIDs = []
-    taskStates = []
     for se, lfns in lfnDict.items():
       if type( lfns ) in types.StringTypes:
         lfns = [lfns]
@@ -520,25 +500,19 @@ class StorageManagementDB( DB ):
       if not res['OK']:
         return res
       existingReplicas = res['Value']
+      if existingReplicas:
+        gLogger.verbose( 'StorageManagementDB.setRequest: %d replicas already exist in CacheReplicas table @ %s' % ( len( existingReplicas ), se ) )
       # Insert the CacheReplicas that do not already exist
-      for lfn in lfns:
-        if lfn in existingReplicas.keys():
-          gLogger.verbose( 'StorageManagementDB.setRequest: Replica already exists in CacheReplicas table %s @ %s' % ( lfn, se ) )
-          existingFileState = existingReplicas[lfn][1]
-          taskState = self.__getTaskStateFromReplicaState( existingFileState )
-        else:
-          res = self._insertReplicaInformation( lfn, se, 'Stage', connection = connection )
-          if not res['OK']:
-            self._cleanTask( taskID, connection = connection )
-            return res
-
-          existingReplicas[lfn] = ( res['Value'], 'New' )
-          newFileState = existingReplicas[lfn][1]
-          taskState = self.__getTaskStateFromReplicaState( newFileState )
-        if not taskState in taskStates:
-          taskStates.append( taskState )
-
+      newLFNs = list( set( lfns ) - set( existingReplicas ) )
+      if newLFNs:
+        res = self._insertReplicaInformationBulk( newLFNs, se, 'Stage', connection = connection )
+        if not res['OK']:
+          self._cleanTask( taskID, connection = connection )
+          return res
+        for lfn, replicaID in res['Value'].items():
+          existingReplicas[lfn] = ( replicaID, 'New' )
       allReplicaIDs.extend( existingReplicas.values() )
+    taskStates = set( [ self.__getTaskStateFromReplicaState( status ) for _replicaID, status in allReplicaIDs ] )
     # Insert all the replicas into the TaskReplicas table
     res = self._insertTaskReplicaInformation( taskID, allReplicaIDs, connection = connection )
     if not res['OK']:
@@ -546,7 +520,7 @@ class StorageManagementDB( DB ):
       return res
     # Check whether the the task status is Done based on the existing file states
     # If all the files for a particular Task are 'Staged', update the Task
-    if taskStates == ['Staged']:
+    if taskStates == set( ['Staged'] ):
     #so if the tasks are for LFNs from the lfns dictionary, which are already staged,
     #they immediately change state New->Done. Fixed it to translate such tasks to 'Staged' state
       self.__updateTaskStatus( [taskID], 'Staged', True, connection = connection )
@@ -570,11 +544,7 @@ class StorageManagementDB( DB ):
       return res
     #gLogger.info( "%s_DB:%s" % ('_createTask',req))
     taskID = res['lastRowId']
-    reqSelect = "SELECT * FROM Tasks WHERE TaskID = %s;" % ( taskID )
-    resSelect = self._query( reqSelect, connection )
-    if not resSelect['OK']:
-      gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), '_createTask', reqSelect, resSelect['Message'] ) )
-    gLogger.info( "%s.%s_DB: inserted Tasks = %s" % ( self._caller(), '_createTask', resSelect['Value'][0] ) )
+    self.__auditRecords( 'Tasks', 'TaskID', [ taskID ], 'inserted', '_createTask', connection )
 
     #gLogger.info("StorageManagementDB._createTask: Created task with ('%s','%s','%s') and obtained TaskID %s" % (source,callbackMethod,sourceTaskID,taskID))
     return S_OK( taskID )
@@ -582,14 +552,15 @@ class StorageManagementDB( DB ):
   def _getExistingReplicas( self, storageElement, lfns, connection = False ):
     """ Obtains the ReplicasIDs for the replicas already entered in the CacheReplicas table """
     connection = self.__getConnection( connection )
-    req = "SELECT ReplicaID,LFN,Status FROM CacheReplicas WHERE SE = '%s' AND LFN IN (%s);" % ( storageElement, stringListToString( lfns ) )
-    res = self._query( req, connection )
-    if not res['OK']:
-      gLogger.error( 'StorageManagementDB._getExistingReplicas: Failed to get existing replicas.', res['Message'] )
-      return res
     existingReplicas = {}
-    for replicaID, lfn, status in res['Value']:
-      existingReplicas[lfn] = ( replicaID, status )
+    for i in range( 0, len( lfns ), MAX_REPLICAS_PER_STATEMENT ):
+      req = "SELECT ReplicaID,LFN,Status FROM CacheReplicas WHERE SE = '%s' AND LFN IN (%s);" % ( storageElement, stringListToString( lfns[i:i + MAX_REPLICAS_PER_STATEMENT] ) )
+      res = self._query( req, connection )
+      if not res['OK']:
+        gLogger.error( 'StorageManagementDB._getExistingReplicas: Failed to get existing replicas.', res['Message'] )
+        return res
+      for replicaID, lfn, status in res['Value']:
+        existingReplicas[lfn] = ( replicaID, status )
     return S_OK( existingReplicas )
 
   def _insertReplicaInformation( self, lfn, storageElement, type, connection = False ):
@@ -612,20 +583,61 @@ class StorageManagementDB( DB ):
     #gLogger.verbose("_insertReplicaInformation: Inserted Replica ('%s','%s') and obtained ReplicaID %s" % (lfn,storageElement,replicaID))
     return S_OK( replicaID )
 
-  def _insertTaskReplicaInformation( self, taskID, replicaIDs, connection = False ):
-    """ Enter the replicas into TaskReplicas table """
+  def _insertReplicaInformationBulk( self, lfns, storageElement, type, connection = False ):
+    """ Enter the replicas into the CacheReplicas table with multi-row inserts, returns { lfn : replicaID } """
     connection = self.__getConnection( connection )
-    req = "INSERT INTO TaskReplicas (TaskID,ReplicaID) VALUES "
-    for replicaID, status in replicaIDs:
-      replicaString = "(%s,%s)," % ( taskID, replicaID )
-      req = "%s %s" % ( req, replicaString )
-    req = req.rstrip( ',' )
-    res = self._update( req, connection )
+    res = self._escapeString( storageElement )
     if not res['OK']:
-      gLogger.error( 'StorageManagementDB._insertTaskReplicaInformation: Failed to insert to TaskReplicas table.', res['Message'] )
       return res
-    #gLogger.info( "%s_DB:%s" % ('_insertTaskReplicaInformation',req))
-    gLogger.info( "StorageManagementDB._insertTaskReplicaInformation: Successfully added %s CacheReplicas to Task %s." % ( res['Value'], taskID ) )
+    e_se = res['Value']
+    replicaIDs = {}
+    for i in range( 0, len( lfns ), MAX_REPLICAS_PER_STATEMENT ):
+      chunk = lfns[i:i + MAX_REPLICAS_PER_STATEMENT]
+      e_lfns = []
+      for lfn in chunk:
+        res = self._escapeString( lfn )
+        if not res['OK']:
+          return res
+        e_lfns.append( res['Value'] )
+      values = [ "('%s',%s,%s,'',0,'','',UTC_TIMESTAMP(),UTC_TIMESTAMP())" % ( type, e_se, e_lfn ) for e_lfn in e_lfns ]
+      req = "INSERT INTO CacheReplicas (Type,SE,LFN,PFN,Size,FileChecksum,GUID,SubmitTime,LastUpdate) VALUES %s;" % ','.join( values )
+      res = self._update( req, connection )
+      if not res['OK']:
+        gLogger.error( "_insertReplicaInformationBulk: Failed to insert to CacheReplicas table.", res['Message'] )
+        return res
+      # The IDs of a multi-row insert are not necessarily consecutive (innodb_autoinc_lock_mode=2,
+      # auto_increment_increment>1), the rows are found by SE and LFN which identify a replica.
+      # They are not older than the first row of the insert, if a concurrent request inserted the
+      # same replica meanwhile the lowest ID is kept
+      firstID = res['lastRowId']
+      req = "SELECT ReplicaID,LFN FROM CacheReplicas WHERE SE = %s AND LFN IN (%s) AND ReplicaID >= %d ORDER BY ReplicaID DESC;" % \
+            ( e_se, ','.join( e_lfns ), firstID )
+      res = self._query( req, connection )
+      if not res['OK']:
+        gLogger.error( "_insertReplicaInformationBulk: Failed to get the inserted ReplicaIDs.", res['Message'] )
+        return res
+      for replicaID, lfn in res['Value']:
+        replicaIDs[lfn] = replicaID
+      self.__auditRecords( 'CacheReplicas', 'ReplicaID', [ replicaIDs[lfn] for lfn in chunk if lfn in replicaIDs ], 'inserted',
+                           '_insertReplicaInformationBulk', connection )
+    missing = [ lfn for lfn in lfns if lfn not in replicaIDs ]
+    if missing:
+      return S_ERROR( "_insertReplicaInformationBulk: %d inserted replicas not found" % len( missing ) )
+    return S_OK( replicaIDs )
+
+  def _insertTaskReplicaInformation( self, taskID, replicaIDs, connection = False ):
+    """ Enter the replicas into TaskReplicas table """
+    connection = self.__getConnection( connection )
+    inserted = 0
+    for i in range( 0, len( replicaIDs ), MAX_REPLICAS_PER_STATEMENT ):
+      values = [ "(%d,%d)" % ( int( taskID ), int( replicaID ) ) for replicaID, _status in replicaIDs[i:i + MAX_REPLICAS_PER_STATEMENT] ]
+      req = "INSERT INTO TaskReplicas (TaskID,ReplicaID) VALUES %s" % ','.join( values )
+      res = self._update( req, connection )
+      if not res['OK']:
+        gLogger.error( 'StorageManagementDB._insertTaskReplicaInformation: Failed to insert to TaskReplicas table.', res['Message'] )
+        return res
+      inserted += res['Value']
+    gLogger.info( "StorageManagementDB._insertTaskReplicaInformation: Successfully added %s CacheReplicas to Task %s." % ( inserted, taskID ) )
     return S_OK()
 
   #
@@ -715,31 +727,16 @@ class StorageManagementDB( DB ):
     updated = res['Value']
     if not updated:
       return S_OK( updated )
+    reasons = {}
     for replicaID in updated:
-      reqSelect = "Select * FROM CacheReplicas WHERE ReplicaID = %d" % ( replicaID )
-      resSelect = self._query( reqSelect )
-      if not resSelect['OK']:
-        gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'updateReplicaFailure', reqSelect, resSelect['Message'] ) )
-
-      req = "UPDATE CacheReplicas SET Reason = '%s' WHERE ReplicaID = %d" % ( terminalReplicaIDs[replicaID], replicaID )
-      res = self._update( req )
+      res = self._escapeString( terminalReplicaIDs[replicaID] )
       if not res['OK']:
-        gLogger.error( 'StorageManagementDB.updateReplicaFailure: Failed to update replica fail reason.', res['Message'] )
         return res
-
-      replicaIDs = []
-      for record in resSelect['Value']:
-        replicaIDs.append( record[0] )
-        gLogger.info( "%s.%s_DB: to_update CacheReplicas =  %s" % ( self._caller(), 'updateReplicaFailure', record ) )
-
-      reqSelect1 = "SELECT * FROM CacheReplicas WHERE ReplicaID IN (%s);" % intListToString( replicaIDs )
-      resSelect1 = self._query( reqSelect1 )
-      if not resSelect1['OK']:
-        gLogger.info( "%s.%s_DB: problem retrieving records: %s. %s" % ( self._caller(), 'updateReplicaFailure', reqSelect1, resSelect1['Message'] ) )
-
-      for record in resSelect1['Value']:
-        gLogger.info( "%s.%s_DB: updated CacheReplicas = %s" % ( self._caller(), 'updateReplicaFailure', record ) )
-
+      reasons[replicaID] = res['Value']
+    res = self.__updateReplicaColumns( { 'Reason' : reasons }, 'updateReplicaFailure' )
+    if not res['OK']:
+      gLogger.error( 'StorageManagementDB.updateReplicaFailure: Failed to update replica fail reason.', res['Message'] )
+      return res
     return S_OK( updated )
 
   ####################################################################
@@ -748,33 +745,81 @@ class StorageManagementDB( DB ):
   #
 
   def updateReplicaInformation( self, replicaTuples ):
-    """ This method set the replica size information and pfn for the requested storage element.  """
-    for replicaID, pfn, size in replicaTuples:
-      reqSelect = "SELECT * FROM CacheReplicas WHERE ReplicaID = %s and Status != 'Cancelled';" % ( replicaID )
-      resSelect = self._query( reqSelect )
-      if not resSelect['OK']:
-        gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'updateReplicaInformation', reqSelect, resSelect['Message'] ) )
+    """ This method set the replica size information and pfn for the requested storage element.
+        replicaTuples are ( replicaID, pfn, size ) or ( replicaID, pfn, size, status ), the status being
+        Waiting by default. All the valid replicas are updated in a single transaction, the ones with
+        an invalid ID or size are not updated and returned in the Failed dictionary with the reason
+    """
+    pfns = {}
+    sizes = {}
+    states = {}
+    failed = {}
+    for replicaTuple in replicaTuples:
+      replicaID, pfn, size = replicaTuple[:3]
+      status = 'Waiting'
+      if len( replicaTuple ) > 3:
+        status = replicaTuple[3]
+      try:
+        replicaID = int( replicaID )
+        size = int( size )
+      except ( TypeError, ValueError ):
+        gLogger.error( 'StagerDB.updateReplicaInformation: Invalid replica information.', '%s %s' % ( replicaID, size ) )
+        failed[replicaID] = 'Invalid replica ID or size: %s' % size
+        continue
+      res = self._escapeString( pfn )
+      if not res['OK']:
+        return res
+      pfns[replicaID] = res['Value']
+      sizes[replicaID] = str( size )
+      res = self._escapeString( status )
+      if not res['OK']:
+        return res
+      states[replicaID] = res['Value']
+    if not pfns:
+      return S_OK( { 'Successful' : [], 'Failed' : failed } )
+    res = self.__updateReplicaColumns( { 'PFN' : pfns, 'Size' : sizes, 'Status' : states }, 'updateReplicaInformation',
+                                       "Status != 'Cancelled'" )
+    if not res['OK']:
+      gLogger.error( 'StagerDB.updateReplicaInformation: Failed to insert replica information.', res['Message'] )
+      return res
+    gLogger.debug( 'StagerDB.updateReplicaInformation: Successfully updated %s CacheReplicas records' % len( pfns ) )
+    return S_OK( { 'Successful' : sorted( pfns ), 'Failed' : failed } )
 
-      req = "UPDATE CacheReplicas SET PFN = '%s', Size = %s, Status = 'Waiting' WHERE ReplicaID = %s and Status != 'Cancelled';" % ( pfn, size, replicaID )
+  def __updateReplicaColumns( self, columnValues, method, condition = '' ):
+    """ Set per replica values of CacheReplicas columns with one CASE statement per chunk of replicas,
+        all of them in one transaction. columnValues is { column : { replicaID : escapedValue } }
+        and all the columns must be given for the same replicas
+    """
+    replicaIDs = sorted( columnValues.values()[0].keys() )
+    reqs = []
+    for i in range( 0, len( replicaIDs ), MAX_REPLICAS_PER_STATEMENT ):
+      chunk = replicaIDs[i:i + MAX_REPLICAS_PER_STATEMENT]
+      setList = []
+      for column, values in columnValues.items():
+        cases = ' '.join( [ 'WHEN %d THEN %s' % ( replicaID, values[replicaID] ) for replicaID in chunk ] )
+        setList.append( '%s = CASE ReplicaID %s END' % ( column, cases ) )
+      req = "UPDATE CacheReplicas SET %s WHERE ReplicaID IN (%s)" % ( ', '.join( setList ), intListToString( chunk ) )
+      if condition:
+        req = "%s AND %s" % ( req, condition )
+      reqs.append( req )
+    self.__auditRecords( 'CacheReplicas', 'ReplicaID', replicaIDs, 'to_update', method )
+    # The transaction is on the connection of the current thread, the chunks already
+    # updated are rolled back if one fails
+    res = self.transactionStart()
+    if not res['OK']:
+      return res
+    updated = 0
+    for req in reqs:
       res = self._update( req )
       if not res['OK']:
-        gLogger.error( 'StagerDB.updateReplicaInformation: Failed to insert replica information.', res['Message'] )
-
-      replicaIDs = []
-      for record in resSelect['Value']:
-        replicaIDs.append( record[0] )
-        gLogger.info( "%s.%s_DB: to_update CacheReplicas =  %s" % ( self._caller(), 'updateReplicaInformation', record ) )
-
-      reqSelect1 = "SELECT * FROM CacheReplicas WHERE ReplicaID IN (%s);" % intListToString( replicaIDs )
-      resSelect1 = self._query( reqSelect1 )
-      if not resSelect1['OK']:
-        gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'updateReplicaInformation', reqSelect1, resSelect1['Message'] ) )
-
-      for record in resSelect1['Value']:
-        gLogger.info( "%s.%s_DB: updated CacheReplicas = %s" % ( self._caller(), 'updateReplicaInformation', record ) )
-
-      gLogger.debug( 'StagerDB.updateReplicaInformation: Successfully updated CacheReplicas record With Status=Waiting, for ReplicaID= %s' % ( replicaID ) )
-    return S_OK()
+        self.transactionRollback()
+        return res
+      updated += res['Value']
+    res = self.transactionCommit()
+    if not res['OK']:
+      return res
+    self.__auditRecords( 'CacheReplicas', 'ReplicaID', replicaIDs, 'updated', method )
+    return S_OK( updated )
 
   ####################################################################
   #
@@ -807,13 +852,7 @@ class StorageManagementDB( DB ):
       return res
 
     for requestID, replicaIDs in requestDict.items():
-      for replicaID in replicaIDs:
-        #fix, no individual queries
-        reqSelect = "SELECT * FROM StageRequests WHERE ReplicaID = %s AND RequestID = '%s';" % ( replicaID, requestID )
-        resSelect = self._query( reqSelect )
-        if not resSelect['OK']:
-          gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'insertStageRequest', reqSelect, resSelect['Message'] ) )
-        gLogger.info( "%s.%s_DB: inserted StageRequests = %s" % ( self._caller(), 'insertStageRequest', resSelect['Value'][0] ) )
+      self.__auditRecords( 'StageRequests', 'ReplicaID', replicaIDs, 'inserted', 'insertStageRequest' )
 
     #gLogger.info( "%s_DB: howmany = %s" % ('insertStageRequest',res))
 
@@ -829,28 +868,14 @@ class StorageManagementDB( DB ):
   def setStageComplete( self, replicaIDs ):
     # Daniela: FIX wrong PinExpiryTime (84000->86400 seconds = 1 day)
 
-    reqSelect = "SELECT * FROM StageRequests WHERE ReplicaID IN (%s);" % intListToString( replicaIDs )
-    resSelect = self._query( reqSelect )
-    if not resSelect['OK']:
-      gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'setStageComplete', reqSelect, resSelect['Message'] ) )
-      return resSelect
-
+    self.__auditRecords( 'StageRequests', 'ReplicaID', replicaIDs, 'to_update', 'setStageComplete' )
     req = "UPDATE StageRequests SET StageStatus='Staged',StageRequestCompletedTime = UTC_TIMESTAMP(),PinExpiryTime = DATE_ADD(UTC_TIMESTAMP(),INTERVAL ( PinLength / %s ) SECOND) WHERE ReplicaID IN (%s);" % ( THROTTLING_STEPS, intListToString( replicaIDs ) )
     res = self._update( req )
     if not res['OK']:
       gLogger.error( "StorageManagementDB.setStageComplete: Failed to set StageRequest completed.", res['Message'] )
       return res
 
-    for record in resSelect['Value']:
-      gLogger.info( "%s.%s_DB: to_update StageRequests =  %s" % ( self._caller(), 'setStageComplete', record ) )
-
-    reqSelect1 = "SELECT * FROM StageRequests WHERE ReplicaID IN (%s);" % intListToString( replicaIDs )
-    resSelect1 = self._query( reqSelect1 )
-    if not resSelect1['OK']:
-      gLogger.info( "%s.%s_DB: problem retrieving record: %s. %s" % ( self._caller(), 'setStageComplete', reqSelect1, resSelect1['Message'] ) )
-
-    for record in resSelect1['Value']:
-      gLogger.info( "%s.%s_DB: updated StageRequests = %s" % ( self._caller(), 'setStageComplete', record ) )
+    self.__auditRecords( 'StageRequests', 'ReplicaID', replicaIDs, 'updated', 'setStageComplete' )
 
     gLogger.debug( "StorageManagementDB.setStageComplete: Successfully updated %s StageRequests table with StageStatus=Staged for ReplicaIDs: %s." % ( res['Value'], replicaIDs ) )
     return res
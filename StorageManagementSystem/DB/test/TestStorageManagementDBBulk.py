@@ -0,0 +1,112 @@
+""" Unit tests of the bulk replica insertion and update of the StorageManagementDB, the MySQL
+    calls are replaced by a fake CacheReplicas table or recorded by FakeMySQL
+"""
+
+import re
+import unittest
+
+import DIRAC.StorageManagementSystem.DB.StorageManagementDB as moduleTested
+from DIRAC.StorageManagementSystem.DB.StorageManagementDB import StorageManagementDB
+from DIRAC.Core.Base.test.FakeMySQL import FakeMySQL
+from DIRAC import S_OK
+
+class FakeStorageManagementDB( StorageManagementDB ):
+  """ StorageManagementDB with an in memory CacheReplicas table, does not connect to MySQL
+  """
+
+  def __init__( self, rows, nextID, increment = 1 ):
+    self.auditLog = False
+    # ( ReplicaID, SE, LFN )
+    self.rows = rows
+    self.nextID = nextID
+    self.increment = increment
+
+  def _getConnection( self ):
+    return S_OK( 'connection' )
+
+  def _escapeString( self, myString, conn = None ):
+    return S_OK( "'%s'" % myString )
+
+  def _update( self, cmd, conn = None ):
+    values = re.findall( r"\('Stage','([^']*)','([^']*)'", cmd )
+    firstID = self.nextID
+    for se, lfn in values:
+      self.rows.append( ( self.nextID, se, lfn ) )
+      self.nextID += self.increment
+    res = S_OK( len( values ) )
+    res['lastRowId'] = firstID
+    return res
+
+  def _query( self, cmd, conn = None ):
+    se = re.search( r"SE = '([^']*)'", cmd ).group( 1 )
+    lfns = re.findall( r"'(/[^']*)'", cmd )
+    firstID = int( re.search( r"ReplicaID >= (\d+)", cmd ).group( 1 ) )
+    return S_OK( [ ( replicaID, lfn ) for replicaID, rowSE, lfn in sorted( self.rows, reverse = True )
+                   if rowSE == se and lfn in lfns and replicaID >= firstID ] )
+
+class InsertReplicasCase( unittest.TestCase ):
+
+  def test_nonConsecutiveIDs( self ):
+    """ the IDs of a multi-row insert may have gaps, the replicas of other SEs are not taken """
+    rows = [ ( 5, 'SE', '/lfn1' ), ( 6, 'OtherSE', '/lfn2' ) ]
+    smDB = FakeStorageManagementDB( rows, 10, increment = 2 )
+    res = smDB._insertReplicaInformationBulk( [ '/lfn1', '/lfn2', '/lfn3' ], 'SE', 'Stage' )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], { '/lfn1' : 10, '/lfn2' : 12, '/lfn3' : 14 } )
+
+  def test_concurrentDuplicate( self ):
+    """ the rows inserted by a concurrent request for the same replicas are not taken """
+    # /lfn1 was inserted by another request before and /lfn2 will be inserted just after
+    rows = [ ( 5, 'SE', '/lfn1' ) ]
+    smDB = FakeStorageManagementDB( rows, 10 )
+    update = smDB._update
+    def concurrentUpdate( cmd, conn = None ):
+      res = update( cmd, conn )
+      rows.append( ( smDB.nextID, 'SE', '/lfn2' ) )
+      smDB.nextID += 1
+      return res
+    smDB._update = concurrentUpdate
+    res = smDB._insertReplicaInformationBulk( [ '/lfn1', '/lfn2' ], 'SE', 'Stage' )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], { '/lfn1' : 10, '/lfn2' : 11 } )
+
+class RecordingStorageManagementDB( FakeMySQL, StorageManagementDB ):
+  auditLog = False
+
+class UpdateReplicasCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.maxReplicas = moduleTested.MAX_REPLICAS_PER_STATEMENT
+    moduleTested.MAX_REPLICAS_PER_STATEMENT = 2
+
+  def tearDown( self ):
+    moduleTested.MAX_REPLICAS_PER_STATEMENT = self.maxReplicas
+
+  def test_updateReplicaInformation( self ):
+    smDB = RecordingStorageManagementDB()
+    res = smDB.updateReplicaInformation( [ ( replicaID, 'pfn%d' % replicaID, 10 ) for replicaID in range( 1, 6 ) ] )
+    self.assert_( res['OK'] )
+    self.assertEqual( smDB.getCalls(), [ 'start', 'update', 'update', 'update', 'commit' ] )
+    self.assert_( "WHERE ReplicaID IN (5) AND Status != 'Cancelled'" in smDB.getCalls( 'update' )[2] )
+
+  def test_updateReplicaInformationRollback( self ):
+    """ the chunks updated before the failing one are rolled back """
+    smDB = RecordingStorageManagementDB( failOn = [ 'WHERE ReplicaID IN (3,4)' ] )
+    res = smDB.updateReplicaInformation( [ ( replicaID, 'pfn%d' % replicaID, 10 ) for replicaID in range( 1, 6 ) ] )
+    self.assertFalse( res['OK'] )
+    self.assertEqual( smDB.getCalls(), [ 'start', 'update', 'update', 'rollback' ] )
+
+  def test_updateReplicaInformationInvalidSize( self ):
+    """ the replicas with an invalid size are failed, the others are updated """
+    smDB = RecordingStorageManagementDB()
+    res = smDB.updateReplicaInformation( [ ( 1, 'pfn1', 10 ), ( 2, 'pfn2', None ), ( 3, 'pfn3', 'big' ) ] )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value']['Successful'], [ 1 ] )
+    self.assertEqual( sorted( res['Value']['Failed'] ), [ 2, 3 ] )
+    self.assertEqual( smDB.getCalls(), [ 'start', 'update', 'commit' ] )
+    self.assert_( "WHERE ReplicaID IN (1) AND" in smDB.getCalls( 'update' )[0] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( InsertReplicasCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( UpdateReplicasCase ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -260,10 +260,14 @@ class WorkflowTasks( TaskBase ):
       ownerGroup = proxyInfo['group']
 
 
+    # The transformation body is parsed once, the tasks are copies of this template job
+    templateJob = self.jobClass( transBody )
+    site = templateJob.workflow.findParameter( 'Site' ).getValue()
+    hospitalTrans = [int( x ) for x in self.opsH.getValue( "Hospital/Transformations", [] )]
+
     for taskNumber in sorted( taskDict ):
-      oJob = self.jobClass( transBody )
+      oJob = templateJob._copy()
       paramsDict = taskDict[taskNumber]
-      site = oJob.workflow.findParameter( 'Site' ).getValue()
       paramsDict['Site'] = site
       transID = paramsDict['TransformationID']
       self.log.verbose( 'Setting job owner:group to %s:%s' % ( owner, ownerGroup ) )
@@ -297,7 +301,6 @@ class WorkflowTasks( TaskBase ):
       self._handleInputs( oJob, paramsDict )
       self._handleRest( oJob, paramsDict )
 
-      hospitalTrans = [int( x ) for x in self.opsH.getValue( "Hospital/Transformations", [] )]
       if int( transID ) in hospitalTrans:
         self._handleHospital( oJob )
 
@@ -311,7 +314,7 @@ class WorkflowTasks( TaskBase ):
           continue
         for name, output in res['Value'].items():
           oJob._addJDLParameter( name, ';'.join( output ) )
-      taskDict[taskNumber]['TaskObject'] = self.jobClass( oJob._toXML() )
+      taskDict[taskNumber]['TaskObject'] = oJob
     return S_OK( taskDict )
 
   #############################################################################
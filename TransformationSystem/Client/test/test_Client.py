@@ -32,6 +32,7 @@ class ClientsTestCase( unittest.TestCase ):
 
     self.jobMock2.workflow = mockWF
     self.jobMock2.setDestination.return_value = {'OK':True}
+    self.jobMock2._copy.return_value = self.jobMock2
     self.jobMock.workflow.return_value = ''
     self.jobMock.return_value = self.jobMock2
 
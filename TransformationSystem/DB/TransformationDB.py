@@ -512,19 +512,16 @@ class TransformationDB( DB ):
 
       req = "%s %s" % ( req, self.buildCondition( condDict, older, newer, timeStamp, orderAttribute, limit,
                                                   offset = offset ) )
-    res = self._query( req, connection )
-    if not res['OK']:
-      return res
-
-    transFiles = res['Value']
-    fileIDs = [int( row[1] ) for row in transFiles]
+    # Stream the files, resolving the LFNs chunk by chunk unless they are already known
+    lfnsKnown = bool( originalFileIDs )
     webList = []
     resultList = []
-    if not fileIDs:
-      originalFileIDs = {}
-    else:
-      if not originalFileIDs:
-        res = self.__getLfnsForFileIDs( fileIDs, connection = connection )
+    for res in self._queryIter( req ):
+      if not res['OK']:
+        return res
+      transFiles = res['Value']
+      if not lfnsKnown:
+        res = self.__getLfnsForFileIDs( [int( row[1] ) for row in transFiles], connection = connection )
         if not res['OK']:
           return res
         originalFileIDs = res['Value'][1]
@@ -21,7 +21,7 @@ from DIRAC.Core.Utilities.ClassAd.ClassAdLight                 import ClassAd
 from DIRAC.Core.Utilities.SiteSEMapping                        import getSEsForSite
 from DIRAC.Core.Utilities.Time                                 import fromString, toEpoch
 from DIRAC.StorageManagementSystem.Client.StorageManagerClient import StorageManagerClient
-from DIRAC.Resources.Storage.StorageElement                    import StorageElement
+from DIRAC.Resources.Storage.StorageElement                    import getStorageElement
 from DIRAC.ConfigurationSystem.Client.Helpers.Resources        import getSiteTier
 
 
@@ -285,7 +285,7 @@ class JobSchedulingAgent( OptimizerModule ):
       for se in closeSEs:
         if se not in seDict:
           try:
-            storageElement = StorageElement( se )
+            storageElement = getStorageElement( se )
             seDict[se] = storageElement.getStatus()['Value']
           except Exception:
             self.log.exception( 'Failed to instantiate StorageElement( %s )' % se )
@@ -415,7 +415,7 @@ class JobSchedulingAgent( OptimizerModule ):
     siteTapeSEs = []
     siteDiskSEs = []
     for se in destinationSEs:
-      storageElement = StorageElement( se )
+      storageElement = getStorageElement( se )
       seStatus = storageElement.getStatus()['Value']
       if seStatus['Read'] and seStatus['TapeSE']:
         siteTapeSEs.append( se )
@@ -21,7 +21,10 @@ from DIRAC.Core.DISET.RPCClient                            import RPCClient
 from DIRAC.Core.Security                                   import CS
 from DIRAC.Core.Utilities.SiteCEMapping                    import getSiteForCE
 from DIRAC.Core.Utilities.Time                             import dateTime, second
-import os, base64, bz2, tempfile, random, socket
+from DIRAC.Core.Utilities.ThreadPool                       import ThreadPool
+from DIRAC.FrameworkSystem.Client.MonitoringClient         import gMonitor
+from DIRAC.WorkloadManagementSystem.private.CircuitBreaker import CircuitBreaker
+import os, base64, bz2, tempfile, random, socket, time, threading, Queue
 import DIRAC
 
 __RCSID__ = "$Id$"
@@ -33,6 +36,8 @@ WAITING_PILOT_STATUS = ['Submitted', 'Waiting', 'Scheduled', 'Ready']
 FINAL_PILOT_STATUS = ['Aborted', 'Failed', 'Done']
 MAX_PILOTS_TO_SUBMIT = 100
 MAX_JOBS_IN_FILLMODE = 5
+MAX_THREADS = 10
+CE_TIMEOUT = 300
 
 class SiteDirector( AgentModule ):
   """
@@ -53,6 +58,14 @@ class SiteDirector( AgentModule ):
     self.queueDict = {}
     self.maxJobsInFillMode = MAX_JOBS_IN_FILLMODE
     self.maxPilotsToSubmit = MAX_PILOTS_TO_SUBMIT
+    # Independent queues are served concurrently, a slow CE only delays its own queues
+    self.threadPool = ThreadPool( 1, self.am_getOption( 'MaxThreads', MAX_THREADS ) )
+    self.threadPool.daemonize()
+    # Queues still busy with a call started in a previous cycle
+    self.busyQueues = set()
+    self.busyQueuesLock = threading.Lock()
+    self.ceBreaker = CircuitBreaker()
+    gMonitor.registerActivity( 'CETimeouts', 'CE calls timed out', 'SiteDirector', 'calls', gMonitor.OP_SUM )
     return S_OK()
 
   def beginExecution( self ):
@@ -104,6 +117,9 @@ class SiteDirector( AgentModule ):
     self.maxPilotsToSubmit = self.am_getOption( 'MaxPilotsToSubmit', self.maxPilotsToSubmit )
     self.pilotWaitingFlag = self.am_getOption( 'PilotWaitingFlag', True )
     self.pilotWaitingTime = self.am_getOption( 'MaxPilotWaitingTime', 7200 )
+    self.ceTimeout = self.am_getOption( 'CETimeout', CE_TIMEOUT )
+    self.ceBreaker.maxFailures = self.am_getOption( 'CEMaxFailures', 3 )
+    self.ceBreaker.openTime = self.am_getOption( 'CEBlockingTime', 1800 )
 
     # Flags
     self.updateStatus = self.am_getOption( 'UpdatePilotStatus', True )
@@ -164,6 +180,12 @@ class SiteDirector( AgentModule ):
         self.log.always( "Site: %s, CE: %s, Queue: %s" % ( self.queueDict[queue]['Site'],
                                                          self.queueDict[queue]['CEName'],
                                                          queue ) )
+        for action in ( 'Submission', 'StatusUpdate', 'OutputRetrieval' ):
+          gMonitor.registerActivity( '%s-%s' % ( action, queue ), '%s time for queue %s' % ( action, queue ),
+                                     'SiteDirector', 'seconds', gMonitor.OP_MEAN )
+    openCircuits = self.ceBreaker.getOpenCircuits()
+    if openCircuits:
+      self.log.warn( 'CEs temporarily skipped after repeated failures:', ', '.join( openCircuits ) )
 
     return S_OK()
 
@@ -304,176 +326,280 @@ class SiteDirector( AgentModule ):
 
     queues = self.queueDict.keys()
     random.shuffle( queues )
-    for queue in queues:
-      ce = self.queueDict[queue]['CE']
-      ceName = self.queueDict[queue]['CEName']
-      ceType = self.queueDict[queue]['CEType']
-      queueName = self.queueDict[queue]['QueueName']
-      siteName = self.queueDict[queue]['Site']
-      siteMask = siteName in siteMaskList
+    results = self.__executeForQueues( self.__submitToQueue, queues, 'Submission', siteMaskList )
+    for queue, result in results.items():
+      if not result['OK']:
+        self.log.error( 'Errors in the submission to queue %s:' % queue, result['Message'] )
 
-      if 'CPUTime' in self.queueDict[queue]['ParametersDict'] :
-        queueCPUTime = int( self.queueDict[queue]['ParametersDict']['CPUTime'] )
-      else:
-        self.log.warn( 'CPU time limit is not specified for queue %s, skipping...' % queue )
-        continue
-      if queueCPUTime > self.maxQueueLength:
-        queueCPUTime = self.maxQueueLength
+    return S_OK()
 
-      # Get the working proxy
-      cpuTime = queueCPUTime + 86400
+  def __submitToQueue( self, queue, siteMaskList ):
+    """ Submit pilots to a given queue if necessary, executed in the thread pool
+    """
+    ce = self.queueDict[queue]['CE']
+    ceName = self.queueDict[queue]['CEName']
+    ceType = self.queueDict[queue]['CEType']
+    queueName = self.queueDict[queue]['QueueName']
+    siteName = self.queueDict[queue]['Site']
+    siteMask = siteName in siteMaskList
+
+    if 'CPUTime' in self.queueDict[queue]['ParametersDict'] :
+      queueCPUTime = int( self.queueDict[queue]['ParametersDict']['CPUTime'] )
+    else:
+      self.log.warn( 'CPU time limit is not specified for queue %s, skipping...' % queue )
+      return S_OK()
+    if queueCPUTime > self.maxQueueLength:
+      queueCPUTime = self.maxQueueLength
 
-      self.log.verbose( "Getting pilot proxy for %s/%s %d long" % ( self.pilotDN, self.pilotGroup, cpuTime ) )
-      result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, cpuTime )
-      if not result['OK']:
-        return result
-      self.proxy = result['Value']
-      ce.setProxy( self.proxy, cpuTime - 60 )
+    # Get the working proxy
+    cpuTime = queueCPUTime + 86400
 
-      # Get the number of available slots on the target site/queue
-      result = ce.available()
-      if not result['OK']:
-        self.log.warn( 'Failed to check the availability of queue %s: \n%s' % ( queue, result['Message'] ) )
-        continue
-      ceInfoDict = result['CEInfoDict']
-      self.log.info( "CE queue report(%s_%s): Wait=%d, Run=%d, Submitted=%d, Max=%d" % \
-                     ( ceName, queueName, ceInfoDict['WaitingJobs'], ceInfoDict['RunningJobs'],
-                       ceInfoDict['SubmittedJobs'], ceInfoDict['MaxTotalJobs'] ) )
-
-      totalSlots = result['Value']
-
-      ceDict = ce.getParameterDict()
-      ceDict[ 'GridCE' ] = ceName
-      if not siteMask and 'Site' in ceDict:
-        self.log.info( 'Site not in the mask %s' % siteName )
-        self.log.info( 'Removing "Site" from matching Dict' )
-        del ceDict[ 'Site' ]
-      if self.vo:
-        ceDict['Community'] = self.vo
-      if self.voGroups:
-        ceDict['OwnerGroup'] = self.voGroups
-      
-      # This is a hack to get rid of !
-      ceDict['SubmitPool'] = self.defaultSubmitPools  
+    self.log.verbose( "Getting pilot proxy for %s/%s %d long" % ( self.pilotDN, self.pilotGroup, cpuTime ) )
+    result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, cpuTime )
+    if not result['OK']:
+      return result
+    proxy = result['Value']
+    self.proxy = proxy
+    ce.setProxy( proxy, cpuTime - 60 )
 
-      result = Resources.getCompatiblePlatforms( self.platforms )
-      if not result['OK']:
-        continue
-      ceDict['Platform'] = result['Value']
+    # Get the number of available slots on the target site/queue
+    result = ce.available()
+    if not result['OK']:
+      self.ceBreaker.recordFailure( ceName )
+      self.log.warn( 'Failed to check the availability of queue %s: \n%s' % ( queue, result['Message'] ) )
+      return S_OK()
+    self.ceBreaker.recordSuccess( ceName )
+    ceInfoDict = result['CEInfoDict']
+    self.log.info( "CE queue report(%s_%s): Wait=%d, Run=%d, Submitted=%d, Max=%d" % \
+                   ( ceName, queueName, ceInfoDict['WaitingJobs'], ceInfoDict['RunningJobs'],
+                     ceInfoDict['SubmittedJobs'], ceInfoDict['MaxTotalJobs'] ) )
+
+    totalSlots = result['Value']
+
+    ceDict = ce.getParameterDict()
+    ceDict[ 'GridCE' ] = ceName
+    if not siteMask and 'Site' in ceDict:
+      self.log.info( 'Site not in the mask %s' % siteName )
+      self.log.info( 'Removing "Site" from matching Dict' )
+      del ceDict[ 'Site' ]
+    if self.vo:
+      ceDict['Community'] = self.vo
+    if self.voGroups:
+      ceDict['OwnerGroup'] = self.voGroups
 
-      # Get the number of eligible jobs for the target site/queue
-      result = rpcMatcher.getMatchingTaskQueues( ceDict )
-      if not result['OK']:
-        self.log.error( 'Could not retrieve TaskQueues from TaskQueueDB', result['Message'] )
-        return result
-      taskQueueDict = result['Value']
-      if not taskQueueDict:
-        self.log.info( 'No matching TQs found' )
-        continue
+    # This is a hack to get rid of !
+    ceDict['SubmitPool'] = self.defaultSubmitPools
 
-      totalTQJobs = 0
-      tqIDList = taskQueueDict.keys()
-      for tq in taskQueueDict:
-        totalTQJobs += taskQueueDict[tq]['Jobs']
+    result = Resources.getCompatiblePlatforms( self.platforms )
+    if not result['OK']:
+      return S_OK()
+    ceDict['Platform'] = result['Value']
 
-      pilotsToSubmit = min( totalSlots, totalTQJobs )
+    # Get the number of eligible jobs for the target site/queue
+    rpcMatcher = RPCClient( "WorkloadManagement/Matcher" )
+    result = rpcMatcher.getMatchingTaskQueues( ceDict )
+    if not result['OK']:
+      self.log.error( 'Could not retrieve TaskQueues from TaskQueueDB', result['Message'] )
+      return result
+    taskQueueDict = result['Value']
+    if not taskQueueDict:
+      self.log.info( 'No matching TQs found' )
+      return S_OK()
 
-      # Get the number of already waiting pilots for this queue
-      totalWaitingPilots = 0
-      if self.pilotWaitingFlag:
-        lastUpdateTime = dateTime() - self.pilotWaitingTime * second
-        result = pilotAgentsDB.countPilots( { 'TaskQueueID': tqIDList,
-                                              'Status': WAITING_PILOT_STATUS },
-                                            None, lastUpdateTime )
-        if not result['OK']:
-          self.log.error( 'Failed to get Number of Waiting pilots', result['Message'] )
-          totalWaitingPilots = 0
-        else:
-          totalWaitingPilots = result['Value']
-          self.log.verbose( 'Waiting Pilots for TaskQueue %s:' % tqIDList, totalWaitingPilots )
+    totalTQJobs = 0
+    tqIDList = taskQueueDict.keys()
+    for tq in taskQueueDict:
+      totalTQJobs += taskQueueDict[tq]['Jobs']
 
-      pilotsToSubmit = max( 0, min( totalSlots, totalTQJobs-totalWaitingPilots ) )
-      self.log.info( 'Available slots=%d, TQ jobs=%d, Waiting Pilots=%d, Pilots to submit=%d' % \
-                              ( totalSlots, totalTQJobs, totalWaitingPilots, pilotsToSubmit ) )
+    pilotsToSubmit = min( totalSlots, totalTQJobs )
 
-      # Limit the number of pilots to submit to MAX_PILOTS_TO_SUBMIT
-      pilotsToSubmit = min( self.maxPilotsToSubmit, pilotsToSubmit )
+    # Get the number of already waiting pilots for this queue
+    totalWaitingPilots = 0
+    if self.pilotWaitingFlag:
+      lastUpdateTime = dateTime() - self.pilotWaitingTime * second
+      result = pilotAgentsDB.countPilots( { 'TaskQueueID': tqIDList,
+                                            'Status': WAITING_PILOT_STATUS },
+                                          None, lastUpdateTime )
+      if not result['OK']:
+        self.log.error( 'Failed to get Number of Waiting pilots', result['Message'] )
+        totalWaitingPilots = 0
+      else:
+        totalWaitingPilots = result['Value']
+        self.log.verbose( 'Waiting Pilots for TaskQueue %s:' % tqIDList, totalWaitingPilots )
 
-      while pilotsToSubmit > 0:
-        self.log.info( 'Going to submit %d pilots to %s queue' % ( pilotsToSubmit, queue ) )
+    pilotsToSubmit = max( 0, min( totalSlots, totalTQJobs-totalWaitingPilots ) )
+    self.log.info( 'Available slots=%d, TQ jobs=%d, Waiting Pilots=%d, Pilots to submit=%d' % \
+                            ( totalSlots, totalTQJobs, totalWaitingPilots, pilotsToSubmit ) )
 
-        bundleProxy = self.queueDict[queue].get( 'BundleProxy', False )
-        jobExecDir = ''
-        if ceType == 'CREAM':
-          jobExecDir = '.'
-        jobExecDir = self.queueDict[queue].get( 'JobExecDir', jobExecDir )
-        httpProxy = self.queueDict[queue].get( 'HttpProxy', '' )
+    # Limit the number of pilots to submit to MAX_PILOTS_TO_SUBMIT
+    pilotsToSubmit = min( self.maxPilotsToSubmit, pilotsToSubmit )
 
-        result = self.__getExecutable( queue, pilotsToSubmit, bundleProxy, httpProxy, jobExecDir )
-        if not result['OK']:
-          return result
+    while pilotsToSubmit > 0:
+      self.log.info( 'Going to submit %d pilots to %s queue' % ( pilotsToSubmit, queue ) )
 
-        executable, pilotSubmissionChunk = result['Value']
-        result = ce.submitJob( executable, '', pilotSubmissionChunk )
-        if not result['OK']:
-          self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
-          pilotsToSubmit = 0
-          continue
-        
-        pilotsToSubmit = pilotsToSubmit - pilotSubmissionChunk
-        # Add pilots to the PilotAgentsDB assign pilots to TaskQueue proportionally to the
-        # task queue priorities
-        pilotList = result['Value']
-        self.log.info( 'Submitted %d pilots to %s@%s' % ( len( pilotList), queueName, ceName ) )
-        stampDict = {}
-        if result.has_key( 'PilotStampDict' ):
-          stampDict = result['PilotStampDict']
-        tqPriorityList = []
-        sumPriority = 0.
-        for tq in taskQueueDict:
-          sumPriority += taskQueueDict[tq]['Priority']
-          tqPriorityList.append( ( tq, sumPriority ) )
+      bundleProxy = self.queueDict[queue].get( 'BundleProxy', False )
+      jobExecDir = ''
+      if ceType == 'CREAM':
+        jobExecDir = '.'
+      jobExecDir = self.queueDict[queue].get( 'JobExecDir', jobExecDir )
+      httpProxy = self.queueDict[queue].get( 'HttpProxy', '' )
+
+      result = self.__getExecutable( queue, pilotsToSubmit, bundleProxy, httpProxy, jobExecDir, proxy )
+      if not result['OK']:
+        return result
+
+      executable, pilotSubmissionChunk = result['Value']
+      result = ce.submitJob( executable, '', pilotSubmissionChunk )
+      if not result['OK']:
+        self.ceBreaker.recordFailure( ceName )
+        self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
+        pilotsToSubmit = 0
+        continue
+      self.ceBreaker.recordSuccess( ceName )
+
+      pilotsToSubmit = pilotsToSubmit - pilotSubmissionChunk
+      # Add pilots to the PilotAgentsDB assign pilots to TaskQueue proportionally to the
+      # task queue priorities
+      pilotList = result['Value']
+      self.log.info( 'Submitted %d pilots to %s@%s' % ( len( pilotList), queueName, ceName ) )
+      stampDict = {}
+      if result.has_key( 'PilotStampDict' ):
+        stampDict = result['PilotStampDict']
+      tqPriorityList = []
+      sumPriority = 0.
+      for tq in taskQueueDict:
+        sumPriority += taskQueueDict[tq]['Priority']
+        tqPriorityList.append( ( tq, sumPriority ) )
+      rndm = random.random()*sumPriority
+      tqDict = {}
+      for pilotID in pilotList:
         rndm = random.random()*sumPriority
-        tqDict = {}
-        for pilotID in pilotList:
-          rndm = random.random()*sumPriority
-          for tq, prio in tqPriorityList:
-            if rndm < prio:
-              tqID = tq
-              break
-          if not tqDict.has_key( tqID ):
-            tqDict[tqID] = []
-          tqDict[tqID].append( pilotID )
-
-        for tqID, pilotList in tqDict.items():
-          result = pilotAgentsDB.addPilotTQReference( pilotList,
-                                                     tqID,
-                                                     self.pilotDN,
-                                                     self.pilotGroup,
-                                                     self.localhost,
-                                                     ceType,
-                                                     '',
-                                                     stampDict )
-          if not result['OK']:
-            self.log.error( 'Failed add pilots to the PilotAgentsDB: ', result['Message'] )
-            continue
-          for pilot in pilotList:
-            result = pilotAgentsDB.setPilotStatus( pilot, 'Submitted', ceName,
-                                                  'Successfully submitted by the SiteDirector',
-                                                  siteName, queueName )
-            if not result['OK']:
-              self.log.error( 'Failed to set pilot status: ', result['Message'] )
-              continue
+        for tq, prio in tqPriorityList:
+          if rndm < prio:
+            tqID = tq
+            break
+        if not tqDict.has_key( tqID ):
+          tqDict[tqID] = []
+        tqDict[tqID].append( pilotID )
+
+      result = pilotAgentsDB.addPilotTQReferences( tqDict,
+                                                   self.pilotDN,
+                                                   self.pilotGroup,
+                                                   self.localhost,
+                                                   ceType,
+                                                   '',
+                                                   stampDict )
+      if not result['OK']:
+        self.log.error( 'Failed add pilots to the PilotAgentsDB: ', result['Message'] )
+        continue
+      statusTuple = ( 'Submitted', ceName, 'Successfully submitted by the SiteDirector', siteName, queueName )
+      result = pilotAgentsDB.setPilotsStatus( dict( [ ( pilot, statusTuple ) for pilot in pilotList ] ) )
+      if not result['OK']:
+        self.log.error( 'Failed to set pilot status: ', result['Message'] )
 
     return S_OK()
 
 #####################################################################################
-  def __getExecutable( self, queue, pilotsToSubmit, bundleProxy = True, httpProxy = '', jobExecDir = '' ):
+  def __executeForQueues( self, method, queues, action, *args ):
+    """ Execute method( queue, *args ) for the queues in the thread pool and wait for
+        each of them at most CETimeout seconds once started. The queues of the CEs with
+        too many recent failures and the ones still busy since a previous cycle are skipped.
+        Returns { queue : result }
+    """
+    resultQueue = Queue.Queue()
+    startTimes = {}
+    startedQueues = []
+    for queue in queues:
+      ceName = self.queueDict[queue]['CEName']
+      if not self.__acquireQueue( queue ):
+        self.log.warn( 'Queue %s is still busy with a previous call, skipping it' % queue )
+        continue
+      if not self.ceBreaker.allowRequest( ceName ):
+        self.__releaseQueue( queue )
+        self.log.verbose( 'CE %s is temporarily skipped, queue %s not served' % ( ceName, queue ) )
+        continue
+      self.threadPool.generateJobAndQueueIt( self.__executeForQueue,
+                                             args = ( method, queue, action, resultQueue, startTimes ) + args )
+      startedQueues.append( queue )
+
+    results = {}
+    # The queues waiting for a free thread can not wait longer than all the threads busy with hanging calls
+    deadline = time.time() + self.ceTimeout * ( ( len( startedQueues ) - 1 ) / self.threadPool.getMaxThreads() + 1 )
+    while len( results ) < len( startedQueues ):
+      try:
+        queue, result = resultQueue.get( True, 1 )
+        results[queue] = result
+        continue
+      except Queue.Empty:
+        pass
+      now = time.time()
+      waiting = False
+      for queue in startedQueues:
+        if queue in results:
+          continue
+        if queue in startTimes:
+          waiting = now - startTimes[queue] < self.ceTimeout
+        else:
+          waiting = now < deadline
+        if waiting:
+          break
+      if not waiting:
+        break
+    for queue in startedQueues:
+      if queue not in startTimes:
+        results[queue] = S_ERROR( '%s for queue %s did not start, all threads are busy' % ( action, queue ) )
+      elif queue not in results:
+        # The call goes on in its thread, the queue stays busy until it finishes
+        ceName = self.queueDict[queue]['CEName']
+        if self.ceBreaker.recordFailure( ceName ):
+          self.log.warn( 'CE %s will be skipped for %d s after repeated failures' % ( ceName, self.ceBreaker.openTime ) )
+        gMonitor.addMark( 'CETimeouts', 1 )
+        results[queue] = S_ERROR( '%s for queue %s did not complete within %d s' % ( action, queue, self.ceTimeout ) )
+    return results
+
+  def __executeForQueue( self, method, queue, action, resultQueue, startTimes, *args ):
+    """ Thread pool job: execute the method for the queue and report its timing
+    """
+    start = time.time()
+    startTimes[queue] = start
+    try:
+      try:
+        result = method( queue, *args )
+      except Exception, x:
+        self.log.exception( '%s for queue %s failed' % ( action, queue ) )
+        result = S_ERROR( '%s for queue %s failed: %s' % ( action, queue, str( x ) ) )
+    finally:
+      self.__releaseQueue( queue )
+    gMonitor.addMark( '%s-%s' % ( action, queue ), time.time() - start )
+    resultQueue.put( ( queue, result ) )
+
+  def __acquireQueue( self, queue ):
+    """ Mark the queue as busy, returns False if it already is
+    """
+    self.busyQueuesLock.acquire()
+    try:
+      if queue in self.busyQueues:
+        return False
+      self.busyQueues.add( queue )
+      return True
+    finally:
+      self.busyQueuesLock.release()
+
+  def __releaseQueue( self, queue ):
+    self.busyQueuesLock.acquire()
+    try:
+      self.busyQueues.discard( queue )
+    finally:
+      self.busyQueuesLock.release()
+
+#####################################################################################
+  def __getExecutable( self, queue, pilotsToSubmit, bundleProxy = True, httpProxy = '', jobExecDir = '', proxy = None ):
     """ Prepare the full executable for queue
     """
 
-    proxy = None
-    if bundleProxy:
+    if not bundleProxy:
+      proxy = None
+    elif proxy is None:
       proxy = self.proxy
     pilotOptions, pilotsToSubmit = self.__getPilotOptions( queue, pilotsToSubmit )
     if pilotOptions is None:
@@ -656,146 +782,26 @@ EOF
   def updatePilotStatus( self ):
     """ Update status of pilots in transient states
     """
-    for queue in self.queueDict:
-      ce = self.queueDict[queue]['CE']
-      ceName = self.queueDict[queue]['CEName']
-      queueName = self.queueDict[queue]['QueueName']
-      ceType = self.queueDict[queue]['CEType']
-      siteName = self.queueDict[queue]['Site']
-
-      result = pilotAgentsDB.selectPilots( {'DestinationSite':ceName,
-                                           'Queue':queueName,
-                                           'GridType':ceType,
-                                           'GridSite':siteName,
-                                           'Status':TRANSIENT_PILOT_STATUS} )
-      if not result['OK']:
-        self.log.error( 'Failed to select pilots: %s' % result['Message'] )
-        continue
-      pilotRefs = result['Value']
-      if not pilotRefs:
-        continue
-
-      #print "AT >>> pilotRefs", pilotRefs
-
-      result = pilotAgentsDB.getPilotInfo( pilotRefs )
-      if not result['OK']:
-        self.log.error( 'Failed to get pilots info from DB', result['Message'] )
-        continue
-      pilotDict = result['Value']
-
-      #print "AT >>> pilotDict", pilotDict
-
-      stampedPilotRefs = []
-      for pRef in pilotDict:
-        if pilotDict[pRef]['PilotStamp']:
-          stampedPilotRefs.append( pRef + ":::" + pilotDict[pRef]['PilotStamp'] )
-        else:
-          stampedPilotRefs = list( pilotRefs )
-          break
-
-      result = ce.isProxyValid()
-      if not result['OK']:
-        result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, 600 )
-        if not result['OK']:
-          return result
-        self.proxy = result['Value']
-        ce.setProxy( self.proxy, 500 )
-
-      result = ce.getJobStatus( stampedPilotRefs )
+    queues = self.queueDict.keys()
+    results = self.__executeForQueues( self.__updatePilotStatusForQueue, queues, 'StatusUpdate' )
+    for queue, result in results.items():
       if not result['OK']:
-        self.log.error( 'Failed to get pilots status from CE', '%s: %s' % ( ceName, result['Message'] ) )
-        continue
-      pilotCEDict = result['Value']
-
-      #print "AT >>> pilotCEDict", pilotCEDict
-
-      for pRef in pilotRefs:
-        newStatus = ''
-        oldStatus = pilotDict[pRef]['Status']
-        ceStatus = pilotCEDict[pRef]
-        if oldStatus == ceStatus:
-          # Status did not change, continue
-          continue
-        elif ceStatus == "Unknown" and not oldStatus in FINAL_PILOT_STATUS:
-          # Pilot finished without reporting, consider it Aborted
-          newStatus = 'Aborted'
-        elif ceStatus != 'Unknown' :
-          # Update the pilot status to the new value
-          newStatus = ceStatus
-
-        if newStatus:
-          self.log.info( 'Updating status to %s for pilot %s' % ( newStatus, pRef ) )
-          result = pilotAgentsDB.setPilotStatus( pRef, newStatus, '', 'Updated by SiteDirector' )
-        # Retrieve the pilot output now
-        if newStatus in FINAL_PILOT_STATUS:
-          if pilotDict[pRef]['OutputReady'].lower() == 'false' and self.getOutput:
-            self.log.info( 'Retrieving output for pilot %s' % pRef )
-            pilotStamp = pilotDict[pRef]['PilotStamp']
-            pRefStamp = pRef
-            if pilotStamp:
-              pRefStamp = pRef + ':::' + pilotStamp
-            result = ce.getJobOutput( pRefStamp )
-            if not result['OK']:
-              self.log.error( 'Failed to get pilot output', '%s: %s' % ( ceName, result['Message'] ) )
-            else:
-              output, error = result['Value']
-              if output:
-                result = pilotAgentsDB.storePilotOutput( pRef, output, error )
-                if not result['OK']:
-                  self.log.error( 'Failed to store pilot output', result['Message'] )
-              else:
-                self.log.warn( 'Empty pilot output not stored to PilotDB' )    
+        self.log.error( 'Errors in updating pilot status for queue %s:' % queue, result['Message'] )
 
     # The pilot can be in Done state set by the job agent check if the output is retrieved
-    for queue in self.queueDict:
-      ce = self.queueDict[queue]['CE']
-
-      if not ce.isProxyValid( 120 ):
-        result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, 1000 )
+    if self.getOutput:
+      results = self.__executeForQueues( self.__retrievePilotOutputForQueue, queues, 'OutputRetrieval' )
+      for queue, result in results.items():
         if not result['OK']:
-          return result
-        ce.setProxy( self.proxy, 940 )
-
-      ceName = self.queueDict[queue]['CEName']
-      queueName = self.queueDict[queue]['QueueName']
-      ceType = self.queueDict[queue]['CEType']
-      siteName = self.queueDict[queue]['Site']
-      result = pilotAgentsDB.selectPilots( {'DestinationSite':ceName,
-                                           'Queue':queueName,
-                                           'GridType':ceType,
-                                           'GridSite':siteName,
-                                           'OutputReady':'False',
-                                           'Status':FINAL_PILOT_STATUS} )
-
-      if not result['OK']:
-        self.log.error( 'Failed to select pilots', result['Message'] )
-        continue
-      pilotRefs = result['Value']
-      if not pilotRefs:
-        continue
-      result = pilotAgentsDB.getPilotInfo( pilotRefs )
-      if not result['OK']:
-        self.log.error( 'Failed to get pilots info from DB', result['Message'] )
-        continue
-      pilotDict = result['Value']
-      if self.getOutput:
-        for pRef in pilotRefs:
-          self.log.info( 'Retrieving output for pilot %s' % pRef )
-          pilotStamp = pilotDict[pRef]['PilotStamp']
-          pRefStamp = pRef
-          if pilotStamp:
-            pRefStamp = pRef + ':::' + pilotStamp
-          result = ce.getJobOutput( pRefStamp )
-          if not result['OK']:
-            self.log.error( 'Failed to get pilot output', '%s: %s' % ( ceName, result['Message'] ) )
-          else:
-            output, error = result['Value']
-            result = pilotAgentsDB.storePilotOutput( pRef, output, error )
-            if not result['OK']:
-              self.log.error( 'Failed to store pilot output', result['Message'] )
+          self.log.error( 'Errors in retrieving pilot output for queue %s:' % queue, result['Message'] )
 
-      # Check if the accounting is to be sent
-      if self.sendAccounting:
+    # Check if the accounting is to be sent
+    if self.sendAccounting:
+      for queue in queues:
+        ceName = self.queueDict[queue]['CEName']
+        queueName = self.queueDict[queue]['QueueName']
+        ceType = self.queueDict[queue]['CEType']
+        siteName = self.queueDict[queue]['Site']
         result = pilotAgentsDB.selectPilots( {'DestinationSite':ceName,
                                              'Queue':queueName,
                                              'GridType':ceType,
@@ -820,6 +826,157 @@ EOF
 
     return S_OK()
 
+  def __updatePilotStatusForQueue( self, queue ):
+    """ Update status of the pilots of the queue in transient states, executed in the thread pool
+    """
+    ce = self.queueDict[queue]['CE']
+    ceName = self.queueDict[queue]['CEName']
+    queueName = self.queueDict[queue]['QueueName']
+    ceType = self.queueDict[queue]['CEType']
+    siteName = self.queueDict[queue]['Site']
+
+    result = pilotAgentsDB.selectPilots( {'DestinationSite':ceName,
+                                         'Queue':queueName,
+                                         'GridType':ceType,
+                                         'GridSite':siteName,
+                                         'Status':TRANSIENT_PILOT_STATUS} )
+    if not result['OK']:
+      self.log.error( 'Failed to select pilots: %s' % result['Message'] )
+      return S_OK()
+    pilotRefs = result['Value']
+    if not pilotRefs:
+      return S_OK()
+
+    result = pilotAgentsDB.getPilotInfo( pilotRefs )
+    if not result['OK']:
+      self.log.error( 'Failed to get pilots info from DB', result['Message'] )
+      return S_OK()
+    pilotDict = result['Value']
+
+    stampedPilotRefs = []
+    for pRef in pilotDict:
+      if pilotDict[pRef]['PilotStamp']:
+        stampedPilotRefs.append( pRef + ":::" + pilotDict[pRef]['PilotStamp'] )
+      else:
+        stampedPilotRefs = list( pilotRefs )
+        break
+
+    result = ce.isProxyValid()
+    if not result['OK']:
+      result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, 600 )
+      if not result['OK']:
+        return result
+      self.proxy = result['Value']
+      ce.setProxy( result['Value'], 500 )
+
+    result = ce.getJobStatus( stampedPilotRefs )
+    if not result['OK']:
+      if self.ceBreaker.recordFailure( ceName ):
+        self.log.warn( 'CE %s will be skipped for %d s after repeated failures' % ( ceName, self.ceBreaker.openTime ) )
+      self.log.error( 'Failed to get pilots status from CE', '%s: %s' % ( ceName, result['Message'] ) )
+      return S_OK()
+    self.ceBreaker.recordSuccess( ceName )
+    pilotCEDict = result['Value']
+
+    pilotStatusDict = {}
+    for pRef in pilotRefs:
+      newStatus = ''
+      oldStatus = pilotDict[pRef]['Status']
+      ceStatus = pilotCEDict[pRef]
+      if oldStatus == ceStatus:
+        # Status did not change, continue
+        continue
+      elif ceStatus == "Unknown" and not oldStatus in FINAL_PILOT_STATUS:
+        # Pilot finished without reporting, consider it Aborted
+        newStatus = 'Aborted'
+      elif ceStatus != 'Unknown' :
+        # Update the pilot status to the new value
+        newStatus = ceStatus
+
+      if newStatus:
+        self.log.info( 'Updating status to %s for pilot %s' % ( newStatus, pRef ) )
+        pilotStatusDict[pRef] = ( newStatus, '', 'Updated by SiteDirector' )
+
+    if pilotStatusDict:
+      result = pilotAgentsDB.setPilotsStatus( pilotStatusDict )
+      if not result['OK']:
+        self.log.error( 'Failed to update pilots status', result['Message'] )
+
+    for pRef, ( newStatus, _destination, _reason ) in pilotStatusDict.items():
+      # Retrieve the pilot output now
+      if newStatus in FINAL_PILOT_STATUS:
+        if pilotDict[pRef]['OutputReady'].lower() == 'false' and self.getOutput:
+          self.log.info( 'Retrieving output for pilot %s' % pRef )
+          pilotStamp = pilotDict[pRef]['PilotStamp']
+          pRefStamp = pRef
+          if pilotStamp:
+            pRefStamp = pRef + ':::' + pilotStamp
+          result = ce.getJobOutput( pRefStamp )
+          if not result['OK']:
+            self.log.error( 'Failed to get pilot output', '%s: %s' % ( ceName, result['Message'] ) )
+          else:
+            output, error = result['Value']
+            if output:
+              result = pilotAgentsDB.storePilotOutput( pRef, output, error )
+              if not result['OK']:
+                self.log.error( 'Failed to store pilot output', result['Message'] )
+            else:
+              self.log.warn( 'Empty pilot output not stored to PilotDB' )
+
+    return S_OK()
+
+  def __retrievePilotOutputForQueue( self, queue ):
+    """ Retrieve the output of the pilots of the queue in final states, executed in the thread pool
+    """
+    ce = self.queueDict[queue]['CE']
+
+    result = ce.isProxyValid( 120 )
+    if not result['OK']:
+      result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, 1000 )
+      if not result['OK']:
+        return result
+      self.proxy = result['Value']
+      ce.setProxy( result['Value'], 940 )
+
+    ceName = self.queueDict[queue]['CEName']
+    queueName = self.queueDict[queue]['QueueName']
+    ceType = self.queueDict[queue]['CEType']
+    siteName = self.queueDict[queue]['Site']
+    result = pilotAgentsDB.selectPilots( {'DestinationSite':ceName,
+                                         'Queue':queueName,
+                                         'GridType':ceType,
+                                         'GridSite':siteName,
+                                         'OutputReady':'False',
+                                         'Status':FINAL_PILOT_STATUS} )
+
+    if not result['OK']:
+      self.log.error( 'Failed to select pilots', result['Message'] )
+      return S_OK()
+    pilotRefs = result['Value']
+    if not pilotRefs:
+      return S_OK()
+    result = pilotAgentsDB.getPilotInfo( pilotRefs )
+    if not result['OK']:
+      self.log.error( 'Failed to get pilots info from DB', result['Message'] )
+      return S_OK()
+    pilotDict = result['Value']
+    for pRef in pilotRefs:
+      self.log.info( 'Retrieving output for pilot %s' % pRef )
+      pilotStamp = pilotDict[pRef]['PilotStamp']
+      pRefStamp = pRef
+      if pilotStamp:
+        pRefStamp = pRef + ':::' + pilotStamp
+      result = ce.getJobOutput( pRefStamp )
+      if not result['OK']:
+        self.log.error( 'Failed to get pilot output', '%s: %s' % ( ceName, result['Message'] ) )
+      else:
+        output, error = result['Value']
+        result = pilotAgentsDB.storePilotOutput( pRef, output, error )
+        if not result['OK']:
+          self.log.error( 'Failed to store pilot output', result['Message'] )
+
+    return S_OK()
+
   def sendPilotAccounting( self, pilotDict ):
     """ Send pilot accounting record
     """
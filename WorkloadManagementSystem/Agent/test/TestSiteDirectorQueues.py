@@ -0,0 +1,115 @@
+""" Unit tests of the concurrent pilot status update of the SiteDirector with fake CEs hanging
+    or failing, the pilots are taken from a mocked PilotAgentsDB
+"""
+
+import threading
+import time
+import unittest
+from mock import Mock
+
+import DIRAC.WorkloadManagementSystem.Agent.SiteDirector as moduleTested
+from DIRAC.WorkloadManagementSystem.Agent.SiteDirector import SiteDirector
+from DIRAC.WorkloadManagementSystem.private.CircuitBreaker import CircuitBreaker
+from DIRAC.Core.Utilities.ThreadPool import ThreadPool
+from DIRAC import gLogger, S_OK, S_ERROR
+
+class FakeCE:
+  """ CE answering getJobStatus, after the release event is set if hanging
+  """
+
+  def __init__( self, hanging = False, error = False ):
+    self.release = threading.Event()
+    if not hanging:
+      self.release.set()
+    self.error = error
+    self.calls = 0
+
+  def isProxyValid( self ):
+    return S_OK()
+
+  def getJobStatus( self, pilotRefs ):
+    self.calls += 1
+    self.release.wait()
+    if self.error:
+      return S_ERROR( 'CE is down' )
+    return S_OK( dict( [ ( pilotRef, 'Running' ) for pilotRef in pilotRefs ] ) )
+
+class QueuesSiteDirector( SiteDirector ):
+  """ SiteDirector serving the fake CEs, the configuration is not read
+  """
+
+  def __init__( self, ces, ceTimeout, ceMaxFailures ):
+    self.log = gLogger
+    self.threadPool = ThreadPool( 1, 4 )
+    self.threadPool.daemonize()
+    self.busyQueues = set()
+    self.busyQueuesLock = threading.Lock()
+    self.ceBreaker = CircuitBreaker( maxFailures = ceMaxFailures )
+    self.ceTimeout = ceTimeout
+    self.getOutput = False
+    self.sendAccounting = False
+    self.queueDict = {}
+    for ceName, ce in ces.items():
+      self.queueDict['%s_queue' % ceName] = { 'CE' : ce, 'CEName' : ceName, 'QueueName' : 'queue',
+                                               'CEType' : 'Fake', 'Site' : 'DIRAC.Site.ch' }
+
+class SiteDirectorQueuesCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.pilotAgentsDB = moduleTested.pilotAgentsDB
+    moduleTested.pilotAgentsDB = Mock()
+    moduleTested.pilotAgentsDB.selectPilots.return_value = S_OK( [ 'pilot1' ] )
+    moduleTested.pilotAgentsDB.getPilotInfo.return_value = S_OK( { 'pilot1' : { 'PilotStamp' : '', 'Status' : 'Running' } } )
+    self.gMonitor = moduleTested.gMonitor
+    moduleTested.gMonitor = Mock()
+
+  def tearDown( self ):
+    moduleTested.pilotAgentsDB = self.pilotAgentsDB
+    moduleTested.gMonitor = self.gMonitor
+
+  def test_hangingCE( self ):
+    """ the cycle does not wait for a hanging CE, its queue is skipped while still busy """
+    hangingCE = FakeCE( hanging = True )
+    goodCE = FakeCE()
+    director = QueuesSiteDirector( { 'hangingCE' : hangingCE, 'goodCE' : goodCE }, ceTimeout = 1, ceMaxFailures = 3 )
+    try:
+      start = time.time()
+      self.assert_( director.updatePilotStatus()['OK'] )
+      self.assert_( time.time() - start < director.ceTimeout + 1.5 )
+      self.assertEqual( director.busyQueues, set( [ 'hangingCE_queue' ] ) )
+
+      director.updatePilotStatus()
+      self.assertEqual( hangingCE.calls, 1 )
+      self.assertEqual( goodCE.calls, 2 )
+    finally:
+      hangingCE.release.set()
+    for _i in range( 50 ):
+      if not director.busyQueues:
+        break
+      time.sleep( 0.1 )
+    self.assertEqual( director.busyQueues, set() )
+    director.updatePilotStatus()
+    self.assertEqual( hangingCE.calls, 2 )
+
+  def test_failingCE( self ):
+    """ the CE is skipped once it failed CEMaxFailures times in a row """
+    failingCE = FakeCE( error = True )
+    director = QueuesSiteDirector( { 'failingCE' : failingCE }, ceTimeout = 1, ceMaxFailures = 2 )
+    for _i in range( 3 ):
+      self.assert_( director.updatePilotStatus()['OK'] )
+    self.assertEqual( failingCE.calls, 2 )
+    self.assertEqual( director.ceBreaker.getOpenCircuits(), [ 'failingCE' ] )
+
+  def test_timeoutsOpenBreaker( self ):
+    """ the timed out calls count as failures of the CE """
+    hangingCE = FakeCE( hanging = True )
+    director = QueuesSiteDirector( { 'hangingCE' : hangingCE }, ceTimeout = 1, ceMaxFailures = 1 )
+    try:
+      director.updatePilotStatus()
+      self.assertEqual( director.ceBreaker.getOpenCircuits(), [ 'hangingCE' ] )
+    finally:
+      hangingCE.release.set()
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( SiteDirectorQueuesCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
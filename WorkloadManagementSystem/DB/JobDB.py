@@ -499,6 +499,29 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.getJobOptParameters: failed to retrieve parameters' )
 
+#############################################################################
+  def getOptParametersForJobList( self, jobIDList ):
+    """ Get all the optimizer parameters for the jobs in the jobIDList.
+        Returns an S_OK structure with a dictionary of dictionaries as its Value:
+        ValueDict[jobID][parameter_name] = parameter_value
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( x ) ) for x in jobIDList ] )
+    cmd = "SELECT JobID, Name, Value from OptimizerParameters WHERE JobID in ( %s )" % jobList
+    result = self._query( cmd )
+    if not result['OK']:
+      return S_ERROR( 'JobDB.getOptParametersForJobList: failed to retrieve parameters' )
+
+    resultDict = {}
+    for jobID, name, value in result['Value']:
+      try:
+        value = value.tostring()
+      except Exception:
+        pass
+      resultDict.setdefault( int( jobID ), {} )[name] = value
+    return S_OK( resultDict )
+
 #############################################################################
   def getTimings( self, site, period = 3600 ):
     """ Get CPU and wall clock times for the jobs finished in the last hour
@@ -639,15 +662,19 @@ class JobDB( DB ):
 
     self.log.debug( 'JobDB.selectJobs: retrieving jobs.' )
 
-    res = self.getFields( 'Jobs', ['JobID'], condDict = condDict, limit = limit,
-                            older = older, newer = newer, timeStamp = timeStamp, orderAttribute = orderAttribute )
-
-    if not res['OK']:
-      return res
+    try:
+      condition = self.buildCondition( condDict = condDict, older = older, newer = newer,
+                                       timeStamp = timeStamp, orderAttribute = orderAttribute, limit = limit )
+    except Exception, x:
+      return S_ERROR( x )
 
-    if not len( res['Value'] ):
-      return S_OK( [] )
-    return S_OK( [ self._to_value( i ) for i in  res['Value'] ] )
+    # Stream the selection, only the job IDs are kept in memory
+    jobIDs = []
+    for res in self._queryIter( 'SELECT JobID FROM Jobs %s' % condition ):
+      if not res['OK']:
+        return res
+      jobIDs.extend( [ self._to_value( i ) for i in res['Value'] ] )
+    return S_OK( jobIDs )
 
 #############################################################################
   def selectJobWithStatus( self, status ):
@@ -726,6 +753,35 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.setAttributes: failed to set attribute' )
 
+#############################################################################
+  def setAttributesForJobList( self, jobIDList, attrNames, attrValues, update = False ):
+    """ Set the same attribute values for all the jobs in the jobIDList with a single update.
+        The LastUpdate time stamp is refreshed if explicitely requested
+    """
+    if not jobIDList:
+      return S_OK( 0 )
+    if len( attrNames ) != len( attrValues ):
+      return S_ERROR( 'JobDB.setAttributesForJobList: incompatible Argument length' )
+
+    attr = []
+    for i in range( len( attrNames ) ):
+      ret = self._escapeString( attrValues[i] )
+      if not ret['OK']:
+        return ret
+      attr.append( "%s=%s" % ( attrNames[i], ret['Value'] ) )
+    if update:
+      attr.append( "LastUpdateTime=UTC_TIMESTAMP()" )
+    if len( attr ) == 0:
+      return S_ERROR( 'JobDB.setAttributesForJobList: Nothing to do' )
+
+    jobList = ','.join( [ str( int( x ) ) for x in jobIDList ] )
+    cmd = 'UPDATE Jobs SET %s WHERE JobID in ( %s )' % ( ', '.join( attr ), jobList )
+    res = self._update( cmd )
+    if res['OK']:
+      return res
+    else:
+      return S_ERROR( 'JobDB.setAttributesForJobList: failed to set attributes' )
+
 #############################################################################
   def setJobStatus( self, jobID, status = '', minor = '', application = '', appCounter = None ):
     """ Set status of the job specified by its jobID
@@ -778,6 +834,35 @@ class JobDB( DB ):
     result = self._update( req )
     return result
 
+#############################################################################
+  def setEndExecTimeForJobList( self, jobDateDict ):
+    """ Set EndExecTime time stamps given as { jobID : endDate } with a single update
+    """
+    return self.__setExecTimeForJobList( 'EndExecTime', jobDateDict )
+
+#############################################################################
+  def setStartExecTimeForJobList( self, jobDateDict ):
+    """ Set StartExecTime time stamps given as { jobID : startDate } with a single update
+    """
+    return self.__setExecTimeForJobList( 'StartExecTime', jobDateDict )
+
+  def __setExecTimeForJobList( self, timeName, jobDateDict ):
+    """ Set the not yet defined timeName column of the jobs to their date
+    """
+    if not jobDateDict:
+      return S_OK( 0 )
+
+    cases = []
+    for jobID, date in jobDateDict.items():
+      ret = self._escapeString( date )
+      if not ret['OK']:
+        return ret
+      cases.append( 'WHEN %d THEN %s' % ( int( jobID ), ret['Value'] ) )
+    jobList = ','.join( [ str( int( x ) ) for x in jobDateDict ] )
+    req = "UPDATE Jobs SET %s=CASE JobID %s END WHERE JobID in ( %s ) AND %s IS NULL" % ( timeName, ' '.join( cases ),
+                                                                                          jobList, timeName )
+    return self._update( req )
+
  #############################################################################
   def setStartExecTime( self, jobID, startDate = None ):
     """ Set StartExecTime time stamp
@@ -1109,6 +1194,25 @@ class JobDB( DB ):
     else:
       return result
 
+#############################################################################
+  def getJDLForJobList( self, jobIDList, original = False ):
+    """ Get the JDLs for the jobs in the jobIDList. By default the current job JDLs
+        are returned. If 'original' argument is True, original JDLs are returned.
+        Returns an S_OK structure with a dictionary ValueDict[jobID] = JDL
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( x ) ) for x in jobIDList ] )
+    if original:
+      cmd = "SELECT JobID, OriginalJDL FROM JobJDLs WHERE JobID in ( %s )" % jobList
+    else:
+      cmd = "SELECT JobID, JDL FROM JobJDLs WHERE JobID in ( %s )" % jobList
+
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    return S_OK( dict( [ ( int( jobID ), jdl ) for jobID, jdl in result['Value'] ] ) )
+
 #############################################################################
   def insertNewJobIntoDB( self, jdl, owner, ownerDN, ownerGroup, diracSetup ):
     """ Insert the initial JDL into the Job database,
@@ -2149,25 +2253,17 @@ class JobDB( DB ):
     # Add dynamic data to the job heart beat log
     # start = time.time()
     valueList = []
+    args = []
     for key, value in dynamicDataDict.items():
-      result = self._escapeString( key )
-      if not result['OK']:
-        self.log.warn( 'Failed to escape string ' + key )
-        continue
-      e_key = result['Value']
-      result = self._escapeString( value )
-      if not result['OK']:
-        self.log.warn( 'Failed to escape string ' + value )
-        continue
-      e_value = result['Value']
-      valueList.append( "( %s, %s,%s,UTC_TIMESTAMP())" % ( e_jobID, e_key, e_value ) )
+      valueList.append( "( %s, %s, %s, UTC_TIMESTAMP() )" )
+      args += [ jobID, str( key ), str( value ) ]
 
     if valueList:
 
-      valueString = ','.join( valueList )
+      # The values are escaped by the driver
       req = "INSERT INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) VALUES "
-      req += valueString
-      result = self._update( req )
+      req += ','.join( valueList )
+      result = self._update( req, args = tuple( args ) )
       if not result['OK']:
         ok = False
         self.log.warn( result['Message'] )
@@ -2179,6 +2275,57 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'Failed to store some or all the parameters' )
 
+#####################################################################################
+  def setHeartBeatDataBulk( self, heartBeatDict, runningStates = ( 'Running', 'Stalled' ) ):
+    """ Add the heart beat data of several jobs to the database with a single statement per table.
+        heartBeatDict is { jobID : ( staticDataDict, dynamicDataDict, heartBeatTime ) }, only the jobs
+        in one of the runningStates are set to Running, a buffered heart beat arriving after the job
+        reached e.g. Completed or Done does not revive it
+    """
+    if not heartBeatDict:
+      return S_OK()
+
+    jobIDs = [ int( jobID ) for jobID in heartBeatDict ]
+    req = "UPDATE Jobs SET HeartBeatTime=UTC_TIMESTAMP(), Status=IF(Status IN (%s),'Running',Status) "
+    req += "WHERE JobID IN (%s)"
+    req = req % ( ','.join( [ "'%s'" % status for status in runningStates ] ), ','.join( [ str( jobID ) for jobID in jobIDs ] ) )
+    result = self._update( req )
+    if not result['OK']:
+      return S_ERROR( 'Failed to set the heart beat time: ' + result['Message'] )
+
+    ok = True
+    paramList = []
+    paramArgs = []
+    logList = []
+    logArgs = []
+    for jobID, ( staticDataDict, dynamicDataDict, heartBeatTime ) in heartBeatDict.items():
+      for key, value in staticDataDict.items():
+        paramList.append( "( %s, %s, %s )" )
+        paramArgs += [ int( jobID ), str( key ), str( value ) ]
+      for key, value in dynamicDataDict.items():
+        logList.append( "( %s, %s, %s, %s )" )
+        logArgs += [ int( jobID ), str( key ), str( value ), heartBeatTime ]
+
+    # The values are escaped by the driver
+    if paramList:
+      req = "REPLACE JobParameters (JobID,Name,Value) VALUES %s" % ','.join( paramList )
+      result = self._update( req, args = tuple( paramArgs ) )
+      if not result['OK']:
+        ok = False
+        self.log.warn( result['Message'] )
+
+    if logList:
+      req = "INSERT INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) VALUES %s" % ','.join( logList )
+      result = self._update( req, args = tuple( logArgs ) )
+      if not result['OK']:
+        ok = False
+        self.log.warn( result['Message'] )
+
+    if ok:
+      return S_OK()
+    else:
+      return S_ERROR( 'Failed to store some or all the parameters' )
+
 #####################################################################################
   def getHeartBeatData( self, jobID ):
     """ Retrieve the job's heart beat data
@@ -2259,6 +2406,22 @@ class JobDB( DB ):
 
     return S_OK( resultDict )
 
+#####################################################################################
+  def getJobsWithCommand( self, status = 'Received' ):
+    """ Get the IDs of the jobs having commands in the given status
+    """
+    ret = self._escapeString( status )
+    if not ret['OK']:
+      return ret
+    status = ret['Value']
+
+    req = "SELECT DISTINCT JobID FROM JobCommands WHERE Status=%s" % status
+    result = self._query( req )
+    if not result['OK']:
+      return result
+
+    return S_OK( [ int( row[0] ) for row in result['Value'] ] )
+
 #####################################################################################
   def setJobCommandStatus( self, jobID, command, status ):
     """ Set the command status
@@ -2,6 +2,8 @@
     The following methods are provided
 
     addLoggingRecord()
+    addLoggingRecords()
+    addLoggingRecordList()
     getJobLoggingInfo()
     getWMSTimeStamps()
 """
@@ -48,6 +50,71 @@ class JobLoggingDB( DB ):
     event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
     self.gLogger.info( "Adding record for job " + str( jobID ) + ": '" + event + "' from " + source )
 
+    _date, time_order = self.__getTimeStamp( date )
+
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
+           ( int( jobID ), status, minor, application, str( _date ), time_order, source )
+
+    return self._update( cmd )
+
+#############################################################################
+  def addLoggingRecords( self,
+                         jobIDList,
+                         status = 'idem',
+                         minor = 'idem',
+                         application = 'idem',
+                         date = '',
+                         source = 'Unknown' ):
+    """ Add the same logging record for all the jobs in jobIDList with a single
+        multi-row insert. The arguments have the same meaning as for addLoggingRecord()
+    """
+    if not jobIDList:
+      return S_OK( 0 )
+
+    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
+    self.gLogger.info( "Adding record for %d jobs: '%s' from %s" % ( len( jobIDList ), event, source ) )
+
+    _date, time_order = self.__getTimeStamp( date )
+
+    values = []
+    for jobID in jobIDList:
+      values.append( "(%d,'%s','%s','%s','%s',%f,'%s')" % \
+                     ( int( jobID ), status, minor, application, str( _date ), time_order, source ) )
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES %s" % ",".join( values )
+
+    return self._update( cmd )
+
+#############################################################################
+  def addLoggingRecordList( self, recordList ):
+    """ Add different logging records, possibly for different jobs, with a single
+        multi-row insert. recordList is a list of
+        ( jobID, status, minor, application, date, source ) tuples with the same
+        meaning as the arguments of addLoggingRecord()
+    """
+    if not recordList:
+      return S_OK( 0 )
+
+    self.gLogger.info( "Adding %d logging records" % len( recordList ) )
+
+    values = []
+    args = []
+    for jobID, status, minor, application, date, source in recordList:
+      _date, time_order = self.__getTimeStamp( date )
+      values.append( "(%s,%s,%s,%s,%s,%s,%s)" )
+      args += [ int( jobID ), status, minor, application, str( _date ), time_order, source ]
+    # The values are escaped by the driver
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES %s" % ",".join( values )
+
+    return self._update( cmd, args = tuple( args ) )
+
+#############################################################################
+  def __getTimeStamp( self, date ):
+    """ Evaluate the status time stamp and its ordering key from the date given
+        to the logging methods. The current UTC time is used if no date is given
+    """
     if not date:
       # Make the UTC datetime string and float
       _date = Time.dateTime()
@@ -75,11 +142,7 @@ class JobLoggingDB( DB ):
         epoc = time.mktime( _date.timetuple() ) - MAGIC_EPOC_NUMBER
         time_order = round( epoc, 3 )
 
-    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
-          "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
-           ( int( jobID ), status, minor, application, str( _date ), time_order, source )
-
-    return self._update( cmd )
+    return _date, time_order
 
 #############################################################################
   def getJobLoggingInfo( self, jobID ):
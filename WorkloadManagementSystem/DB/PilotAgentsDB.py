@@ -9,7 +9,9 @@
     Available methods are:
 
     addPilotTQReference()
+    addPilotTQReferences()
     setPilotStatus()
+    setPilotsStatus()
     deletePilot()
     clearPilots()
     getPilotOwner()
@@ -35,6 +37,8 @@ from types import *
 import threading, datetime, time
 
 DEBUG = 1
+# Maximum number of pilots inserted or updated by a single statement
+MAX_PILOTS_PER_STATEMENT = 1000
 
 #############################################################################
 class PilotAgentsDB(DB):
@@ -49,50 +53,67 @@ class PilotAgentsDB(DB):
                         gridType='DIRAC',requirements='Unknown',pilotStampDict={}):
     """ Add a new pilot job reference """
 
-    result = self._getConnection()
-    if result['OK']:
-      connection = result['Value']
-    else:
-      return S_ERROR('Failed to get connection to MySQL: '+result['Message'])
-
-    result = self._escapeString(requirements)
-    if not result['OK']:
-      gLogger.warn('Failed to escape requirements string')
-      e_requirements = "Failed to escape requirements string"
-    e_requirements = result['Value']
+    return self.addPilotTQReferences( { taskQueueID : pilotRef }, ownerDN, ownerGroup, broker,
+                                      gridType, requirements, pilotStampDict )
 
-    for ref in pilotRef:
-      stamp = ''
-      if ref in pilotStampDict:
-        stamp = pilotStampDict[ref]
+##########################################################################################
+  def addPilotTQReferences(self,tqPilotDict,ownerDN,ownerGroup,broker='Unknown',
+                           gridType='DIRAC',requirements='Unknown',pilotStampDict={}):
+    """ Add new pilot job references for several task queues { taskQueueID : [ pilotRef ] }
+        with multi-row inserts, either all of them or none are added
+    """
 
-      req = "INSERT INTO PilotAgents( PilotJobReference, TaskQueueID, OwnerDN, " + \
-            "OwnerGroup, Broker, GridType, SubmissionTime, LastUpdateTime, Status, PilotStamp ) " + \
-            "VALUES ('%s',%d,'%s','%s','%s','%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),'Submitted','%s')" % \
-            (ref,int(taskQueueID),ownerDN,ownerGroup,broker,gridType,stamp)
+    result = self._escapeValues( [ownerDN,ownerGroup,broker,gridType,requirements] )
+    if not result['OK']:
+      return result
+    e_ownerDN,e_ownerGroup,e_broker,e_gridType,e_requirements = result['Value']
 
-      result = self._update(req,connection)
+    rowList = []
+    for taskQueueID,pilotRefs in tqPilotDict.items():
+      result = self._escapeValues( list( pilotRefs ) )
       if not result['OK']:
-        connection.close()
         return result
+      e_refs = result['Value']
+      result = self._escapeValues( [ pilotStampDict.get( ref, '' ) for ref in pilotRefs ] )
+      if not result['OK']:
+        return result
+      for e_ref,e_stamp in zip( e_refs, result['Value'] ):
+        rowList.append( ( e_ref, "(%s,%d,%s,%s,%s,%s,UTC_TIMESTAMP(),UTC_TIMESTAMP(),'Submitted',%s)" % \
+                          (e_ref,int(taskQueueID),e_ownerDN,e_ownerGroup,e_broker,e_gridType,e_stamp) ) )
+    if not rowList:
+      return S_OK()
 
-      req = "SELECT LAST_INSERT_ID();"
-      res = self._query(req,connection)
-      if not res['OK']:
-        connection.close()
-        return res
-      pilotID = int(res['Value'][0][0])
-
-      req = "INSERT INTO PilotRequirements (PilotID,Requirements) VALUES (%d,'%s')" % (pilotID,e_requirements)
-      res = self._update(req,connection)
-      if not res['OK']:
-        connection.close()
-        return res
-
-    connection.close()
-
+    cmdList = []
+    for i in range( 0, len( rowList ), MAX_PILOTS_PER_STATEMENT ):
+      chunk = rowList[i:i+MAX_PILOTS_PER_STATEMENT]
+      cmdList.append( "INSERT INTO PilotAgents( PilotJobReference, TaskQueueID, OwnerDN, " + \
+                      "OwnerGroup, Broker, GridType, SubmissionTime, LastUpdateTime, Status, PilotStamp ) " + \
+                      "VALUES %s" % ','.join( [ row for e_ref,row in chunk ] ) )
+      # LAST_INSERT_ID() is the ID of the first row inserted by the previous statement on this connection
+      cmdList.append( "INSERT INTO PilotRequirements (PilotID,Requirements) " + \
+                      "SELECT PilotID,%s FROM PilotAgents WHERE PilotID >= LAST_INSERT_ID() " % e_requirements + \
+                      "AND PilotJobReference IN (%s)" % ','.join( [ e_ref for e_ref,row in chunk ] ) )
+
+    result = self.__updateInTransaction( cmdList )
+    if not result['OK']:
+      return result
     return S_OK()
 
+##########################################################################################
+  def __updateInTransaction( self, cmdList, conn = False ):
+    """ Execute the update statements in one transaction on the connection of the
+        current thread, the statements already done are rolled back if one fails
+    """
+    result = self.transactionStart()
+    if not result['OK']:
+      return result
+    for cmd in cmdList:
+      result = self._update( cmd, conn = conn )
+      if not result['OK']:
+        self.transactionRollback()
+        return result
+    return self.transactionCommit()
+
 ##########################################################################################
   def setPilotStatus( self, pilotRef, status, destination=None,
                       statusReason=None, gridSite=None, queue=None,
@@ -133,6 +154,68 @@ class PilotAgentsDB(DB):
 
     return S_OK()
 
+##########################################################################################
+  def setPilotsStatus( self, pilotStatusDict, updateTime=None, conn=False ):
+    """ Set the status of several pilots at once, pilotStatusDict is
+        { pilotRef : ( status, destination, statusReason[, gridSite[, queue[, benchmark[, currentJob]]]] ) }.
+        The pilots with the same values are updated by one statement, either all the
+        pilots are updated or none
+    """
+
+    pilotGroups = {}
+    for pilotRef,statusTuple in pilotStatusDict.items():
+      statusTuple = tuple( statusTuple ) + ( None, ) * ( 7 - len( statusTuple ) )
+      pilotGroups.setdefault( statusTuple, [] ).append( pilotRef )
+
+    siteForCE = {}
+    cmdList = []
+    for ( status, destination, statusReason, gridSite, queue, benchmark, currentJob ), pilotRefs in pilotGroups.items():
+      if not statusReason:
+        statusReason = "Not given"
+      if destination and not gridSite:
+        if destination not in siteForCE:
+          result = getSiteForCE(destination)
+          siteForCE[destination] = None
+          if result['OK']:
+            siteForCE[destination] = result['Value']
+        gridSite = siteForCE[destination]
+      result = self._escapeValues( [status,statusReason,destination,gridSite,queue] )
+      if not result['OK']:
+        return result
+      e_status,e_statusReason,e_destination,e_gridSite,e_queue = result['Value']
+      setList = []
+      setList.append( "Status=%s" % e_status )
+      if updateTime:
+        setList.append( "LastUpdateTime='%s'" % updateTime )
+      else:
+        setList.append( "LastUpdateTime=UTC_TIMESTAMP()" )
+      setList.append( "StatusReason=%s" % e_statusReason )
+      if gridSite:
+        setList.append( "GridSite=%s" % e_gridSite )
+      if queue:
+        setList.append( "Queue=%s" % e_queue )
+      if benchmark:
+        setList.append( "BenchMark='%s'" % float( benchmark ) )
+      if currentJob:
+        setList.append( "CurrentJobID='%s'" % int( currentJob ) )
+      if destination:
+        setList.append( "DestinationSite=%s" % e_destination )
+
+      result = self._escapeValues( pilotRefs )
+      if not result['OK']:
+        return result
+      e_refs = result['Value']
+      for i in range( 0, len( e_refs ), MAX_PILOTS_PER_STATEMENT ):
+        cmdList.append( "UPDATE PilotAgents SET %s WHERE PilotJobReference IN (%s)" % \
+                        ( ','.join( setList ), ','.join( e_refs[i:i+MAX_PILOTS_PER_STATEMENT] ) ) )
+    if not cmdList:
+      return S_OK()
+
+    result = self.__updateInTransaction( cmdList, conn = conn )
+    if not result['OK']:
+      return result
+    return S_OK()
+
 ##########################################################################################
   def selectPilots(self,condDict, older=None, newer=None, timeStamp='SubmissionTime',
                         orderAttribute=None, limit=None):
@@ -12,6 +12,7 @@ import time
 from DIRAC  import gConfig, gLogger, S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.private.SharesCorrector import SharesCorrector
 from DIRAC.WorkloadManagementSystem.private.Queues import maxCPUSegments
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Utilities import List
 from DIRAC.Core.Utilities.DictCache import DictCache
@@ -43,10 +44,75 @@ class TaskQueueDB( DB ):
     self.__opsHelper = Operations()
     self.__ensureInsertionIsSingle = False
     self.__sharesCorrector = SharesCorrector( self.__opsHelper )
+    self.__tqIndex = False
     result = self.__initializeDB()
     if not result[ 'OK' ]:
       raise Exception( "Can't create tables: %s" % result[ 'Message' ] )
 
+  def enableTaskQueueIndex( self ):
+    """ Keep an in-memory index of the task queue definitions and use it to find
+        the task queues matching a resource instead of querying the DB
+    """
+    if not self.__tqIndex:
+      self.__tqIndex = TaskQueueIndex( self.__multiValueDefFields, self.__multiValueMatchFields,
+                                       self.__bannedJobMatchFields, self.__strictRequireMatchFields )
+    return self.refreshTaskQueueIndex()
+
+  def refreshTaskQueueIndex( self ):
+    """ Bring the task queue index up to date. TQ definitions never change, so only
+        the new TQs are loaded. Deleted TQs are dropped and priorities updated
+    """
+    if not self.__tqIndex:
+      return S_OK()
+    result = self._query( "SELECT TQId, Priority, Enabled FROM `tq_TaskQueues`" )
+    if not result[ 'OK' ]:
+      self.log.error( "Could not refresh the task queue index", result[ 'Message' ] )
+      return result
+    indexedTQs = set( self.__tqIndex.getTaskQueueIds() )
+    currentTQs = set()
+    newTQs = []
+    for tqId, priority, enabled in result[ 'Value' ]:
+      currentTQs.add( tqId )
+      if tqId in indexedTQs:
+        self.__tqIndex.setPriority( tqId, priority )
+      elif enabled >= 1:
+        #New TQs are disabled until their definition is fully inserted
+        newTQs.append( tqId )
+    for tqId in indexedTQs - currentTQs:
+      self.__tqIndex.removeTaskQueue( tqId )
+    if newTQs:
+      result = self.__addTaskQueuesToIndex( newTQs )
+      if not result[ 'OK' ]:
+        self.log.error( "Could not refresh the task queue index", result[ 'Message' ] )
+        return result
+    self.log.verbose( "Task queue index refreshed: %s new, %s deleted TQs" % ( len( newTQs ),
+                                                                             len( indexedTQs - currentTQs ) ) )
+    return S_OK()
+
+  def __addTaskQueuesToIndex( self, tqIdList ):
+    """ Load the definition of the given TQs from the DB and add them to the index
+    """
+    tqString = ", ".join( [ str( tqId ) for tqId in tqIdList ] )
+    result = self._query( "SELECT TQId, OwnerDN, OwnerGroup, Setup, CPUTime, Priority FROM `tq_TaskQueues` WHERE TQId IN ( %s )" % tqString )
+    if not result[ 'OK' ]:
+      return result
+    tqDefs = {}
+    for tqId, ownerDN, ownerGroup, setup, cpuTime, priority in result[ 'Value' ]:
+      tqDefs[ tqId ] = { 'OwnerDN' : ownerDN, 'OwnerGroup' : ownerGroup, 'Setup' : setup,
+                         'CPUTime' : cpuTime, 'Priority' : priority }
+    if not tqDefs:
+      return S_OK()
+    for field in self.__multiValueDefFields:
+      result = self._query( "SELECT TQId, Value FROM `tq_TQTo%s` WHERE TQId IN ( %s )" % ( field, tqString ) )
+      if not result[ 'OK' ]:
+        return result
+      for tqId, value in result[ 'Value' ]:
+        if tqId in tqDefs:
+          tqDefs[ tqId ].setdefault( field, [] ).append( value )
+    for tqId in tqDefs:
+      self.__tqIndex.addTaskQueue( tqId, tqDefs[ tqId ], tqDefs[ tqId ][ 'Priority' ] )
+    return S_OK()
+
   def enableAllTaskQueues( self ):
     """ Enable all Task queues
     """
@@ -407,6 +473,8 @@ class TaskQueueDB( DB ):
         self.recalculateTQSharesForEntity( tqDefDict[ 'OwnerDN' ], tqDefDict[ 'OwnerGroup' ], connObj = connObj )
     finally:
       self.setTaskQueueState( tqId, True )
+    if newTQ and self.__tqIndex:
+      self.__addTaskQueuesToIndex( [ tqId ] )
     return S_OK()
 
   def __insertJobInTaskQueue( self, jobId, tqId, jobPriority, checkTQExists = True, connObj = False ):
@@ -504,9 +572,26 @@ class TaskQueueDB( DB ):
     """
     Match a job
     """
+    retVal = self.matchAndGetJobs( tqMatchDict, 1, numJobsPerTry = numJobsPerTry,
+                                   numQueuesPerTry = numQueuesPerTry, negativeCond = negativeCond )
+    if not retVal[ 'OK' ]:
+      return retVal
+    matchData = retVal[ 'Value' ]
+    if not matchData[ 'matchFound' ]:
+      return S_OK( { 'matchFound' : False, 'tqMatch' : matchData[ 'tqMatch' ] } )
+    jobId, tqId = matchData[ 'jobs' ][0]
+    return S_OK( { 'matchFound' : True, 'jobId' : jobId, 'taskQueueId' : tqId, 'tqMatch' : matchData[ 'tqMatch' ] } )
+
+  def matchAndGetJobs( self, tqMatchDict, numJobs, numJobsPerTry = 50, numQueuesPerTry = 10, negativeCond = {} ):
+    """
+    Match up to numJobs jobs following the same TQ and job priorities as matchAndGetJob
+    Return S_OK( { 'matchFound' : True/False, 'jobs' : [ ( jobId, tqId ), ... ], 'tqMatch' : tqMatchDict } )
+    """
     #Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict( tqMatchDict )
-    self.log.info( "Starting match for requirements", self.__strDict( tqMatchDict ) )
+    #The TQ index works on the values as they are stored, before escaping them
+    indexMatchDict = dict( tqMatchDict )
+    self.log.info( "Starting match of %s jobs for requirements" % numJobs, self.__strDict( tqMatchDict ) )
     retVal = self._checkMatchDefinition( tqMatchDict )
     if not retVal[ 'OK' ]:
       self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
@@ -517,12 +602,18 @@ class TaskQueueDB( DB ):
     connObj = retVal[ 'Value' ]
     preJobSQL = "SELECT `tq_Jobs`.JobId, `tq_Jobs`.TQId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s AND `tq_Jobs`.Priority = %s"
     prioSQL = "SELECT `tq_Jobs`.Priority FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
-    postJobSQL = " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s" % numJobsPerTry
+    if 'JobID' in tqMatchDict:
+      # A certain JobID is required by the resource, there's only one job to get
+      preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
+      numJobs = 1
+    postJobSQL = " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s" % max( numJobsPerTry, numJobs )
+    matchedJobs = []
     for matchTry in range( self.__maxMatchRetry ):
       if 'JobID' in tqMatchDict:
         # A certain JobID is required by the resource, so all TQ are to be considered
         retVal = self.matchAndGetTaskQueue( tqMatchDict, numQueuesToGet = 0, skipMatchDictDef = True, connObj = connObj )
-        preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
+      elif self.__tqIndex:
+        retVal = S_OK( self.__tqIndex.match( indexMatchDict, numQueuesToGet = numQueuesPerTry, negativeCond = negativeCond ) )
       else:
         retVal = self.matchAndGetTaskQueue( tqMatchDict,
                                             numQueuesToGet = numQueuesPerTry,
@@ -534,7 +625,7 @@ class TaskQueueDB( DB ):
       tqList = retVal[ 'Value' ]
       if len( tqList ) == 0:
         self.log.info( "No TQ matches requirements" )
-        return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
+        break
       for tqId, tqOwnerDN, tqOwnerGroup in tqList:
         self.log.info( "Trying to extract jobs from TQ %s" % tqId )
         retVal = self._query( prioSQL % tqId, conn = connObj )
@@ -546,26 +637,76 @@ class TaskQueueDB( DB ):
         retVal = self._query( "%s %s" % ( preJobSQL % ( tqId, prio ), postJobSQL ), conn = connObj )
         if not retVal[ 'OK' ]:
           return S_ERROR( "Can't begin transaction for matching job: %s" % retVal[ 'Message' ] )
-        jobTQList = [ ( row[0], row[1] ) for row in retVal[ 'Value' ] ]
-        if len( jobTQList ) == 0:
+        jobList = [ row[0] for row in retVal[ 'Value' ] ]
+        if len( jobList ) == 0:
           gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
           self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
-        while len( jobTQList ) > 0:
-          jobId, tqId = jobTQList.pop( random.randint( 0, len( jobTQList ) - 1 ) )
-          self.log.info( "Trying to extract job %s from TQ %s" % ( jobId, tqId ) )
-          retVal = self.deleteJob( jobId, connObj = connObj )
+        random.shuffle( jobList )
+        while jobList and len( matchedJobs ) < numJobs:
+          numToTake = numJobs - len( matchedJobs )
+          jobsToTake = jobList[ :numToTake ]
+          del jobList[ :numToTake ]
+          self.log.info( "Trying to extract jobs %s from TQ %s" % ( ", ".join( [ str( jid ) for jid in jobsToTake ] ), tqId ) )
+          retVal = self.__takeJobsOutOfTQ( jobsToTake, tqId, tqOwnerDN, tqOwnerGroup, connObj = connObj )
           if not retVal[ 'OK' ]:
-            msgFix = "Could not take job"
-            msgVar = " %s out from the TQ %s: %s" % ( jobId, tqId, retVal[ 'Message' ] )
+            msgFix = "Could not take jobs"
+            msgVar = " out from the TQ %s: %s" % ( tqId, retVal[ 'Message' ] )
             self.log.error( msgFix, msgVar )
+            if matchedJobs:
+              #Jobs already taken out of the TQs can't be given back, so hand them over
+              return S_OK( { 'matchFound' : True, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
             return S_ERROR( msgFix + msgVar )
-          if retVal[ 'Value' ] == True :
+          for jobId in retVal[ 'Value' ]:
             self.log.info( "Extracted job %s with prio %s from TQ %s" % ( jobId, prio, tqId ) )
-            return S_OK( { 'matchFound' : True, 'jobId' : jobId, 'taskQueueId' : tqId, 'tqMatch' : tqMatchDict } )
-        self.log.info( "No jobs could be extracted from TQ %s" % tqId )
+            matchedJobs.append( ( jobId, tqId ) )
+        if len( matchedJobs ) >= numJobs:
+          return S_OK( { 'matchFound' : True, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+        self.log.info( "No more jobs could be extracted from TQ %s" % tqId )
+    if matchedJobs:
+      return S_OK( { 'matchFound' : True, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+    if len( tqList ) == 0:
+      return S_OK( { 'matchFound' : False, 'jobs' : [], 'tqMatch' : tqMatchDict } )
     self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
     return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
 
+  def __takeJobsOutOfTQ( self, jobIds, tqId, tqOwnerDN, tqOwnerGroup, connObj = False ):
+    """
+    Atomically take a set of jobs out of a task queue. Jobs grabbed meanwhile by
+    another matcher are skipped
+    Return S_OK( [ list of jobs taken ] ) / S_ERROR
+    """
+    if len( jobIds ) == 1:
+      retVal = self.deleteJob( jobIds[0], connObj = connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if retVal[ 'Value' ]:
+        return S_OK( list( jobIds ) )
+      return S_OK( [] )
+    jobString = ", ".join( [ str( int( jobId ) ) for jobId in jobIds ] )
+    retVal = self.transactionStart()
+    if not retVal[ 'OK' ]:
+      return retVal
+    #Lock the rows that are still there, any other matcher will block until we are done with them
+    retVal = self._query( "SELECT JobId FROM `tq_Jobs` WHERE TQId = %s AND JobId IN ( %s ) FOR UPDATE" % ( tqId, jobString ),
+                          conn = connObj )
+    if not retVal[ 'OK' ]:
+      self.transactionRollback()
+      return retVal
+    takenJobs = [ row[0] for row in retVal[ 'Value' ] ]
+    if takenJobs:
+      self.log.info( "Deleting jobs %s" % ", ".join( [ str( jobId ) for jobId in takenJobs ] ) )
+      retVal = self._update( "DELETE FROM `tq_Jobs` WHERE JobId IN ( %s )" % ", ".join( [ str( jobId ) for jobId in takenJobs ] ),
+                             conn = connObj )
+      if not retVal[ 'OK' ]:
+        self.transactionRollback()
+        return retVal
+    retVal = self.transactionCommit()
+    if not retVal[ 'OK' ]:
+      return retVal
+    if takenJobs:
+      self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+    return S_OK( takenJobs )
+
   def matchAndGetTaskQueue( self, tqMatchDict, numQueuesToGet = 1, skipMatchDictDef = False,
                                   negativeCond = {}, connObj = False ):
     """
@@ -851,6 +992,8 @@ class TaskQueueDB( DB ):
         retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( mvField, tqId ), conn = connObj )
         if not retVal[ 'OK' ]:
           return retVal
+      if self.__tqIndex:
+        self.__tqIndex.removeTaskQueue( tqId )
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       self.log.info( "Deleted empty and enabled TQ %s" % tqId )
       return S_OK( True )
@@ -879,6 +1022,8 @@ class TaskQueueDB( DB ):
     if not retVal[ 'OK' ]:
       return S_ERROR( "Could not delete task queue %s: %s" % ( tqId, retVal[ 'Message' ] ) )
     delTQ = retVal[ 'Value' ]
+    if self.__tqIndex:
+      self.__tqIndex.removeTaskQueue( tqId )
     sqlCmd = "DELETE FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s" % tqId
     retVal = self._update( sqlCmd, conn = connObj )
     if not retVal[ 'OK' ]:
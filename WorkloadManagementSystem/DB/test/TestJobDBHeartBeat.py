@@ -0,0 +1,36 @@
+""" Unit tests of the bulk heart beat update of the JobDB, the MySQL calls are recorded
+    by FakeMySQL
+"""
+
+import unittest
+
+from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
+from DIRAC.Core.Base.test.FakeMySQL import FakeMySQL
+
+class FakeJobDB( FakeMySQL, JobDB ):
+  pass
+
+class JobDBHeartBeatCase( unittest.TestCase ):
+
+  def setUp( self ):
+    self.jobDB = FakeJobDB()
+
+  def test_setHeartBeatDataBulk( self ):
+    heartBeatDict = { 1 : ( { 'CPU' : 2 }, { 'LoadAverage' : 1 }, '2014-01-01 00:00:00' ),
+                      2 : ( {}, {}, '2014-01-01 00:00:00' ) }
+    result = self.jobDB.setHeartBeatDataBulk( heartBeatDict )
+    self.assert_( result['OK'] )
+    reqs = self.jobDB.getCalls( 'update' )
+    self.assertEqual( len( reqs ), 3 )
+    # Only the running or stalled jobs are set to Running, e.g. a Completed job keeps its status
+    self.assert_( "Status=IF(Status IN ('Running','Stalled'),'Running',Status)" in reqs[0] )
+    self.assert_( reqs[0].endswith( 'IN (1,2)' ) or reqs[0].endswith( 'IN (2,1)' ) )
+    self.assertEqual( self.jobDB.getArgs( 'update' )[1], ( 1, 'CPU', '2' ) )
+
+  def test_empty( self ):
+    self.assert_( self.jobDB.setHeartBeatDataBulk( {} )['OK'] )
+    self.assertEqual( self.jobDB.calls, [] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( JobDBHeartBeatCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
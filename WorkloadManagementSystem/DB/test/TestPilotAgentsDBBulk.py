@@ -0,0 +1,83 @@
+""" Unit tests of the single and bulk pilot updates of the PilotAgentsDB,
+    the MySQL calls are recorded by FakeMySQL
+"""
+
+import unittest
+
+from mock import Mock
+
+import DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB as moduleTested
+from DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB import PilotAgentsDB
+from DIRAC.Core.Base.test.FakeMySQL import FakeMySQL
+from DIRAC import S_OK
+
+class FakePilotAgentsDB( FakeMySQL, PilotAgentsDB ):
+  pass
+
+class PilotAgentsDBTestCase( unittest.TestCase ):
+  """ Base class for the PilotAgentsDB test cases
+  """
+
+  def setUp( self ):
+    self.getSiteForCE = moduleTested.getSiteForCE
+    moduleTested.getSiteForCE = Mock( return_value = S_OK( 'LCG.Site.ch' ) )
+
+  def tearDown( self ):
+    moduleTested.getSiteForCE = self.getSiteForCE
+
+class PilotStatusCase( PilotAgentsDBTestCase ):
+
+  def test_setPilotStatus( self ):
+    pilotDB = FakePilotAgentsDB()
+    result = pilotDB.setPilotStatus( 'ref1', 'Running', destination = 'ce.site.ch',
+                                     benchmark = 10, currentJob = 123 )
+    self.assert_( result['OK'] )
+    req = pilotDB.getCalls( 'update' )[0]
+    self.assert_( req.startswith( "UPDATE PilotAgents SET Status='Running'" ) )
+    self.assert_( "CurrentJobID='123'" in req )
+    self.assert_( "BenchMark='10.0'" in req )
+    self.assert_( "GridSite='LCG.Site.ch'" in req )
+    self.assert_( req.endswith( "WHERE PilotJobReference='ref1'" ) )
+
+  def test_setPilotsStatus( self ):
+    pilotStatusDict = { 'ref1' : ( 'Submitted', 'ce.site.ch', 'Submitted', 'LCG.Site.ch', 'queue' ),
+                        'ref2' : ( 'Submitted', 'ce.site.ch', 'Submitted', 'LCG.Site.ch', 'queue' ),
+                        'ref3' : ( 'Done', '', 'Updated', None, None, 5, 7 ) }
+    pilotDB = FakePilotAgentsDB()
+    result = pilotDB.setPilotsStatus( pilotStatusDict )
+    self.assert_( result['OK'] )
+    self.assertEqual( pilotDB.getCalls(), [ 'start', 'update', 'update', 'commit' ] )
+    cmdList = sorted( pilotDB.getCalls( 'update' ) )
+    self.assert_( "Status='Done'" in cmdList[0] and "CurrentJobID='7'" in cmdList[0] and "BenchMark='5.0'" in cmdList[0] )
+    self.assert_( cmdList[0].endswith( "IN ('ref3')" ) )
+    self.assert_( "Queue='queue'" in cmdList[1] and "DestinationSite='ce.site.ch'" in cmdList[1] )
+    self.assert_( cmdList[1].endswith( "IN ('ref1','ref2')" ) or cmdList[1].endswith( "IN ('ref2','ref1')" ) )
+
+  def test_setPilotsStatusRollback( self ):
+    """ no group of pilots is left updated when the update of another one fails """
+    pilotStatusDict = { 'ref1' : ( 'Running', '', 'Updated' ), 'ref2' : ( 'Done', '', 'Updated' ) }
+    pilotDB = FakePilotAgentsDB( failOn = [ "Status='Done'" ] )
+    self.assertFalse( pilotDB.setPilotsStatus( pilotStatusDict )['OK'] )
+    self.assertEqual( pilotDB.getCalls()[0], 'start' )
+    self.assertEqual( pilotDB.getCalls()[-1], 'rollback' )
+    self.assertFalse( 'commit' in pilotDB.getCalls() )
+
+  def test_addPilotTQReferences( self ):
+    pilotDB = FakePilotAgentsDB()
+    result = pilotDB.addPilotTQReference( [ 'ref1', 'ref2' ], 5, '/DN=owner', 'group' )
+    self.assert_( result['OK'] )
+    self.assertEqual( pilotDB.getCalls(), [ 'start', 'update', 'update', 'commit' ] )
+    cmdList = pilotDB.getCalls( 'update' )
+    self.assert_( cmdList[0].startswith( 'INSERT INTO PilotAgents' ) )
+    self.assertEqual( cmdList[0].count( 'UTC_TIMESTAMP(),UTC_TIMESTAMP()' ), 2 )
+    self.assert_( 'LAST_INSERT_ID()' in cmdList[1] )
+
+  def test_addPilotTQReferencesRollback( self ):
+    """ the pilots are not left without requirements """
+    pilotDB = FakePilotAgentsDB( failOn = [ 'INSERT INTO PilotRequirements' ] )
+    self.assertFalse( pilotDB.addPilotTQReference( [ 'ref1', 'ref2' ], 5, '/DN=owner', 'group' )['OK'] )
+    self.assertEqual( pilotDB.getCalls(), [ 'start', 'update', 'update', 'rollback' ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( PilotStatusCase )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -12,7 +12,7 @@ __RCSID__ = "$Id$"
 import time
 import pprint
 from DIRAC.WorkloadManagementSystem.Executor.Base.OptimizerExecutor  import OptimizerExecutor
-from DIRAC.Resources.Storage.StorageElement                          import StorageElement
+from DIRAC.Resources.Storage.StorageElement                          import getStorageElement
 from DIRAC.Core.Utilities.SiteSEMapping                              import getSitesForSE
 from DIRAC.Core.Utilities.List                                       import uniqueElements
 from DIRAC                                                           import S_OK, S_ERROR
@@ -276,7 +276,7 @@ class InputData( OptimizerExecutor ):
             self.jobLog.warn( "Could not get sites for SE %s: %s" % ( seName, result[ 'Message' ] ) )
             continue
           siteList = result[ 'Value' ]
-          seObj = StorageElement( seName )
+          seObj = getStorageElement( seName )
           result = seObj.getStatus()
           if not result[ 'OK' ]:
             self.jobLog.error( "Could not retrieve status for SE %s: %s" % ( seName, result[ 'Message' ] ) )
@@ -20,7 +20,7 @@ from DIRAC.WorkloadManagementSystem.Executor.Base.OptimizerExecutor import Optim
 from DIRAC.Core.Utilities.SiteSEMapping import getSEsForSite
 from DIRAC.Core.Utilities.Time import fromString, toEpoch
 from DIRAC.StorageManagementSystem.Client.StorageManagerClient import StorageManagerClient
-from DIRAC.Resources.Storage.StorageElement                    import StorageElement
+from DIRAC.Resources.Storage.StorageElement                    import getStorageElement
 from DIRAC.ConfigurationSystem.Client.Helpers.Resources        import getSiteTier
 from DIRAC.ConfigurationSystem.Client.Helpers                  import Registry
 from DIRAC.Core.Security                                       import Properties
@@ -319,7 +319,7 @@ class JobScheduling( OptimizerExecutor ):
     tapeSEs = []
     diskSEs = []
     for seName in siteSEs:
-      se = StorageElement( seName )
+      se = getStorageElement( seName )
       result = se.getStatus()
       if not result[ 'OK' ]:
         self.jobLog.error( "Cannot retrieve SE %s status: %s" % ( seName, result[ 'Message' ] ) )
@@ -421,7 +421,7 @@ class JobScheduling( OptimizerExecutor ):
       for seName in closeSEs:
         #If we don't have the SE status get it and store it
         if seName not in seStatus:
-          seObj = StorageElement( seName )
+          seObj = getStorageElement( seName )
           result = seObj.getStatus()
           if not result['OK' ]:
             self.jobLog.error( "Cannot retrieve SE %s status: %s" % ( seName, result[ 'Message' ] ) )
@@ -51,6 +51,7 @@ class Watchdog:
     self.processMonitor = ProcessMonitor()
     self.checkError = ''
     self.currentStats = {}
+    self.snapshot = {}
     self.initialized = False
     self.count = 0
 
@@ -185,18 +186,30 @@ class Watchdog:
     self.log.verbose( 'Checking loop starts for Watchdog' )
     heartBeatDict = {}
     msg = ''
-    result = self.getLoadAverage()
+    #All the values of the checking cycle are taken from a single snapshot when available
+    result = self.getSnapshot()
+    self.snapshot = {}
+    if result['OK']:
+      self.snapshot = result['Value']
+    else:
+      self.log.verbose( 'No snapshot available: %s' % result['Message'] )
+    result = self.__getSnapshotValue( 'LoadAverage', self.getLoadAverage )
     msg += 'LoadAvg: %s ' % ( result['Value'] )
     heartBeatDict['LoadAverage'] = result['Value']
     if not self.parameters.has_key( 'LoadAverage' ):
       self.parameters['LoadAverage'] = []
     self.parameters['LoadAverage'].append( result['Value'] )
-    result = self.getMemoryUsed()
+    result = self.__getSnapshotValue( 'MemoryUsed', self.getMemoryUsed )
     msg += 'MemUsed: %.1f kb ' % ( result['Value'] )
     heartBeatDict['MemoryUsed'] = result['Value']
     if not self.parameters.has_key( 'MemoryUsed' ):
       self.parameters['MemoryUsed'] = []
     self.parameters['MemoryUsed'].append( result['Value'] )
+    for key in ( 'RSS', 'PSS' ):
+      if key in self.snapshot:
+        msg += '%s: %s kb ' % ( key, self.snapshot[key] )
+        heartBeatDict[key] = self.snapshot[key]
+    # Not taken from the snapshot, only the platform specific method knows about e.g. the AFS quota
     result = self.getDiskSpace()
     msg += 'DiskSpace: %.1f MB ' % ( result['Value'] )
     if not self.parameters.has_key( 'DiskSpace' ):
@@ -276,6 +289,9 @@ class Watchdog:
     """Uses os.times() to get CPU time and returns HH:MM:SS after conversion.
     """
     cpuTime = '00:00:00'
+    if 'CPUConsumed' in self.snapshot:
+      self.log.verbose( "Raw CPU time consumed (s) = %s" % ( self.snapshot['CPUConsumed'] ) )
+      return self.__getCPUHMS( self.snapshot['CPUConsumed'] )
     try:
       cpuTime = self.processMonitor.getCPUConsumed( self.wrapperPID )
     except Exception:
@@ -293,6 +309,15 @@ class Watchdog:
     result = self.__getCPUHMS( cpuTime )
     return result
 
+  #############################################################################
+  def __getSnapshotValue( self, key, method ):
+    """Returns the value from the snapshot of the current checking cycle or, if
+       it is not part of it, calls the specific method.
+    """
+    if key in self.snapshot:
+      return S_OK( self.snapshot[key] )
+    return method()
+
   #############################################################################
   def __getCPUHMS( self, cpuTime ):
     mins, secs = divmod( cpuTime, 60 )
@@ -686,6 +711,13 @@ class Watchdog:
       else:
         summary['LoadAverage'] = 'Could not be estimated'
 
+    #Peak memory
+    result = self.getMemoryPeaks()
+    if result['OK']:
+      for key in ( 'MaxRSS', 'MaxPSS', 'MaxCGroupMemory' ):
+        if result['Value'].get( key ):
+          summary['%s(kb)' % key] = result['Value'][key]
+
     result = self.__getWallClockTime()
     wallClock = result['Value']
     summary['WallClockTime(s)'] = wallClock
@@ -806,4 +838,15 @@ class Watchdog:
     self.log.warn( 'Watchdog: ' + methodName + ' method should be implemented in a subclass' )
     return S_ERROR( 'Watchdog: ' + methodName + ' method should be implemented in a subclass' )
 
+  #############################################################################
+  def getSnapshot( self ):
+    """ Attempts to sample all the resources used in one pass, can be overridden in a subclass.
+        The values missing from the snapshot are obtained with the specific methods."""
+    return S_OK( {} )
+
+  #############################################################################
+  def getMemoryPeaks( self ):
+    """ Attempts to get the peak memory values in kb, can be overridden in a subclass"""
+    return S_OK( {} )
+
 #EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#
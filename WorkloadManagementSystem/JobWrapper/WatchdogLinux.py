@@ -14,11 +14,11 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.WorkloadManagementSystem.JobWrapper.Watchdog  import Watchdog
-from DIRAC.Core.Utilities.Subprocess                     import shellCall
+from DIRAC.Core.Utilities                                import ProcSampler
 from DIRAC                                               import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Os import getDiskSpace
 
-import string,re,socket
+import string,re,socket,os,pwd
 
 class WatchdogLinux(Watchdog):
 
@@ -28,6 +28,7 @@ class WatchdogLinux(Watchdog):
     Watchdog.__init__(self,pid,thread,spObject,jobCPUtime,systemFlag)
     self.systemFlag = systemFlag
     self.pid = pid
+    self.sampler = None
 
   ############################################################################
   def getNodeInformation(self):
@@ -49,9 +50,10 @@ class WatchdogLinux(Watchdog):
       file.close()
       result["Memory(kB)"] =  string.replace(string.replace(string.split(info[3],":")[1]," ",""),"\n","")
       account = 'Unknown'
-      localID = shellCall(10,'whoami')
-      if localID['OK']:
-        account = localID['Value'][1].strip()
+      try:
+        account = pwd.getpwuid(os.getuid())[0]
+      except KeyError:
+        pass
       result["LocalAccount"] = account
     except Exception, x:
       self.log.fatal('Watchdog failed to obtain node information with Exception:')
@@ -62,17 +64,32 @@ class WatchdogLinux(Watchdog):
 
     return result
 
+  ############################################################################
+  def getSnapshot(self):
+    """Samples the process tree and the node resources from /proc in one pass.
+    """
+    if not self.sampler:
+      self.sampler = ProcSampler.ProcSampler(self.pid)
+    try:
+      return self.sampler.sample()
+    except Exception, x:
+      self.log.warn('Could not sample /proc:', str(x))
+      return S_ERROR('Could not sample /proc')
+
+  ############################################################################
+  def getMemoryPeaks(self):
+    """Returns the peak memory values in kB seen by the sampler.
+    """
+    if not self.sampler:
+      return S_OK({})
+    return S_OK(self.sampler.getPeaks())
+
   ############################################################################
   def getLoadAverage(self):
     """Obtains the load average.
     """
-    result = S_OK()
-    comm = '/bin/cat /proc/loadavg'
-    loadAvgDict = shellCall(5,comm)
-    if loadAvgDict['OK']:
-      la = float(string.split(loadAvgDict['Value'][1])[0])
-      result['Value'] = la
-    else:
+    result = ProcSampler.getLoadAverage()
+    if not result['OK']:
       result = S_ERROR('Could not obtain load average')
       self.log.warn('Could not obtain load average')
       result['Value'] = 0
@@ -83,13 +100,8 @@ class WatchdogLinux(Watchdog):
   def getMemoryUsed(self):
     """Obtains the memory used.
     """
-    result = S_OK()
-    comm = '/usr/bin/free'
-    memDict = shellCall(5,comm)
-    if memDict['OK']:
-      mem = string.split(memDict['Value'][1]) [8]
-      result['Value'] = float(mem)
-    else:
+    result = ProcSampler.getMemoryUsed()
+    if not result['OK']:
       result = S_ERROR('Could not obtain memory used')
       self.log.warn('Could not obtain memory used')
       result['Value'] = 0
@@ -99,9 +111,16 @@ class WatchdogLinux(Watchdog):
   def getDiskSpace(self):
     """Obtains the disk space used.
     """
-    result = S_OK()
-    diskSpace = getDiskSpace()
+    # statvfs does not know about the AFS quota
+    if os.path.realpath('.').startswith('/afs'):
+      diskSpace = getDiskSpace()
+    else:
+      result = ProcSampler.getDiskSpace()
+      diskSpace = -1
+      if result['OK']:
+        diskSpace = result['Value']
 
+    result = S_OK()
     if diskSpace == -1:
       result = S_ERROR('Could not obtain disk usage')
       self.log.warn('Could not obtain disk usage')
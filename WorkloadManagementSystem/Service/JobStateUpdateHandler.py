@@ -13,15 +13,19 @@
 
 __RCSID__ = "$Id$"
 
+import time
+import threading
 from types import *
 from DIRAC.Core.DISET.RequestHandler import RequestHandler
-from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC import gLogger, gConfig, S_OK, S_ERROR, Time
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
 
 # This is a global instance of the JobDB class
 jobDB = False
 logDB = False
+heartBeatBuffer = False
+jobCommandIndex = False
 
 JOB_FINAL_STATES = ['Done', 'Completed', 'Failed']
 
@@ -29,10 +33,116 @@ def initializeJobStateUpdateHandler( serviceInfo ):
 
   global jobDB
   global logDB
+  global heartBeatBuffer
+  global jobCommandIndex
   jobDB = JobDB()
   logDB = JobLoggingDB()
+
+  csSection = serviceInfo[ 'serviceSectionPath' ]
+  # Heart beats are written to the DB in bulk every HeartBeatFlushPeriod seconds, 0 writes them one by one
+  flushPeriod = gConfig.getValue( "%s/HeartBeatFlushPeriod" % csSection, 5 )
+  if flushPeriod > 0:
+    heartBeatBuffer = HeartBeatBuffer( jobDB, flushPeriod, gConfig.getValue( "%s/HeartBeatFlushSize" % csSection, 500 ) )
+    heartBeatBuffer.start()
+  # The jobs with pending commands are reloaded every JobCommandRefreshPeriod seconds, 0 checks each heart beat
+  refreshPeriod = gConfig.getValue( "%s/JobCommandRefreshPeriod" % csSection, 20 )
+  if refreshPeriod > 0:
+    jobCommandIndex = JobCommandIndex( jobDB, refreshPeriod )
   return S_OK()
 
+class HeartBeatBuffer:
+  """ Heart beats received since the last flush, coalesced per job and written with multi-row statements
+  """
+
+  def __init__( self, jobDB, flushPeriod, flushSize ):
+    self.__jobDB = jobDB
+    self.__flushPeriod = flushPeriod
+    self.__flushSize = max( 1, flushSize )
+    self.__heartBeats = {}
+    self.__lock = threading.Lock()
+    self.__wakeUp = threading.Event()
+
+  def start( self ):
+    thread = threading.Thread( target = self.__run, name = "HeartBeatBuffer" )
+    thread.setDaemon( True )
+    thread.start()
+
+  def add( self, jobID, staticData, dynamicData ):
+    """ Keep the heart beat until the next flush. The static data is merged with the one of a previous
+        heart beat of the same job, the dynamic data of the latest heart beat wins
+    """
+    self.__lock.acquire()
+    try:
+      mergedData = {}
+      if jobID in self.__heartBeats:
+        mergedData.update( self.__heartBeats[ jobID ][0] )
+      mergedData.update( staticData )
+      self.__heartBeats[ jobID ] = ( mergedData, dict( dynamicData ), Time.dateTime() )
+      full = len( self.__heartBeats ) >= self.__flushSize
+    finally:
+      self.__lock.release()
+    if full:
+      self.__wakeUp.set()
+
+  def flush( self ):
+    """ Write the buffered heart beats, flushSize jobs per statement
+    """
+    self.__lock.acquire()
+    try:
+      heartBeats = self.__heartBeats
+      self.__heartBeats = {}
+    finally:
+      self.__lock.release()
+    jobIDs = heartBeats.keys()
+    for i in range( 0, len( jobIDs ), self.__flushSize ):
+      heartBeatDict = dict( [ ( jobID, heartBeats[ jobID ] ) for jobID in jobIDs[ i:i + self.__flushSize ] ] )
+      result = self.__jobDB.setHeartBeatDataBulk( heartBeatDict )
+      if not result['OK']:
+        gLogger.warn( 'Failed to set the heart beat data for %d jobs' % len( heartBeatDict ), result['Message'] )
+
+  def __run( self ):
+    while True:
+      self.__wakeUp.wait( self.__flushPeriod )
+      self.__wakeUp.clear()
+      try:
+        self.flush()
+      except Exception:
+        gLogger.exception( 'Failed to flush the heart beats' )
+
+class JobCommandIndex:
+  """ IDs of the jobs having commands waiting to be sent, reloaded from the DB every refreshPeriod seconds
+  """
+
+  def __init__( self, jobDB, refreshPeriod ):
+    self.__jobDB = jobDB
+    self.__refreshPeriod = refreshPeriod
+    self.__jobIDs = None
+    self.__lastRefresh = 0
+    self.__lock = threading.Lock()
+
+  def hasCommands( self, jobID ):
+    """ True if the job may have commands, it is always the case while the index could not be loaded
+    """
+    if time.time() - self.__lastRefresh > self.__refreshPeriod and self.__lock.acquire( False ):
+      # Only one thread reloads the index, the others use the current one
+      try:
+        result = self.__jobDB.getJobsWithCommand()
+        if result['OK']:
+          self.__jobIDs = set( result['Value'] )
+        else:
+          gLogger.warn( 'Failed to load the jobs with commands', result['Message'] )
+          self.__jobIDs = None
+        self.__lastRefresh = time.time()
+      finally:
+        self.__lock.release()
+    jobIDs = self.__jobIDs
+    return jobIDs is None or jobID in jobIDs
+
+  def discard( self, jobID ):
+    jobIDs = self.__jobIDs
+    if jobIDs is not None:
+      jobIDs.discard( jobID )
+
 class JobStateUpdateHandler( RequestHandler ):
 
   ###########################################################################
@@ -119,6 +229,109 @@ class JobStateUpdateHandler( RequestHandler ):
         as a key and status information dictionary as values
     """
 
+    result = jobDB.getJobAttributes( jobID, ['Status'] )
+    if not result['OK']:
+      return result
+
+    if not result['Value']:
+      # if there is no matching Job it returns an empty dictionary
+      return S_ERROR( 'No Matching Job' )
+
+    attrNames, attrValues, startDate, endDate = self.__getLastStatus( statusDict, result['Value']['Status'] )
+    result = jobDB.setJobAttributes( jobID, attrNames, attrValues, update = True )
+    if not result['OK']:
+      return result
+
+    if endDate:
+      result = jobDB.setEndExecTime( jobID, endDate )
+    if startDate:
+      result = jobDB.setStartExecTime( jobID, startDate )
+
+    # Update the JobLoggingDB records
+    for date, status, minor, application, source in self.__getLoggingRecords( statusDict ):
+      result = logDB.addLoggingRecord( jobID, status, minor, application, date, source )
+      if not result['OK']:
+        return result
+
+    return S_OK()
+
+  ###########################################################################
+  types_setJobsStatusBulk = [DictType]
+  def export_setJobsStatusBulk( self, jobStatusDict ):
+    """ Same as setJobStatusBulk for several jobs at once. jobStatusDict is
+        { jobID : statusDict }, the current statuses are read with one query, the jobs
+        getting the same status are updated together and all the logging records are
+        inserted at once. Returns { 'Successful' : [ jobIDs ], 'Failed' : { jobID : reason } }
+    """
+
+    statusDicts = {}
+    try:
+      for jobID, statusDict in jobStatusDict.items():
+        statusDicts[ int( jobID ) ] = statusDict
+    except ValueError:
+      return S_ERROR( 'Job IDs must be integers' )
+    failed = {}
+    if not statusDicts:
+      return S_OK( { 'Successful' : [], 'Failed' : failed } )
+
+    result = jobDB.getAttributesForJobList( statusDicts.keys(), ['Status'] )
+    if not result['OK']:
+      return result
+    currentStatus = result['Value']
+
+    attrGroups = {}
+    startDates = {}
+    endDates = {}
+    loggingRecords = []
+    for jobID, statusDict in statusDicts.items():
+      if jobID not in currentStatus:
+        failed[ jobID ] = 'No Matching Job'
+        continue
+      try:
+        attrNames, attrValues, startDate, endDate = self.__getLastStatus( statusDict, currentStatus[ jobID ]['Status'] )
+        records = self.__getLoggingRecords( statusDict )
+      except ( KeyError, TypeError, AttributeError ), x:
+        failed[ jobID ] = 'Malformed status dictionary: %s' % str( x )
+        continue
+      # The jobs ending in the same state are updated together
+      attrGroups.setdefault( ( tuple( attrNames ), tuple( attrValues ) ), [] ).append( jobID )
+      if endDate:
+        endDates[ jobID ] = endDate
+      if startDate:
+        startDates[ jobID ] = startDate
+      for date, status, minor, application, source in records:
+        loggingRecords.append( ( jobID, status, minor, application, date, source ) )
+
+    successful = []
+    for ( attrNames, attrValues ), jobIDs in attrGroups.items():
+      result = jobDB.setAttributesForJobList( jobIDs, list( attrNames ), list( attrValues ), update = True )
+      if result['OK']:
+        successful += jobIDs
+      else:
+        for jobID in jobIDs:
+          failed[ jobID ] = result['Message']
+
+    # Time stamps and logging records are only set for the jobs updated
+    endDates = dict( [ ( jobID, date ) for jobID, date in endDates.items() if jobID not in failed ] )
+    startDates = dict( [ ( jobID, date ) for jobID, date in startDates.items() if jobID not in failed ] )
+    result = jobDB.setEndExecTimeForJobList( endDates )
+    if not result['OK']:
+      gLogger.warn( 'Failed to set the end execution time', result['Message'] )
+    result = jobDB.setStartExecTimeForJobList( startDates )
+    if not result['OK']:
+      gLogger.warn( 'Failed to set the start execution time', result['Message'] )
+
+    loggingRecords = [ record for record in loggingRecords if record[0] not in failed ]
+    result = logDB.addLoggingRecordList( loggingRecords )
+    if not result['OK']:
+      return result
+
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+  def __getLastStatus( self, statusDict, currentStatus ):
+    """ Get the attributes to set for the last values in the statusDict together with the
+        start and end execution dates found in it
+    """
     dates = statusDict.keys()
     dates.sort()
     status = ""
@@ -129,16 +342,7 @@ class JobStateUpdateHandler( RequestHandler ):
     startDate = ''
     startFlag = ''
 
-    result = jobDB.getJobAttributes( jobID, ['Status'] )
-    if not result['OK']:
-      return result
-
-    if not result['Value']:
-      # if there is no matching Job it returns an empty dictionary
-      return S_ERROR( 'No Matching Job' )
-
-    new_status = result['Value']['Status']
-    if new_status == "Stalled":
+    if currentStatus == "Stalled":
       status = 'Running'
 
     # Get the last status values
@@ -171,16 +375,12 @@ class JobStateUpdateHandler( RequestHandler ):
     if appCounter:
       attrNames.append( 'ApplicationCounter' )
       attrValues.append( appCounter )
-    result = jobDB.setJobAttributes( jobID, attrNames, attrValues, update = True )
-    if not result['OK']:
-      return result
-
-    if endDate:
-      result = jobDB.setEndExecTime( jobID, endDate )
-    if startDate:
-      result = jobDB.setStartExecTime( jobID, startDate )
+    return attrNames, attrValues, startDate, endDate
 
-    # Update the JobLoggingDB records
+  def __getLoggingRecords( self, statusDict ):
+    """ Get the ( date, status, minor, application, source ) logging records of the statusDict
+    """
+    records = []
     for date, sDict in statusDict.items():
 
       status = sDict['Status']
@@ -195,12 +395,8 @@ class JobStateUpdateHandler( RequestHandler ):
       else:
         status = "Running"
         minor = "Application"
-      source = sDict['Source']
-      result = logDB.addLoggingRecord( jobID, status, minor, application, date, source )
-      if not result['OK']:
-        return result
-
-    return S_OK()
+      records.append( ( date, status, minor, application, sDict['Source'] ) )
+    return records
 
   ###########################################################################
   types_setJobSite = [IntType, StringType]
@@ -293,9 +489,12 @@ class JobStateUpdateHandler( RequestHandler ):
     """ Send a heart beat sign of life for a job jobID
     """
 
-    result = jobDB.setHeartBeatData( jobID, staticData, dynamicData )
-    if not result['OK']:
-      gLogger.warn( 'Failed to set the heart beat data for job %d ' % jobID )
+    if heartBeatBuffer:
+      heartBeatBuffer.add( jobID, staticData, dynamicData )
+    else:
+      result = jobDB.setHeartBeatData( jobID, staticData, dynamicData )
+      if not result['OK']:
+        gLogger.warn( 'Failed to set the heart beat data for job %d ' % jobID )
 
     # Restore the Running status if necessary
     #result = jobDB.getJobAttributes(jobID,['Status'])
@@ -311,7 +510,45 @@ class JobStateUpdateHandler( RequestHandler ):
     #  if not result['OK']:
     #    gLogger.warn('Failed to restore the job status to Running')
 
+    return S_OK( self.__getJobCommands( jobID ) )
+
+  ###########################################################################
+  types_sendHeartBeats = [DictType]
+  def export_sendHeartBeats( self, heartBeats ):
+    """ Send the heart beats of several jobs at once, e.g. the ones running on the same node.
+        heartBeats is { jobID : ( dynamicData, staticData ) }, the commands for each job are
+        returned as { jobID : commandDict }
+    """
+
+    heartBeatDict = {}
+    try:
+      for jobID, ( dynamicData, staticData ) in heartBeats.items():
+        if type( dynamicData ) != DictType or type( staticData ) != DictType:
+          return S_ERROR( 'Heart beat data must be dictionaries for job %s' % jobID )
+        heartBeatDict[ int( jobID ) ] = ( staticData, dynamicData, Time.dateTime() )
+    except ( TypeError, ValueError ):
+      return S_ERROR( 'Heart beats must be given as { jobID : ( dynamicData, staticData ) }' )
+
+    if heartBeatBuffer:
+      for jobID, ( staticData, dynamicData, _heartBeatTime ) in heartBeatDict.items():
+        heartBeatBuffer.add( jobID, staticData, dynamicData )
+    else:
+      result = jobDB.setHeartBeatDataBulk( heartBeatDict )
+      if not result['OK']:
+        gLogger.warn( 'Failed to set the heart beat data for jobs %s' % heartBeatDict.keys() )
+
+    jobMessages = {}
+    for jobID in heartBeatDict:
+      jobMessages[ jobID ] = self.__getJobCommands( jobID )
+    return S_OK( jobMessages )
+
+  def __getJobCommands( self, jobID ):
+    """ Get the commands waiting for the job and flag them as sent
+    """
     jobMessageDict = {}
+    if jobCommandIndex and not jobCommandIndex.hasCommands( jobID ):
+      return jobMessageDict
+
     result = jobDB.getJobCommand( jobID )
     if result['OK']:
       jobMessageDict = result['Value']
@@ -319,6 +556,8 @@ class JobStateUpdateHandler( RequestHandler ):
     if jobMessageDict:
       for key, value in jobMessageDict.items():
         result = jobDB.setJobCommandStatus( jobID, key, 'Sent' )
+    if jobCommandIndex and result['OK']:
+      jobCommandIndex.discard( jobID )
 
-    return S_OK( jobMessageDict )
+    return jobMessageDict
 
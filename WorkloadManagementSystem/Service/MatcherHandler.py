@@ -10,7 +10,7 @@ It also provides an XMLRPC interface to the Matcher
 __RCSID__ = "$Id$"
 
 import time
-from   types import StringType, DictType, StringTypes
+from   types import StringType, DictType, StringTypes, IntType, LongType
 import threading
 
 from DIRAC.ConfigurationSystem.Client.Helpers          import Registry, Operations
@@ -25,6 +25,7 @@ from DIRAC                                             import gMonitor
 from DIRAC.Core.Utilities.ThreadScheduler              import gThreadScheduler
 from DIRAC.Core.Security                               import Properties
 from DIRAC.Core.Utilities.DictCache                    import DictCache
+from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
 
 DEBUG = 0
 
@@ -34,6 +35,7 @@ gJobDB = False
 gJobLoggingDB = False
 gTaskQueueDB = False
 gPilotAgentsDB = False
+gMatcherCache = False
 
 def initializeMatcherHandler( serviceInfo ):
   """  Matcher Service initialization
@@ -43,6 +45,7 @@ def initializeMatcherHandler( serviceInfo ):
   global gJobLoggingDB
   global gTaskQueueDB
   global gPilotAgentsDB
+  global gMatcherCache
 
   gJobDB = JobDB()
   gJobLoggingDB = JobLoggingDB()
@@ -57,9 +60,26 @@ def initializeMatcherHandler( serviceInfo ):
                              'Matching', "matches" , gMonitor.OP_RATE, 300 )
   gMonitor.registerActivity( 'numTQs', "Number of Task Queues",
                              'Matching', "tqsk queues" , gMonitor.OP_MEAN, 300 )
+  for cacheName in ( 'siteMask', 'policy' ):
+    gMonitor.registerActivity( '%sCacheHits' % cacheName, "%s cache hits" % cacheName,
+                               'Matching', "hits", gMonitor.OP_RATE, 300 )
+    gMonitor.registerActivity( '%sCacheMisses' % cacheName, "%s cache misses" % cacheName,
+                               'Matching', "misses", gMonitor.OP_RATE, 300 )
+
+  csSection = serviceInfo[ 'serviceSectionPath' ]
+  gMatcherCache = MatcherCache( gConfig.getValue( "%s/SiteMaskCacheTime" % csSection, 30 ),
+                                gConfig.getValue( "%s/PolicyCacheTime" % csSection, 300 ) )
 
   gTaskQueueDB.recalculateTQSharesForAll()
   gThreadScheduler.addPeriodicTask( 120, gTaskQueueDB.recalculateTQSharesForAll )
+
+  # Optionally match the task queues against an in-memory index of their definitions
+  if gConfig.getValue( "%s/UseTaskQueueIndex" % csSection, False ):
+    result = gTaskQueueDB.enableTaskQueueIndex()
+    if not result[ 'OK' ]:
+      return result
+    refreshPeriod = gConfig.getValue( "%s/TaskQueueIndexRefreshPeriod" % csSection, 10 )
+    gThreadScheduler.addPeriodicTask( refreshPeriod, gTaskQueueDB.refreshTaskQueueIndex )
   gThreadScheduler.addPeriodicTask( 60, sendNumTaskQueues )
 
   sendNumTaskQueues()
@@ -292,6 +312,72 @@ class Limiter:
 #
 #####
 
+class MatcherCache:
+  """ Time bounded cache of the site mask and of the matching policy of each group and setup.
+      The site mask is modified by other services, a change is only seen once the cached mask
+      expires. The policies are also refreshed whenever the CS changes
+  """
+
+  def __init__( self, siteMaskLifeTime, policyLifeTime ):
+    self.__siteMaskLifeTime = siteMaskLifeTime
+    self.__policyLifeTime = policyLifeTime
+    self.__siteMask = False
+    self.__policies = {}
+    self.__csVersion = False
+    self.__lock = threading.Lock()
+
+  def getSiteMask( self ):
+    """ Get the list of active sites
+    """
+    siteMask = self.__siteMask
+    if siteMask and siteMask[0] > time.time():
+      gMonitor.addMark( 'siteMaskCacheHits' )
+      return S_OK( siteMask[1] )
+    gMonitor.addMark( 'siteMaskCacheMisses' )
+    result = gJobDB.getSiteMask( siteState = 'Active' )
+    if not result[ 'OK' ]:
+      return result
+    # An empty mask usually means the DB could not be read, don't keep it
+    if result[ 'Value' ]:
+      self.__siteMask = ( time.time() + self.__siteMaskLifeTime, result[ 'Value' ] )
+    return result
+
+  def getPolicy( self, group, setup, opsHelper ):
+    """ Get the matching policy for the pilots of a group in a setup
+    """
+    csVersion = gConfigurationData.getVersion()
+    cKey = ( group, setup )
+    self.__lock.acquire()
+    try:
+      if csVersion != self.__csVersion:
+        self.__policies = {}
+        self.__csVersion = csVersion
+      policy = self.__policies.get( cKey )
+      if policy and policy[ 'Expiration' ] > time.time():
+        gMonitor.addMark( 'policyCacheHits' )
+        return policy
+    finally:
+      self.__lock.release()
+    gMonitor.addMark( 'policyCacheMisses' )
+    policy = { 'Expiration' : time.time() + self.__policyLifeTime,
+               'CheckVersion' : opsHelper.getValue( "Pilot/CheckVersion", True ),
+               'ValidVersions' : opsHelper.getValue( "Pilot/Version", [] ),
+               'ValidProject' : opsHelper.getValue( "Pilot/Project", "" ),
+               'CheckMatchingDelay' : opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True ),
+               'MaxJobsPerMatch' : opsHelper.getValue( "JobScheduling/MaxJobsPerMatch", 20 ),
+               'VOGroups' : False }
+    result = Registry.getGroupsForVO( Registry.getVOForGroup( group ) )
+    if result[ 'OK' ]:
+      policy[ 'VOGroups' ] = result[ 'Value' ]
+    self.__lock.acquire()
+    try:
+      if csVersion == self.__csVersion:
+        self.__policies[ cKey ] = policy
+    finally:
+      self.__lock.release()
+    return policy
+
+
 class MatcherHandler( RequestHandler ):
 
   __opsCache = {}
@@ -360,22 +446,20 @@ class MatcherHandler( RequestHandler ):
 
     return resourceDict
 
-  def selectJob( self, resourceDescription ):
-    """ Main job selection function to find the highest priority job
-        matching the resource capacity
+  def __checkResourceRequest( self, resourceDescription ):
+    """ Check the credentials, the pilot version and the site of a match request and
+        build the resource dictionary to match the task queues against
+        Returns S_OK( ( resourceDict, siteName, pilotReference, pilotInfoReported ) )
     """
-
-    startTime = time.time()
     resourceDict = self.__processResourceDescription( resourceDescription )
 
     credDict = self.getRemoteCredentials()
+    policy = gMatcherCache.getPolicy( credDict[ 'group' ], self.srv_getClientSetup(), self.__opsHelper )
     #Check credentials if not generic pilot
     if Properties.GENERIC_PILOT in credDict[ 'properties' ]:
       #You can only match groups in the same VO
-      vo = Registry.getVOForGroup( credDict[ 'group' ] )
-      result = Registry.getGroupsForVO( vo )
-      if result[ 'OK' ]:
-        resourceDict[ 'OwnerGroup' ] = result[ 'Value' ]
+      if policy[ 'VOGroups' ] is not False:
+        resourceDict[ 'OwnerGroup' ] = policy[ 'VOGroups' ]
     else:
       #If it's a private pilot, the DN has to be the same
       if Properties.PILOT in credDict[ 'properties' ]:
@@ -399,7 +483,7 @@ class MatcherHandler( RequestHandler ):
         resourceDict[ 'OwnerGroup' ] = credDict[ 'group' ]
 
     # Check the pilot DIRAC version
-    if self.__opsHelper.getValue( "Pilot/CheckVersion", True ):
+    if policy[ 'CheckVersion' ]:
       if 'ReleaseVersion' not in resourceDict:
         if not 'DIRACVersion' in resourceDict:
           return S_ERROR( 'Version check requested and not provided by Pilot' )
@@ -408,12 +492,12 @@ class MatcherHandler( RequestHandler ):
       else:
         pilotVersion = resourceDict['ReleaseVersion']
 
-      validVersions = self.__opsHelper.getValue( "Pilot/Version", [] )
+      validVersions = policy[ 'ValidVersions' ]
       if validVersions and pilotVersion not in validVersions:
         return S_ERROR( 'Pilot version does not match the production version %s not in ( %s )' % \
                        ( pilotVersion, ",".join( validVersions ) ) )
       #Check project if requested
-      validProject = self.__opsHelper.getValue( "Pilot/Project", "" )
+      validProject = policy[ 'ValidProject' ]
       if validProject:
         if 'ReleaseProject' not in resourceDict:
           return S_ERROR( "Version check requested but expected project %s not received" % validProject )
@@ -442,7 +526,7 @@ class MatcherHandler( RequestHandler ):
       return S_ERROR( 'Missing Site Name in Resource JDL' )
 
     # Get common site mask and check the agent site
-    result = gJobDB.getSiteMask( siteState = 'Active' )
+    result = gMatcherCache.getSiteMask()
     if not result['OK']:
       return S_ERROR( 'Internal error: can not get site mask' )
     maskList = result['Value']
@@ -460,6 +544,19 @@ class MatcherHandler( RequestHandler ):
     for key in resourceDict:
      gLogger.verbose( "%s : %s" % ( key.rjust( 20 ), resourceDict[ key ] ) )
 
+    return S_OK( ( resourceDict, siteName, pilotReference, pilotInfoReported, policy ) )
+
+  def selectJob( self, resourceDescription ):
+    """ Main job selection function to find the highest priority job
+        matching the resource capacity
+    """
+
+    startTime = time.time()
+    result = self.__checkResourceRequest( resourceDescription )
+    if not result[ 'OK' ]:
+      return result
+    resourceDict, siteName, pilotReference, pilotInfoReported, policy = result[ 'Value' ]
+
     negativeCond = self.__limiter.getNegativeCondForSite( siteName )
     result = gTaskQueueDB.matchAndGetJob( resourceDict, negativeCond = negativeCond )
 
@@ -517,7 +614,7 @@ class MatcherHandler( RequestHandler ):
     if not resAtt['Value']:
       return S_ERROR( 'No attributes returned for job' )
 
-    if self.__opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True ):
+    if policy[ 'CheckMatchingDelay' ]:
       self.__limiter.updateDelayCounters( siteName, jobID )
 
     # Report pilot-job association
@@ -530,6 +627,90 @@ class MatcherHandler( RequestHandler ):
     resultDict['PilotInfoReportedFlag'] = pilotInfoReported
     return S_OK( resultDict )
 
+  def selectJobs( self, resourceDescription, numJobs ):
+    """ Select up to numJobs of the highest priority jobs matching the resource capacity
+        in a single pass. The Jobs and logging tables are updated for all of them at once
+    """
+
+    startTime = time.time()
+    result = self.__checkResourceRequest( resourceDescription )
+    if not result[ 'OK' ]:
+      return result
+    resourceDict, siteName, pilotReference, pilotInfoReported, policy = result[ 'Value' ]
+
+    numJobs = max( 1, min( numJobs, policy[ 'MaxJobsPerMatch' ] ) )
+
+    negativeCond = self.__limiter.getNegativeCondForSite( siteName )
+    result = gTaskQueueDB.matchAndGetJobs( resourceDict, numJobs, negativeCond = negativeCond )
+    if not result['OK']:
+      return result
+    result = result['Value']
+    if not result['matchFound']:
+      return S_ERROR( 'No match found' )
+
+    jobIDs = [ jobID for jobID, tqID in result['jobs'] ]
+    resAtt = gJobDB.getAttributesForJobList( jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'] )
+    if not resAtt['OK']:
+      return S_ERROR( 'Could not retrieve job attributes' )
+    jobAttrs = resAtt['Value']
+    waitingJobs = []
+    for jobID in jobIDs:
+      if jobID not in jobAttrs:
+        gLogger.error( 'No attributes returned for job', str( jobID ) )
+      elif not jobAttrs[jobID]['Status'] == 'Waiting':
+        gLogger.error( 'Job matched by the TQ is not in Waiting state', str( jobID ) )
+      else:
+        waitingJobs.append( jobID )
+    if not waitingJobs:
+      return S_ERROR( "None of the matched jobs is in Waiting state" )
+
+    attNames = ['Status', 'MinorStatus', 'ApplicationStatus', 'Site']
+    attValues = ['Matched', 'Assigned', 'Unknown', siteName]
+    result = gJobDB.setAttributesForJobList( waitingJobs, attNames, attValues )
+    if not result['OK']:
+      return S_ERROR( 'Failed to set the matched jobs status' )
+    result = gJobLoggingDB.addLoggingRecords( waitingJobs,
+                                              status = 'Matched',
+                                              minor = 'Assigned',
+                                              source = 'Matcher' )
+
+    result = gJobDB.getJDLForJobList( waitingJobs )
+    if not result['OK']:
+      return S_ERROR( 'Failed to get the job JDLs' )
+    jdlDict = result['Value']
+    resOpt = gJobDB.getOptParametersForJobList( waitingJobs )
+    optDict = {}
+    if resOpt['OK']:
+      optDict = resOpt['Value']
+
+    matchTime = time.time() - startTime
+    gLogger.info( "Match time for %d jobs: [%s]" % ( len( waitingJobs ), str( matchTime ) ) )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    checkDelay = policy[ 'CheckMatchingDelay' ]
+    jobList = []
+    for jobID in waitingJobs:
+      resultDict = {}
+      resultDict['JDL'] = jdlDict.get( jobID, '' )
+      resultDict['JobID'] = jobID
+      for key, value in optDict.get( jobID, {} ).items():
+        resultDict[key] = value
+      resultDict['DN'] = jobAttrs[jobID]['OwnerDN']
+      resultDict['Group'] = jobAttrs[jobID]['OwnerGroup']
+      resultDict['PilotInfoReportedFlag'] = pilotInfoReported
+      jobList.append( resultDict )
+
+      if checkDelay:
+        self.__limiter.updateDelayCounters( siteName, jobID )
+      # Report pilot-job association
+      if pilotReference:
+        result = gPilotAgentsDB.setJobForPilot( jobID, pilotReference, updateStatus = False )
+
+    if pilotReference:
+      result = gPilotAgentsDB.setCurrentJobID( pilotReference, waitingJobs[-1] )
+
+    return S_OK( jobList )
+
 ##############################################################################
   types_requestJob = [ [StringType, DictType] ]
   def export_requestJob( self, resourceDescription ):
@@ -543,6 +724,20 @@ class MatcherHandler( RequestHandler ):
       gMonitor.addMark( "matchesOK" )
     return result
 
+##############################################################################
+  types_requestJobs = [ [StringType, DictType], [IntType, LongType] ]
+  def export_requestJobs( self, resourceDescription, numJobs ):
+    """ Serve up to numJobs jobs to the request of an agent in one go. The jobs are the
+        highest priority ones matching the agent's site capacity. Returns a list with one
+        dictionary per job in the same format as the requestJob result
+    """
+
+    result = self.selectJobs( resourceDescription, numJobs )
+    gMonitor.addMark( "matchesDone" )
+    if result[ 'OK' ]:
+      gMonitor.addMark( "matchesOK", len( result[ 'Value' ] ) )
+    return result
+
 ##############################################################################
   types_getActiveTaskQueues = []
   def export_getActiveTaskQueues( self ):
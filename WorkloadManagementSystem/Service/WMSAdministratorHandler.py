@@ -203,6 +203,15 @@ class WMSAdministratorHandler(RequestHandler):
                                        ownerDN, ownerGroup,
                                        broker, gridType, requirements,pilotStampDict)
 
+##########################################################################################
+  types_addPilotTQReferences = [ DictType, StringTypes, StringTypes ]
+  def export_addPilotTQReferences( self, tqPilotDict, ownerDN, ownerGroup, broker='Unknown',
+                                   gridType='DIRAC', requirements='Unknown',pilotStampDict={}):
+    """ Add new pilot job references for several task queues { taskQueueID : [ pilotRef ] } """
+    return pilotDB.addPilotTQReferences(tqPilotDict,
+                                        ownerDN, ownerGroup,
+                                        broker, gridType, requirements,pilotStampDict)
+
 
   ##############################################################################
   types_getPilotOutput = [StringTypes]
@@ -616,6 +625,14 @@ class WMSAdministratorHandler(RequestHandler):
                                     statusReason=reason,gridSite=gridSite,queue=queue)
     return result
 
+  ##########################################################################################
+  types_setPilotsStatus = [DictType]
+  def export_setPilotsStatus(self,pilotStatusDict):
+    """ Set the status of several pilot agents { pilotRef : ( status, destination, reason ) }
+    """
+
+    return pilotDB.setPilotsStatus(pilotStatusDict)
+
   ##########################################################################################
   types_countPilots = [ DictType ]
   def export_countPilots(self,condDict, older=None, newer=None, timeStamp='SubmissionTime'):
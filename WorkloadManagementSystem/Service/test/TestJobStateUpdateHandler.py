@@ -0,0 +1,109 @@
+""" Unit tests of the heart beat buffering and of the job command index of the
+    JobStateUpdateHandler, the JobDB is mocked
+"""
+
+import unittest
+
+from mock import Mock
+
+import DIRAC.WorkloadManagementSystem.Service.JobStateUpdateHandler as moduleTested
+from DIRAC.WorkloadManagementSystem.Service.JobStateUpdateHandler import HeartBeatBuffer, JobCommandIndex, \
+                                                                          JobStateUpdateHandler
+from DIRAC import S_OK, S_ERROR
+
+class JobStateUpdateTestCase( unittest.TestCase ):
+  """ Base class for the JobStateUpdateHandler test cases
+  """
+
+  def setUp( self ):
+    self.jobDB = Mock()
+    self.jobDB.setHeartBeatDataBulk.return_value = S_OK()
+    self.jobDB.getJobsWithCommand.return_value = S_OK( [ 2 ] )
+    self.jobDB.getJobCommand.return_value = S_OK( { 'Kill' : '' } )
+    self.jobDB.setJobCommandStatus.return_value = S_OK()
+    self.moduleGlobals = ( moduleTested.jobDB, moduleTested.heartBeatBuffer, moduleTested.jobCommandIndex )
+    moduleTested.jobDB = self.jobDB
+
+  def tearDown( self ):
+    moduleTested.jobDB, moduleTested.heartBeatBuffer, moduleTested.jobCommandIndex = self.moduleGlobals
+
+class HeartBeatBufferCase( JobStateUpdateTestCase ):
+
+  def test_coalesce( self ):
+    buffer = HeartBeatBuffer( self.jobDB, 5, 500 )
+    buffer.add( 1, { 'CPU' : 1 }, { 'LoadAverage' : 1 } )
+    buffer.add( 1, { 'Memory' : 2 }, { 'LoadAverage' : 2 } )
+    buffer.add( 2, {}, { 'LoadAverage' : 3 } )
+    buffer.flush()
+    self.assertEqual( self.jobDB.setHeartBeatDataBulk.call_count, 1 )
+    heartBeatDict = self.jobDB.setHeartBeatDataBulk.call_args[0][0]
+    self.assertEqual( sorted( heartBeatDict ), [ 1, 2 ] )
+    self.assertEqual( heartBeatDict[1][0], { 'CPU' : 1, 'Memory' : 2 } )
+    self.assertEqual( heartBeatDict[1][1], { 'LoadAverage' : 2 } )
+    # Nothing left to write
+    buffer.flush()
+    self.assertEqual( self.jobDB.setHeartBeatDataBulk.call_count, 1 )
+
+  def test_flushSize( self ):
+    buffer = HeartBeatBuffer( self.jobDB, 5, 2 )
+    for jobID in range( 5 ):
+      buffer.add( jobID, {}, {} )
+    buffer.flush()
+    self.assertEqual( self.jobDB.setHeartBeatDataBulk.call_count, 3 )
+
+class JobCommandIndexCase( JobStateUpdateTestCase ):
+
+  def test_index( self ):
+    index = JobCommandIndex( self.jobDB, 60 )
+    self.assertTrue( index.hasCommands( 2 ) )
+    self.assertFalse( index.hasCommands( 1 ) )
+    index.discard( 2 )
+    self.assertFalse( index.hasCommands( 2 ) )
+    # Loaded only once per refresh period
+    self.assertEqual( self.jobDB.getJobsWithCommand.call_count, 1 )
+
+  def test_failedLoad( self ):
+    self.jobDB.getJobsWithCommand.return_value = S_ERROR( 'No DB' )
+    index = JobCommandIndex( self.jobDB, 60 )
+    self.assertTrue( index.hasCommands( 1 ) )
+
+class SendHeartBeatsCase( JobStateUpdateTestCase ):
+
+  def setUp( self ):
+    JobStateUpdateTestCase.setUp( self )
+    self.handler = JobStateUpdateHandler.__new__( JobStateUpdateHandler )
+
+  def test_unbuffered( self ):
+    moduleTested.heartBeatBuffer = False
+    moduleTested.jobCommandIndex = JobCommandIndex( self.jobDB, 60 )
+    result = self.handler.export_sendHeartBeats( { '1' : ( { 'LoadAverage' : 1 }, { 'CPU' : 2 } ),
+                                                   2 : ( {}, {} ) } )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], { 1 : {}, 2 : { 'Kill' : '' } } )
+    heartBeatDict = self.jobDB.setHeartBeatDataBulk.call_args[0][0]
+    self.assertEqual( heartBeatDict[1][:2], ( { 'CPU' : 2 }, { 'LoadAverage' : 1 } ) )
+    # Only the job in the index is queried and its command flagged as sent
+    self.assertEqual( self.jobDB.getJobCommand.call_count, 1 )
+    self.jobDB.setJobCommandStatus.assert_called_with( 2, 'Kill', 'Sent' )
+
+  def test_buffered( self ):
+    moduleTested.heartBeatBuffer = HeartBeatBuffer( self.jobDB, 5, 500 )
+    moduleTested.jobCommandIndex = False
+    result = self.handler.export_sendHeartBeats( { 1 : ( {}, {} ) } )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], { 1 : { 'Kill' : '' } } )
+    self.assertFalse( self.jobDB.setHeartBeatDataBulk.called )
+    moduleTested.heartBeatBuffer.flush()
+    self.assertTrue( self.jobDB.setHeartBeatDataBulk.called )
+
+  def test_badData( self ):
+    moduleTested.heartBeatBuffer = False
+    self.assertFalse( self.handler.export_sendHeartBeats( { 1 : ( 'load', {} ) } )['OK'] )
+    self.assertFalse( self.handler.export_sendHeartBeats( { 'x' : ( {}, {} ) } )['OK'] )
+    self.assertFalse( self.jobDB.setHeartBeatDataBulk.called )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( HeartBeatBufferCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( JobCommandIndexCase ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( SendHeartBeatsCase ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
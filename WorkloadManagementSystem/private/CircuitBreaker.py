@@ -0,0 +1,73 @@
+########################################################################
+# $Id$
+########################################################################
+""" Circuit breaker for the calls to external resources, e.g. the computing elements.
+    After a number of consecutive failures the circuit opens and the calls to the
+    resource are not allowed for some time. After that time a single trial call is
+    allowed per period until one succeeds and closes the circuit again
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+
+class CircuitBreaker:
+
+  def __init__( self, maxFailures = 3, openTime = 1800 ):
+    """ Constructor, takes the number of consecutive failures opening the circuit
+        and the time in seconds it stays open
+    """
+    self.maxFailures = maxFailures
+    self.openTime = openTime
+    self.__lock = threading.Lock()
+    #key -> ( consecutive failures, time until which the circuit is open )
+    self.__failures = {}
+
+  def allowRequest( self, key ):
+    """ Check if a call to the resource can be done
+    """
+    self.__lock.acquire()
+    try:
+      if key not in self.__failures:
+        return True
+      failures, openUntil = self.__failures[ key ]
+      if failures < self.maxFailures:
+        return True
+      now = time.time()
+      if now < openUntil:
+        return False
+      # Trial call, the next one is only allowed after another period
+      self.__failures[ key ] = ( failures, now + self.openTime )
+      return True
+    finally:
+      self.__lock.release()
+
+  def recordSuccess( self, key ):
+    """ A call to the resource succeeded, close the circuit
+    """
+    self.__lock.acquire()
+    try:
+      self.__failures.pop( key, None )
+    finally:
+      self.__lock.release()
+
+  def recordFailure( self, key ):
+    """ A call to the resource failed. Returns True if the circuit is open
+    """
+    self.__lock.acquire()
+    try:
+      failures = self.__failures.get( key, ( 0, 0 ) )[0] + 1
+      self.__failures[ key ] = ( failures, time.time() + self.openTime )
+      return failures >= self.maxFailures
+    finally:
+      self.__lock.release()
+
+  def getOpenCircuits( self ):
+    """ Keys of the resources with an open circuit
+    """
+    self.__lock.acquire()
+    try:
+      return [ key for key, ( failures, _openUntil ) in self.__failures.items() if failures >= self.maxFailures ]
+    finally:
+      self.__lock.release()
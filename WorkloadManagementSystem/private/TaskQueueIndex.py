@@ -0,0 +1,238 @@
+########################################################################
+# $Id$
+########################################################################
+""" In-memory index of the task queue definitions. It allows the Matcher to find the
+    task queues matching a resource with set lookups instead of going to the TaskQueueDB.
+    The matching rules are the same as the ones applied by the TaskQueueDB match SQL
+"""
+
+__RCSID__ = "$Id$"
+
+import types
+import random
+import threading
+
+from DIRAC.Core.Security import Properties, CS
+
+#Priority used for the TQs having a null priority when ranking them
+MIN_PRIORITY = 0.0001
+
+class TaskQueueIndex:
+
+  def __init__( self, multiValueDefFields, multiValueMatchFields, bannedJobMatchFields, strictRequireMatchFields ):
+    """ Constructor. The field definitions are the ones of the TaskQueueDB
+    """
+    self.__multiValueDefFields = multiValueDefFields
+    self.__multiValueMatchFields = multiValueMatchFields
+    self.__bannedJobMatchFields = bannedJobMatchFields
+    self.__strictRequireMatchFields = strictRequireMatchFields
+    self.__lock = threading.Lock()
+    #tqId -> { 'OwnerDN', 'OwnerGroup', 'Setup', 'CPUTime', 'Priority', <multi value field> : frozenset }
+    self.__tqDefs = {}
+    #field -> value -> set of tqIds
+    self.__valueIndex = {}
+    for field in ( 'OwnerDN', 'OwnerGroup', 'Setup' ) + tuple( self.__multiValueDefFields ):
+      self.__valueIndex[ field ] = {}
+    #( ownerDN, ownerGroup ) -> set of tqIds
+    self.__ownerIndex = {}
+    #multi value field -> set of tqIds without any value defined for it
+    self.__noValues = dict( [ ( field, set() ) for field in self.__multiValueDefFields ] )
+
+  def __toList( self, value ):
+    if type( value ) not in ( types.ListType, types.TupleType ):
+      return [ value ]
+    return value
+
+  def __addToIndex( self, index, key, tqId ):
+    if key not in index:
+      index[ key ] = set()
+    index[ key ].add( tqId )
+
+  def __removeFromIndex( self, index, key, tqId ):
+    try:
+      tqIds = index[ key ]
+    except KeyError:
+      return
+    tqIds.discard( tqId )
+    if not tqIds:
+      del index[ key ]
+
+  def __unionOf( self, index, values ):
+    tqIds = set()
+    for value in values:
+      tqIds.update( index.get( str( value ).strip(), () ) )
+    return tqIds
+
+  def __intersectionOf( self, index, values ):
+    tqIds = None
+    for value in values:
+      valueIds = index.get( str( value ).strip(), set() )
+      if tqIds is None:
+        tqIds = set( valueIds )
+      else:
+        tqIds &= valueIds
+    if tqIds is None:
+      return set()
+    return tqIds
+
+  def getTaskQueueIds( self ):
+    """ Get the ids of the indexed task queues
+    """
+    self.__lock.acquire()
+    try:
+      return self.__tqDefs.keys()
+    finally:
+      self.__lock.release()
+
+  def addTaskQueue( self, tqId, tqDefDict, priority ):
+    """ Add ( or replace ) a task queue definition in the index
+    """
+    tqDef = { 'OwnerDN' : tqDefDict[ 'OwnerDN' ],
+              'OwnerGroup' : tqDefDict[ 'OwnerGroup' ],
+              'Setup' : tqDefDict[ 'Setup' ],
+              'CPUTime' : tqDefDict[ 'CPUTime' ],
+              'Priority' : priority }
+    for field in self.__multiValueDefFields:
+      tqDef[ field ] = frozenset( [ str( value ).strip() for value in tqDefDict.get( field, [] ) if str( value ).strip() ] )
+    self.__lock.acquire()
+    try:
+      self.__removeTaskQueue( tqId )
+      self.__tqDefs[ tqId ] = tqDef
+      for field in ( 'OwnerDN', 'OwnerGroup', 'Setup' ):
+        self.__addToIndex( self.__valueIndex[ field ], tqDef[ field ], tqId )
+      self.__addToIndex( self.__ownerIndex, ( tqDef[ 'OwnerDN' ], tqDef[ 'OwnerGroup' ] ), tqId )
+      for field in self.__multiValueDefFields:
+        if not tqDef[ field ]:
+          self.__noValues[ field ].add( tqId )
+        for value in tqDef[ field ]:
+          self.__addToIndex( self.__valueIndex[ field ], value, tqId )
+    finally:
+      self.__lock.release()
+
+  def removeTaskQueue( self, tqId ):
+    """ Remove a task queue from the index
+    """
+    self.__lock.acquire()
+    try:
+      return self.__removeTaskQueue( tqId )
+    finally:
+      self.__lock.release()
+
+  def __removeTaskQueue( self, tqId ):
+    try:
+      tqDef = self.__tqDefs.pop( tqId )
+    except KeyError:
+      return False
+    for field in ( 'OwnerDN', 'OwnerGroup', 'Setup' ):
+      self.__removeFromIndex( self.__valueIndex[ field ], tqDef[ field ], tqId )
+    self.__removeFromIndex( self.__ownerIndex, ( tqDef[ 'OwnerDN' ], tqDef[ 'OwnerGroup' ] ), tqId )
+    for field in self.__multiValueDefFields:
+      self.__noValues[ field ].discard( tqId )
+      for value in tqDef[ field ]:
+        self.__removeFromIndex( self.__valueIndex[ field ], value, tqId )
+    return True
+
+  def setPriority( self, tqId, priority ):
+    """ Update the priority of an indexed task queue
+    """
+    try:
+      self.__tqDefs[ tqId ][ 'Priority' ] = priority
+    except KeyError:
+      pass
+
+  def match( self, tqMatchDict, numQueuesToGet = 1, negativeCond = {} ):
+    """ Get the task queues matching the resource description. The TQs are randomly
+        ordered weighted by their priority as done by the TaskQueueDB
+        Returns a list of ( tqId, ownerDN, ownerGroup )
+    """
+    # Confine the LHCbPlatform legacy option here as done by the TaskQueueDB
+    if 'Platform' not in tqMatchDict:
+      for legacyField in ( 'LHCbPlatform', 'SystemConfig' ):
+        if legacyField in tqMatchDict:
+          tqMatchDict = dict( tqMatchDict )
+          tqMatchDict[ 'Platform' ] = tqMatchDict[ legacyField ]
+          break
+    self.__lock.acquire()
+    try:
+      candidates = self.__matchCandidates( tqMatchDict )
+      if negativeCond:
+        candidates = [ tqId for tqId in candidates if self.__passesNegativeCond( self.__tqDefs[ tqId ], negativeCond ) ]
+      ranked = []
+      for tqId in candidates:
+        tqDef = self.__tqDefs[ tqId ]
+        ranked.append( ( random.random() / max( tqDef[ 'Priority' ], MIN_PRIORITY ), tqId ) )
+      ranked.sort()
+      if numQueuesToGet:
+        ranked = ranked[ :numQueuesToGet ]
+      return [ ( tqId, self.__tqDefs[ tqId ][ 'OwnerDN' ], self.__tqDefs[ tqId ][ 'OwnerGroup' ] ) for rank, tqId in ranked ]
+    finally:
+      self.__lock.release()
+
+  def __matchCandidates( self, tqMatchDict ):
+    candidates = set( self.__tqDefs )
+    #If OwnerDN and OwnerGroup are defined only use those combinations that make sense
+    if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
+      dns = self.__toList( tqMatchDict[ 'OwnerDN' ] )
+      ownerIds = set()
+      for group in self.__toList( tqMatchDict[ 'OwnerGroup' ] ):
+        if Properties.JOB_SHARING in CS.getPropertiesForGroup( group ):
+          ownerIds.update( self.__valueIndex[ 'OwnerGroup' ].get( group, () ) )
+        else:
+          for dn in dns:
+            ownerIds.update( self.__ownerIndex.get( ( dn, group ), () ) )
+      candidates &= ownerIds
+    else:
+      for field in ( 'OwnerGroup', 'OwnerDN' ):
+        if field in tqMatchDict:
+          candidates &= self.__unionOf( self.__valueIndex[ field ], self.__toList( tqMatchDict[ field ] ) )
+    if 'Setup' in tqMatchDict:
+      candidates &= self.__unionOf( self.__valueIndex[ 'Setup' ], self.__toList( tqMatchDict[ 'Setup' ] ) )
+    #Match multi value fields. The TQ fields are the plural of the match ones
+    for field in self.__multiValueMatchFields:
+      tqField = "%ss" % field
+      if field in tqMatchDict and tqMatchDict[ field ]:
+        values = self.__toList( tqMatchDict[ field ] )
+        matchIds = self.__unionOf( self.__valueIndex[ tqField ], values )
+        # Jobs for masked sites can be matched if they specified a GridCE, so in
+        # that case the GridCE has to match explicitly
+        if field != 'GridCE' or 'Site' in tqMatchDict:
+          matchIds |= self.__noValues[ tqField ]
+        candidates &= matchIds
+        #In case of Site, check it's not in job banned sites
+        if field in self.__bannedJobMatchFields:
+          candidates -= self.__intersectionOf( self.__valueIndex[ "Banned%s" % tqField ], values )
+      #Resource banning
+      bannedField = "Banned%s" % field
+      if bannedField in tqMatchDict and tqMatchDict[ bannedField ]:
+        candidates -= self.__intersectionOf( self.__valueIndex[ tqField ], self.__toList( tqMatchDict[ bannedField ] ) )
+    #For certain fields, the require is strict. If it is not in the tqMatchDict, the job cannot require it
+    for field in self.__strictRequireMatchFields:
+      if field not in tqMatchDict:
+        candidates &= self.__noValues[ "%ss" % field ]
+    if 'CPUTime' in tqMatchDict:
+      cpuTime = max( self.__toList( tqMatchDict[ 'CPUTime' ] ) )
+      candidates = [ tqId for tqId in candidates if self.__tqDefs[ tqId ][ 'CPUTime' ] <= cpuTime ]
+    return candidates
+
+  def __passesNegativeCond( self, tqDef, negativeCond ):
+    """ A list of conditions is satisfied if any of them is. A condition dict is
+        satisfied if the TQ has none of the values it lists
+    """
+    if type( negativeCond ) in ( types.ListType, types.TupleType ):
+      if not negativeCond:
+        return True
+      for condDict in negativeCond:
+        if self.__passesNegativeCond( tqDef, condDict ):
+          return True
+      return False
+    for field in negativeCond:
+      if field in self.__multiValueMatchFields:
+        tqValues = tqDef[ "%ss" % field ]
+        for value in self.__toList( negativeCond[ field ] ):
+          if str( value ).strip() in tqValues:
+            return False
+      elif field in ( 'OwnerDN', 'OwnerGroup', 'Setup', 'CPUTime' ):
+        for value in negativeCond[ field ]:
+          if str( value ) == str( tqDef[ field ] ):
+            return False
+    return True
@@ -0,0 +1,49 @@
+########################################################################
+# $HeadURL $
+# File: CircuitBreakerTests.py
+########################################################################
+""" :mod: CircuitBreakerTests
+    =========================
+
+    .. module: CircuitBreakerTests
+    :synopsis: unittests for the circuit breaker
+"""
+__RCSID__ = "$Id$"
+
+import time
+import unittest
+
+from DIRAC.WorkloadManagementSystem.private.CircuitBreaker import CircuitBreaker
+
+class CircuitBreakerTests( unittest.TestCase ):
+  """ CircuitBreaker test case
+  """
+
+  def setUp( self ):
+    self.breaker = CircuitBreaker( maxFailures = 2, openTime = 0.2 )
+
+  def testOpenAndClose( self ):
+    """ consecutive failures open the circuit, a success closes it """
+    self.assertFalse( self.breaker.recordFailure( 'ce1' ) )
+    self.assertTrue( self.breaker.allowRequest( 'ce1' ) )
+    self.assertTrue( self.breaker.recordFailure( 'ce1' ) )
+    self.assertFalse( self.breaker.allowRequest( 'ce1' ) )
+    self.assertTrue( self.breaker.allowRequest( 'ce2' ) )
+    self.assertEqual( self.breaker.getOpenCircuits(), [ 'ce1' ] )
+    self.breaker.recordSuccess( 'ce1' )
+    self.assertTrue( self.breaker.allowRequest( 'ce1' ) )
+    self.assertEqual( self.breaker.getOpenCircuits(), [] )
+
+  def testTrialCall( self ):
+    """ a single trial call is allowed once the open time is over """
+    self.breaker.recordFailure( 'ce1' )
+    self.breaker.recordFailure( 'ce1' )
+    time.sleep( 0.3 )
+    self.assertTrue( self.breaker.allowRequest( 'ce1' ) )
+    self.assertFalse( self.breaker.allowRequest( 'ce1' ) )
+    self.assertTrue( self.breaker.recordFailure( 'ce1' ) )
+    self.assertFalse( self.breaker.allowRequest( 'ce1' ) )
+
+if __name__ == "__main__":
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( CircuitBreakerTests )
+  unittest.TextTestRunner( verbosity = 3 ).run( suite )
@@ -0,0 +1,81 @@
+########################################################################
+# $HeadURL $
+# File: TaskQueueIndexTests.py
+########################################################################
+""" :mod: TaskQueueIndexTests
+    =========================
+
+    .. module: TaskQueueIndexTests
+    :synopsis: unittests for the in-memory task queue index
+"""
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+MULTI_VALUE_DEF_FIELDS = ( 'Sites', 'GridCEs', 'GridMiddlewares', 'BannedSites',
+                           'Platforms', 'PilotTypes', 'SubmitPools', 'JobTypes' )
+MULTI_VALUE_MATCH_FIELDS = ( 'GridCE', 'Site', 'GridMiddleware', 'Platform',
+                             'PilotType', 'SubmitPool', 'JobType' )
+
+class TaskQueueIndexTests( unittest.TestCase ):
+  """ TaskQueueIndex test case
+  """
+
+  def setUp( self ):
+    self.index = TaskQueueIndex( MULTI_VALUE_DEF_FIELDS, MULTI_VALUE_MATCH_FIELDS, ( 'Site', ),
+                                 ( 'SubmitPool', 'Platform', 'PilotType' ) )
+    self.addTQ( 1 )
+    self.addTQ( 2, Sites = [ 'LCG.CERN.ch' ] )
+    self.addTQ( 3, BannedSites = [ 'LCG.CERN.ch' ] )
+    self.addTQ( 4, Platforms = [ 'x86_64-slc6' ] )
+    self.addTQ( 5, CPUTime = 500000 )
+    self.addTQ( 6, Setup = 'Other' )
+    self.addTQ( 7, OwnerDN = '/DN=other', JobTypes = [ 'MCSimulation' ] )
+
+  def addTQ( self, tqId, **kwargs ):
+    tqDef = { 'OwnerDN' : '/DN=user', 'OwnerGroup' : 'user', 'Setup' : 'Production', 'CPUTime' : 86400 }
+    tqDef.update( kwargs )
+    self.index.addTaskQueue( tqId, tqDef, 1.0 )
+
+  def match( self, negativeCond = {}, **kwargs ):
+    matchDict = { 'Setup' : 'Production', 'CPUTime' : 100000 }
+    matchDict.update( kwargs )
+    return sorted( [ tq[0] for tq in self.index.match( matchDict, numQueuesToGet = 0, negativeCond = negativeCond ) ] )
+
+  def testSites( self ):
+    """ site requirements and banned sites """
+    self.assertEqual( self.match( Site = 'LCG.CERN.ch' ), [ 1, 2, 7 ] )
+    self.assertEqual( self.match( Site = 'LCG.PIC.es' ), [ 1, 3, 7 ] )
+    self.assertEqual( self.match( BannedSite = [ 'LCG.CERN.ch' ] ), [ 1, 3, 7 ] )
+
+  def testStrictFields( self ):
+    """ platforms have to be explicitly provided by the resource """
+    self.assertEqual( self.match( Platform = 'x86_64-slc6' ), [ 1, 2, 3, 4, 7 ] )
+    self.assertEqual( self.match( Platform = 'i686-slc5' ), [ 1, 2, 3, 7 ] )
+    self.assertEqual( self.match( LHCbPlatform = 'x86_64-slc6' ), [ 1, 2, 3, 4, 7 ] )
+
+  def testSingleValueFields( self ):
+    """ setup, owner and CPU time """
+    self.assertEqual( self.match( CPUTime = 1000000 ), [ 1, 2, 3, 5, 7 ] )
+    self.assertEqual( self.match( Setup = 'Other' ), [ 6 ] )
+    self.assertEqual( self.match( OwnerDN = '/DN=other', OwnerGroup = 'user' ), [ 7 ] )
+    self.assertEqual( self.match( OwnerGroup = [ 'user', 'prod' ] ), [ 1, 2, 3, 7 ] )
+
+  def testNegativeCond( self ):
+    """ negative conditions from the site limits """
+    self.assertEqual( self.match( negativeCond = { 'JobType' : [ 'MCSimulation' ] } ), [ 1, 2, 3 ] )
+    self.assertEqual( self.match( negativeCond = [ { 'OwnerDN' : [ '/DN=user' ] } ] ), [ 7 ] )
+
+  def testRemoveAndPriority( self ):
+    """ removal and priority ordering """
+    self.assertTrue( self.index.removeTaskQueue( 1 ) )
+    self.assertFalse( self.index.removeTaskQueue( 1 ) )
+    self.assertEqual( self.match(), [ 2, 3, 7 ] )
+    self.index.setPriority( 3, 10 ** 9 )
+    self.assertEqual( self.index.match( { 'Setup' : 'Production', 'CPUTime' : 100000 } )[0][0], 3 )
+
+if __name__ == "__main__":
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueIndexTests )
+  unittest.TextTestRunner( verbosity = 3 ).run( suite )